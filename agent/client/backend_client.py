@@ -1,9 +1,18 @@
 import logging
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import requests
 
+from agent.client.heartbeat import HeartbeatTracker
+from agent.client.resilience import (
+    CircuitBreaker,
+    RetryBudget,
+    decorrelated_jitter,
+    is_retryable_status,
+    parse_retry_after,
+)
+from agent.client.transport import HttpTransport, create_transport
 from agent.config import Config
 
 logger = logging.getLogger("iot_agent")
@@ -12,10 +21,51 @@ logger = logging.getLogger("iot_agent")
 class BackendClient:
     """Client for communicating with the backend API"""
 
-    def __init__(self):
-        self.base_url = Config.BACKEND_URL
-        self.timeout = Config.BACKEND_TIMEOUT
-        self.session = requests.Session()
+    def __init__(self, transport: Optional[HttpTransport] = None, config=None):
+        self.config = config or Config
+        self.base_url = self.config.BACKEND_URL
+        # A shared transport belongs to the caller (AgentHost), not this client
+        self._owns_transport = transport is None
+        self.transport = transport or create_transport(self.config)
+        self.timeout = self.transport.timeout
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.config.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=self.config.BREAKER_RESET_TIMEOUT,
+        )
+        self.retry_budget = RetryBudget(
+            capacity=self.config.RETRY_BUDGET_CAPACITY,
+            ratio=self.config.RETRY_BUDGET_RATIO,
+        )
+        self._desired_state: Optional[Dict] = None
+        self._desired_etag: Optional[str] = None
+        self.heartbeat = HeartbeatTracker(
+            interval=self.config.HEARTBEAT_INTERVAL,
+            min_interval=self.config.HEARTBEAT_MIN_INTERVAL,
+            max_interval=self.config.HEARTBEAT_MAX_INTERVAL,
+            delta_enabled=self.config.HEARTBEAT_DELTA,
+        )
+
+    def close(self):
+        """Close pooled backend connections"""
+        self.transport.close()
+
+    def reconnect(self):
+        """Switch to a fresh connection pool, e.g. when a request is stuck on
+        a dead connection; caches and the heartbeat state are kept. A shared
+        transport is kept: its owner manages its pool for every agent."""
+        if not self._owns_transport:
+            return
+        old = self.transport
+        self.transport = create_transport(self.config)
+        self.timeout = self.transport.timeout
+        old.close()
+
+    def max_request_time(self) -> float:
+        """Longest a request can take: every attempt timing out, with the
+        longest backoff between them"""
+        connect, read = self.transport.timeout
+        retries = self.config.MAX_RETRIES
+        return (retries + 1) * (connect + read) + retries * self.config.RETRY_MAX_DELAY
 
     def _make_request(
         self,
@@ -24,48 +74,125 @@ class BackendClient:
         data: Optional[Dict] = None,
         retries: Optional[int] = None,
     ) -> Optional[Dict]:
-        """Make HTTP request with retry logic"""
+        """Make HTTP request with retry logic and return the decoded JSON body"""
+        response = self._send_request(method, endpoint, data, retries)
+        if response is None:
+            return None
+        return self._decode_response(response)
+
+    def _send_request(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict] = None,
+        retries: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """Send HTTP request with retry logic and return the successful response.
+
+        Only connection errors and retryable statuses (see
+        ``is_retryable_status``) are retried, with decorrelated-jitter
+        backoff, and only while the retry budget has tokens. An open circuit
+        fails the call immediately without touching the network.
+        """
         if retries is None:
-            retries = Config.MAX_RETRIES
+            retries = self.config.MAX_RETRIES
+
+        if method.upper() not in ("GET", "POST"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
+        if not self.breaker.allow_request():
+            logger.warning(f"Backend circuit open, skipping {method} {endpoint}")
+            return None
 
         url = f"{self.base_url}{endpoint}"
+        self.retry_budget.record_request()
+        delay = self.config.RETRY_DELAY
 
         for attempt in range(retries + 1):
+            retry_after = None
             try:
-                if method.upper() == "GET":
-                    response = self.session.get(url, timeout=self.timeout)
-                elif method.upper() == "POST":
-                    response = self.session.post(url, json=data, timeout=self.timeout)
-                else:
-                    raise ValueError(f"Unsupported HTTP method: {method}")
+                response = self.transport.request(
+                    method, url, data=data, headers=headers
+                )
+                if response.status_code < 400:
+                    self.breaker.record_success()
+                    return response
+
+                if not is_retryable_status(response.status_code):
+                    # The backend answered, so it is healthy; the request is not
+                    self.breaker.record_success()
+                    logger.error(
+                        f"Request rejected with {response.status_code}: {method} {url}"
+                    )
+                    return None
 
-                response.raise_for_status()
-                return response.json() if response.content else None
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                error = f"{response.status_code} Error for url: {url}"
 
             except requests.exceptions.RequestException as e:
-                logger.warning(
-                    f"Request failed (attempt {attempt + 1}/{retries + 1}): {e}"
-                )
-                if attempt < retries:
-                    time.sleep(Config.RETRY_DELAY)
-                else:
-                    logger.error(f"Request failed after {retries + 1} attempts")
-                    return None
+                error = str(e)
+            except Exception:
+                # Settle the attempt so a half-open probe is not left in flight
+                self.breaker.record_failure()
+                raise
+
+            self.breaker.record_failure()
+            logger.warning(
+                f"Request failed (attempt {attempt + 1}/{retries + 1}): {error}"
+            )
+
+            if attempt >= retries:
+                logger.error(f"Request failed after {retries + 1} attempts")
+                return None
+
+            if retry_after is not None and retry_after > self.config.RETRY_MAX_DELAY:
+                # Don't park the calling thread; let the circuit reject calls instead
+                self.breaker.open_for(retry_after)
+                logger.error(f"Backend asked to retry after {retry_after:.0f}s")
+                return None
+
+            if not self.retry_budget.try_acquire():
+                logger.error("Retry budget exhausted, giving up")
+                return None
+
+            delay = decorrelated_jitter(
+                delay, self.config.RETRY_DELAY, self.config.RETRY_MAX_DELAY
+            )
+            time.sleep(max(delay, retry_after or 0))
+
+            if not self.breaker.allow_request():
+                logger.error("Backend circuit opened, giving up")
+                return None
+
+    def _decode_response(self, response) -> Optional[Dict]:
+        """Decode a JSON response body, tolerating empty or non-JSON bodies"""
+        if not response.content:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            logger.warning(f"Backend returned a non-JSON body ({response.status_code})")
+            return None
 
     def send_heartbeat(
-        self, version: Optional[str] = None, status: str = "online"
+        self,
+        version: Optional[str] = None,
+        status: str = "online",
+        extra: Optional[Dict] = None,
     ) -> bool:
-        """Send heartbeat to backend"""
-        data = {
-            "name": Config.DEVICE_NAME,
-            "version": version or Config.DOCKER_IMAGE,
-            "status": status,
-        }
+        """Send heartbeat to backend, carrying only state changed since the last ack"""
+        state = {"version": version or self.config.DOCKER_IMAGE, "status": status}
+        if extra:
+            state.update(extra)
+        data = self.heartbeat.build_payload(self.config.DEVICE_NAME, state)
         result = self._make_request("POST", "/device/heartbeat", data)
         if result:
+            self.heartbeat.on_reply(result)
             logger.info("Heartbeat sent successfully")
             return True
         else:
+            self.heartbeat.on_failure()
             logger.error("Failed to send heartbeat")
             return False
 
@@ -74,7 +201,7 @@ class BackendClient:
     ) -> bool:
         """Send log message to backend"""
         data = {
-            "device_id": Config.DEVICE_ID,
+            "device_id": self.config.DEVICE_ID,
             "message": message,
             "log_level": level,
             "type": log_type,
@@ -89,8 +216,35 @@ class BackendClient:
 
     def get_device_status(self) -> Optional[Dict]:
         """Get device status from backend"""
-        return self._make_request("GET", f"/device/{Config.DEVICE_ID}/status")
+        return self._make_request("GET", f"/device/{self.config.DEVICE_ID}/status")
 
     def check_for_updates(self) -> Optional[Dict]:
         """Check for available updates"""
-        return self._make_request("GET", f"/device/{Config.DEVICE_ID}/updates")
+        return self._make_request("GET", f"/device/{self.config.DEVICE_ID}/updates")
+
+    def get_desired_state(self) -> Optional[Dict]:
+        """Get this device's desired state, revalidating the cached copy by ETag.
+
+        Returns None if the backend could not be reached.
+        """
+        headers = {}
+        if self._desired_etag:
+            headers["If-None-Match"] = self._desired_etag
+        response = self._send_request(
+            "GET", f"/device/{self.config.DEVICE_ID}/updates", headers=headers
+        )
+        if response is None:
+            return None
+        if response.status_code == 304 and self._desired_state is not None:
+            return self._desired_state
+        self._desired_state = self._decode_response(response) or {}
+        self._desired_etag = response.headers.get("ETag")
+        return self._desired_state
+
+    def get_code_manifest(self) -> Optional[Dict]:
+        """Get the manifest of the current agent code release"""
+        return self._make_request("GET", "/agent/code/manifest")
+
+    def get_code_chunks(self, hashes: List[str]) -> Optional[Dict]:
+        """Get code chunks by hash, base64 encoded under ``chunks``"""
+        return self._make_request("POST", "/agent/code/chunks", {"hashes": hashes})
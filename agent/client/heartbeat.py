@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("iot_agent")
+
+# Payload keys that describe the heartbeat itself rather than device state
+PROTOCOL_KEYS = frozenset(
+    {"name", "state_hash", "base_hash", "removed", "acked_commands"}
+)
+
+# How many delivered command ids to remember for de-duplication
+SEEN_COMMANDS_LIMIT = 256
+
+
+def state_hash(state: Dict[str, Any]) -> str:
+    """Compact, order-independent hash of a heartbeat state"""
+    canonical = json.dumps(state, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class HeartbeatTracker:
+    """Builds delta heartbeats and tracks the cadence requested by the backend.
+
+    The first heartbeat, and any heartbeat after a resync, carries the full
+    state. Once the backend acknowledges a state by echoing its
+    ``state_hash``, later heartbeats only carry the keys that changed since
+    that ack, plus the new hash and the ``base_hash`` the delta applies to.
+    Backends that never echo the hash keep receiving full heartbeats.
+
+    A reply may also set ``heartbeat_interval`` (seconds), which is clamped
+    to ``[min_interval, max_interval]`` and exposed as ``interval``.
+
+    Replies double as a control channel: ``commands`` are queued for the
+    agent (each id is delivered once and acknowledged in the next
+    heartbeat's ``acked_commands``) and ``desired_state`` entries are merged
+    into ``desired_state``, with the changed keys queued as a diff. The
+    latest runtime ``config`` update is kept for the agent to apply.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        min_interval: float,
+        max_interval: float,
+        delta_enabled: bool = True,
+    ):
+        self.default_interval = interval
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.delta_enabled = delta_enabled
+        self._acked_state: Optional[Dict[str, Any]] = None
+        self._acked_hash: Optional[str] = None
+        self._pending: Optional[Dict[str, Any]] = None
+        self.desired_state: Dict[str, Any] = {}
+        self._desired_diff: Dict[str, Any] = {}
+        self._commands: List[Dict[str, Any]] = []
+        self._acked_commands: List[Any] = []
+        self._seen_commands = deque(maxlen=SEEN_COMMANDS_LIMIT)
+        self._runtime_config: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def build_payload(self, name: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the heartbeat body for ``state`` relative to the last ack"""
+        current_hash = state_hash(state)
+        with self._lock:
+            acked_commands = list(self._acked_commands)
+            self._pending = {
+                "state": dict(state),
+                "hash": current_hash,
+                "acked_commands": acked_commands,
+            }
+            payload = {"name": name, "state_hash": current_hash}
+            if acked_commands:
+                payload["acked_commands"] = acked_commands
+
+            if not self.delta_enabled or self._acked_state is None:
+                payload.update(state)
+                return payload
+
+            payload["base_hash"] = self._acked_hash
+            for key, value in state.items():
+                if key not in self._acked_state or self._acked_state[key] != value:
+                    payload[key] = value
+            removed = [key for key in self._acked_state if key not in state]
+            if removed:
+                payload["removed"] = removed
+            return payload
+
+    def on_reply(self, reply: Optional[Dict[str, Any]]):
+        """Process the backend's heartbeat reply"""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if not isinstance(reply, dict):
+                return
+            if pending:
+                for command_id in pending["acked_commands"]:
+                    if command_id in self._acked_commands:
+                        self._acked_commands.remove(command_id)
+
+            acked_hash = reply.get("state_hash")
+            if reply.get("resync"):
+                logger.info("Backend requested a full heartbeat resync")
+                self._reset()
+            elif pending and acked_hash == pending["hash"]:
+                self._acked_state = pending["state"]
+                self._acked_hash = acked_hash
+            elif acked_hash is not None:
+                logger.info("Backend state hash mismatch, resyncing heartbeat")
+                self._reset()
+
+            if "heartbeat_interval" in reply:
+                self._set_interval(reply["heartbeat_interval"])
+            self._queue_commands(reply.get("commands"))
+            self._merge_desired_state(reply.get("desired_state"))
+            if isinstance(reply.get("config"), dict):
+                self._runtime_config = reply["config"]
+
+    def on_failure(self):
+        """Forget the unacknowledged heartbeat; the next delta uses the last ack"""
+        with self._lock:
+            self._pending = None
+
+    def take_commands(self) -> List[Dict[str, Any]]:
+        """Return and clear the commands received since the last call"""
+        with self._lock:
+            commands, self._commands = self._commands, []
+            return commands
+
+    def take_desired_diff(self) -> Dict[str, Any]:
+        """Return and clear the desired-state keys changed since the last call"""
+        with self._lock:
+            diff, self._desired_diff = self._desired_diff, {}
+            return diff
+
+    def take_runtime_config(self) -> Optional[Dict[str, Any]]:
+        """Return and clear the runtime config update received, if any"""
+        with self._lock:
+            update, self._runtime_config = self._runtime_config, None
+            return update
+
+    def set_interval(self, value):
+        """Set the heartbeat interval locally, within the same bounds"""
+        with self._lock:
+            self._set_interval(value)
+
+    def ack_command(self, command_id):
+        """Report a handled command id in the next heartbeat"""
+        if command_id is None:
+            return
+        with self._lock:
+            if command_id not in self._acked_commands:
+                self._acked_commands.append(command_id)
+
+    def _queue_commands(self, commands):
+        if not isinstance(commands, list):
+            return
+        for command in commands:
+            if not isinstance(command, dict):
+                command = {"id": None, "command": str(command)}
+            command_id = command.get("id")
+            if command_id is not None and command_id in self._seen_commands:
+                # Already handled; the ack was lost, so send it again
+                if command_id not in self._acked_commands:
+                    self._acked_commands.append(command_id)
+                continue
+            if command_id is not None:
+                self._seen_commands.append(command_id)
+            self._commands.append(command)
+
+    def _merge_desired_state(self, desired):
+        if not isinstance(desired, dict):
+            return
+        for key, value in desired.items():
+            if key not in self.desired_state or self.desired_state[key] != value:
+                self.desired_state[key] = value
+                self._desired_diff[key] = value
+
+    def reset(self):
+        """Force the next heartbeat to carry the full state"""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._acked_state = None
+        self._acked_hash = None
+
+    def _set_interval(self, value):
+        try:
+            interval = float(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring invalid heartbeat interval: {value!r}")
+            return
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        if interval != self.interval:
+            logger.info(f"Backend set heartbeat interval to {interval:.0f}s")
+        self.interval = interval
@@ -2,16 +2,21 @@ import threading
 
 import paho.mqtt.client as mqtt
 
+from agent.utils.traffic import mqtt_size, traffic
+
 
 class MqttClient:
     """MQTT client for agent communication. Supports connect, subscribe, publish, and message callback."""
 
-    def __init__(self, broker, port, topic_sub, topic_pub, on_message=None):
+    def __init__(
+        self, broker, port, topic_sub, topic_pub, on_message=None, on_connect=None
+    ):
         self.broker = broker
         self.port = port
         self.topic_sub = topic_sub
         self.topic_pub = topic_pub
         self.on_message = on_message
+        self.on_connect = on_connect
         self.client = mqtt.Client()
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
@@ -22,8 +27,11 @@ class MqttClient:
         print(f"[MQTT] Subscribing to topic: {self.topic_sub}")
         client.subscribe(self.topic_sub)
         print(f"[MQTT] Successfully subscribed to: {self.topic_sub}")
+        if self.on_connect and rc == 0:
+            self.on_connect()
 
     def _on_message(self, client, userdata, msg):
+        traffic.add("mqtt", received=mqtt_size(msg.topic, msg.payload))
         print(
             f"[MQTT] Message received on topic: {msg.topic} | Payload: {msg.payload.decode()}"
         )
@@ -34,10 +42,123 @@ class MqttClient:
         self._thread = threading.Thread(target=self._loop, daemon=True)
         self._thread.start()
 
+    def stop(self):
+        self.client.disconnect()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
     def _loop(self):
-        self.client.connect(self.broker, self.port, 60)
-        self.client.loop_forever()
+        # Connect in the background and keep retrying, so an unreachable
+        # broker neither blocks startup nor silently ends this thread
+        self.client.connect_async(self.broker, self.port, 60)
+        self.client.loop_forever(retry_first_connection=True)
 
     def publish(self, message):
         print(f"[MQTT] Publishing to topic {self.topic_pub}: {message}")
+        traffic.add("mqtt", sent=mqtt_size(self.topic_pub, message))
         self.client.publish(self.topic_pub, message)
+
+
+class SharedMqttConnection:
+    """One MQTT connection carrying the topics of several agents in a process.
+
+    ``channel()`` returns an object with the ``MqttClient`` interface
+    (``start``/``publish``) bound to one device's topics. Incoming messages
+    are routed to the channel subscribed to their topic, on ``executor``
+    when given so a slow handler does not stall the other devices. Each
+    channel's ``on_connect`` is called whenever the connection comes up.
+    """
+
+    def __init__(self, broker, port, executor=None):
+        self.broker = broker
+        self.port = port
+        self.executor = executor
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def channel(self, topic_sub, topic_pub, on_message=None, on_connect=None):
+        channel = MqttChannel(self, topic_sub, topic_pub, on_message, on_connect)
+        with self._lock:
+            self._channels[topic_sub] = channel
+        if self.client.is_connected():
+            self.client.subscribe(topic_sub)
+        return channel
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.client.disconnect()
+
+    def is_connected(self) -> bool:
+        return self.client.is_connected()
+
+    def _loop(self):
+        # Keep retrying like MqttClient, so a broker that is down when the
+        # host starts does not cost every hosted agent its commands
+        self.client.connect_async(self.broker, self.port, 60)
+        self.client.loop_forever(retry_first_connection=True)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        with self._lock:
+            channels = list(self._channels.values())
+        print(
+            f"[MQTT] Shared connection up with result code {rc}, {len(channels)} topics"
+        )
+        if channels:
+            client.subscribe([(channel.topic_sub, 0) for channel in channels])
+        if rc != 0:
+            return
+        for channel in channels:
+            if channel.on_connect is None:
+                continue
+            try:
+                channel.on_connect()
+            except Exception as e:
+                print(f"[MQTT] Connect handler for {channel.topic_sub} failed: {e}")
+
+    def _on_message(self, client, userdata, msg):
+        traffic.add("mqtt", received=mqtt_size(msg.topic, msg.payload))
+        channel = self._channels.get(msg.topic)
+        if channel is None or channel.on_message is None:
+            return
+        payload = msg.payload.decode()
+        if self.executor is not None:
+            self.executor.submit(channel.on_message, msg.topic, payload)
+        else:
+            channel.on_message(msg.topic, payload)
+
+    def publish(self, topic, message):
+        traffic.add("mqtt", sent=mqtt_size(topic, message))
+        self.client.publish(topic, message)
+
+
+class MqttChannel:
+    """One device's topics on a ``SharedMqttConnection``"""
+
+    def __init__(
+        self, connection, topic_sub, topic_pub, on_message=None, on_connect=None
+    ):
+        self.connection = connection
+        self.topic_sub = topic_sub
+        self.topic_pub = topic_pub
+        self.on_message = on_message
+        self.on_connect = on_connect
+
+    def start(self):
+        self.connection.start()
+
+    def is_connected(self) -> bool:
+        return self.connection.is_connected()
+
+    def publish(self, message):
+        self.connection.publish(self.topic_pub, message)
@@ -0,0 +1,169 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+logger = logging.getLogger("iot_agent")
+
+# Statuses worth retrying: timeouts, throttling and transient server errors.
+# Every other 4xx is a client error that will fail the same way again.
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """Return True if a failed response status is worth retrying"""
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def decorrelated_jitter(previous: float, base: float, cap: float) -> float:
+    """Next backoff delay using the "decorrelated jitter" strategy"""
+    return min(cap, random.uniform(base, max(base, previous * 3)))
+
+
+class CircuitBreaker:
+    """Three-state circuit breaker guarding calls to the backend.
+
+    ``closed`` lets every call through and counts consecutive failures.
+    After ``failure_threshold`` failures it goes ``open`` and rejects calls
+    until ``reset_timeout`` has passed, then ``half_open`` lets a single
+    probe through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self):
+        if self._state == self.OPEN and self._clock() >= self._open_until:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Backend circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self._open(self.reset_timeout)
+
+    def open_for(self, seconds: float):
+        """Open the circuit for an explicit duration (e.g. from Retry-After)"""
+        with self._lock:
+            self._open(max(seconds, 0.0))
+
+    def _open(self, seconds: float):
+        if self._state != self.OPEN:
+            logger.warning(f"Backend circuit opened for {seconds:.0f}s")
+        self._state = self.OPEN
+        self._open_until = self._clock() + seconds
+        self._probe_in_flight = False
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of overall traffic.
+
+    Every request deposits ``ratio`` tokens and time adds ``min_per_second``
+    tokens, up to ``capacity``; every retry withdraws one token. While the
+    backend keeps failing the bucket drains and further retries are dropped
+    instead of multiplying load on the server.
+    """
+
+    def __init__(
+        self,
+        capacity: float = 10,
+        ratio: float = 0.2,
+        min_per_second: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = capacity
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.min_per_second)
+
+    def record_request(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """Withdraw one retry token, returning False if the budget is spent"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
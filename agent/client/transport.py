@@ -0,0 +1,291 @@
+import gzip
+import json
+import logging
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+from agent.config import Config
+from agent.utils.traffic import http_size, traffic
+
+try:
+    import httpx
+except ImportError:  # httpx is optional, only needed for the HTTP/2 transport
+    httpx = None
+
+logger = logging.getLogger("iot_agent")
+
+# TCP keepalive probes keep idle pooled connections (and the carrier NAT
+# mapping in front of them) alive between heartbeats
+TCP_KEEPALIVE_IDLE = 60
+TCP_KEEPALIVE_INTERVAL = 15
+TCP_KEEPALIVE_COUNT = 4
+# Response bodies are read as they arrive, up to this much at a time, so the
+# total request deadline is checked while a slow server trickles them in
+READ_CHUNK_SIZE = 16 * 1024
+
+
+def _keepalive_socket_options() -> list:
+    """Socket options enabling TCP keepalive where the platform supports it"""
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    for name, value in (
+        ("TCP_KEEPIDLE", TCP_KEEPALIVE_IDLE),
+        ("TCP_KEEPINTVL", TCP_KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", TCP_KEEPALIVE_COUNT),
+    ):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter that applies custom socket options to pooled connections"""
+
+    def __init__(self, socket_options=None, **kwargs):
+        # Must be set before HTTPAdapter.__init__ calls init_poolmanager
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.socket_options:
+            kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class HttpTransport(ABC):
+    """Base class for the HTTP transports used by BackendClient.
+
+    Transports own the connection pool and return objects exposing
+    ``status_code``, ``headers``, ``content`` and ``json()``. Network errors
+    are raised as ``requests.exceptions.RequestException`` subclasses so
+    callers handle every transport the same way.
+
+    The read timeout only bounds each wait for data, so a request as a whole
+    must also finish within ``total_timeout`` (connect plus read timeout) or
+    it fails with ``Timeout``: a server trickling its response cannot hold
+    the caller forever.
+    """
+
+    name = "base"
+
+    def __init__(
+        self,
+        connect_timeout: float,
+        read_timeout: float,
+        compress_min_bytes: Optional[int] = None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = connect_timeout + read_timeout
+        self.compress_min_bytes = compress_min_bytes
+
+    def encode_body(self, data: Optional[Dict]) -> Tuple[Optional[bytes], Dict]:
+        """Serialize a JSON body, gzip-compressing it above the size threshold"""
+        if data is None:
+            return None, {}
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.compress_min_bytes is not None and len(body) >= self.compress_min_bytes:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    @abstractmethod
+    def request(
+        self,
+        method: str,
+        url: str,
+        data: Optional[Dict] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """Send a request and return the response"""
+
+    def close(self):
+        """Release pooled connections"""
+
+    def read_body(self, chunks, url: str, deadline: float) -> bytes:
+        """Read a streamed response body, failing once ``deadline`` passes"""
+        body = []
+        for chunk in chunks:
+            body.append(chunk)
+            if time.monotonic() > deadline:
+                raise requests.exceptions.Timeout(
+                    f"{url} took longer than {self.total_timeout}s"
+                )
+        return b"".join(body)
+
+    def record_traffic(self, url: str, headers: Dict, body: Optional[bytes], response):
+        """Count a request and its response as backend traffic"""
+        length = response.headers.get("Content-Length")
+        content = b"" if length is not None else response.content
+        received = http_size("", response.headers, content)
+        if length is not None:
+            received += int(length)
+        traffic.add("backend", sent=http_size(url, headers, body), received=received)
+
+
+def _arriving(raw):
+    """Body of a urllib3 response in the pieces the socket delivers them,
+    with urllib3's errors raised as requests' like ``iter_content`` does"""
+    try:
+        if not hasattr(raw, "read1"):  # urllib3 < 2.3 only reads in full chunks
+            yield from raw.stream(READ_CHUNK_SIZE, decode_content=True)
+            return
+        while True:
+            data = raw.read1(READ_CHUNK_SIZE, decode_content=True)
+            if not data:
+                return
+            yield data
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e) from e
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e) from e
+    except DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e) from e
+
+
+class RequestsTransport(HttpTransport):
+    """HTTP/1.1 transport backed by a tuned requests.Session"""
+
+    name = "requests"
+
+    def __init__(
+        self,
+        connect_timeout: float,
+        read_timeout: float,
+        pool_connections: int = 1,
+        pool_maxsize: int = 4,
+        compress_min_bytes: Optional[int] = None,
+        tcp_keepalive: bool = True,
+    ):
+        super().__init__(connect_timeout, read_timeout, compress_min_bytes)
+        self.session = requests.Session()
+        adapter = _KeepAliveAdapter(
+            socket_options=_keepalive_socket_options() if tcp_keepalive else None,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,  # BackendClient owns the retry policy
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, data=None, headers=None):
+        body, body_headers = self.encode_body(data)
+        if headers:
+            body_headers.update(headers)
+        deadline = time.monotonic() + self.total_timeout
+        response = self.session.request(
+            method.upper(),
+            url,
+            data=body,
+            headers=body_headers,
+            timeout=self.timeout,
+            stream=True,
+        )
+        try:
+            response._content = self.read_body(_arriving(response.raw), url, deadline)
+            response._content_consumed = True
+        finally:
+            response.close()
+        self.record_traffic(url, body_headers, body, response)
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxTransport(HttpTransport):
+    """Transport backed by httpx, optionally multiplexing requests over HTTP/2"""
+
+    name = "httpx"
+
+    def __init__(
+        self,
+        connect_timeout: float,
+        read_timeout: float,
+        pool_maxsize: int = 4,
+        keepalive_expiry: float = 120,
+        compress_min_bytes: Optional[int] = None,
+        http2: bool = False,
+    ):
+        if httpx is None:
+            raise ImportError("httpx is not installed")
+        super().__init__(connect_timeout, read_timeout, compress_min_bytes)
+        self.http2 = http2
+        self.client = httpx.Client(
+            http2=http2,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_maxsize,
+                max_keepalive_connections=pool_maxsize,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+
+    def request(self, method, url, data=None, headers=None):
+        body, body_headers = self.encode_body(data)
+        if headers:
+            body_headers.update(headers)
+        deadline = time.monotonic() + self.total_timeout
+        request = self.client.build_request(
+            method.upper(), url, content=body, headers=body_headers
+        )
+        try:
+            response = self.client.send(request, stream=True)
+            try:
+                response._content = self.read_body(response.iter_bytes(), url, deadline)
+            finally:
+                response.close()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        self.record_traffic(url, body_headers, body, response)
+        return response
+
+    def close(self):
+        self.client.close()
+
+
+def create_transport(config=None, pool_maxsize: Optional[int] = None) -> HttpTransport:
+    """Build the HTTP transport selected by the configuration"""
+    config = config or Config
+    pool_maxsize = pool_maxsize or config.HTTP_POOL_MAXSIZE
+    compress_min_bytes = (
+        config.HTTP_COMPRESS_MIN_BYTES if config.HTTP_COMPRESSION else None
+    )
+
+    if config.HTTP_TRANSPORT == "httpx":
+        try:
+            transport = HttpxTransport(
+                config.BACKEND_CONNECT_TIMEOUT,
+                config.BACKEND_READ_TIMEOUT,
+                pool_maxsize=pool_maxsize,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+                compress_min_bytes=compress_min_bytes,
+                http2=config.HTTP2_ENABLED,
+            )
+            logger.info(f"Using httpx transport (HTTP/2: {config.HTTP2_ENABLED})")
+            return transport
+        except ImportError as e:
+            logger.warning(
+                f"httpx transport unavailable ({e}), falling back to requests"
+            )
+    elif config.HTTP_TRANSPORT != "requests":
+        logger.warning(
+            f"Unknown HTTP_TRANSPORT '{config.HTTP_TRANSPORT}', using requests"
+        )
+
+    return RequestsTransport(
+        config.BACKEND_CONNECT_TIMEOUT,
+        config.BACKEND_READ_TIMEOUT,
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        compress_min_bytes=compress_min_bytes,
+    )
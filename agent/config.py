@@ -13,10 +13,49 @@ class Config:
     # Docker settings
     DOCKER_IMAGE = os.getenv("DOCKER_IMAGE", "taipham2710/agent:latest")
     CONTAINER_NAME = os.getenv("CONTAINER_NAME", "iot_app")
+    DOCKER_STATE_CACHE_TTL = int(os.getenv("DOCKER_STATE_CACHE_TTL", "300"))
+
+    # Share pulled images with agents on the same LAN: peers are discovered by
+    # UDP broadcast and serve images over HTTP; only the leader (lowest
+    # DEVICE_ID) pulls a new image from the registry, the others wait up to
+    # PEER_WAIT_TIMEOUT seconds to load it from a peer. The site's agents share
+    # PEER_SHARED_SECRET, which signs announcements and image transfers
+    PEER_IMAGES_ENABLED = os.getenv("PEER_IMAGES_ENABLED", "false").lower() == "true"
+    PEER_PORT = int(os.getenv("PEER_PORT", "5050"))
+    PEER_DISCOVERY_PORT = int(os.getenv("PEER_DISCOVERY_PORT", "5051"))
+    PEER_BROADCAST_ADDRESS = os.getenv("PEER_BROADCAST_ADDRESS", "255.255.255.255")
+    PEER_ANNOUNCE_INTERVAL = int(os.getenv("PEER_ANNOUNCE_INTERVAL", "30"))
+    PEER_WAIT_TIMEOUT = int(os.getenv("PEER_WAIT_TIMEOUT", "600"))
+    PEER_MAX_UPLOADS = int(os.getenv("PEER_MAX_UPLOADS", "2"))
+    PEER_SHARED_SECRET = os.getenv("PEER_SHARED_SECRET", "")
+    CONTAINER_SETTLE_TIME = float(os.getenv("CONTAINER_SETTLE_TIME", "5"))
+
+    # Python-only releases of the agent package: every CODE_SYNC_INTERVAL
+    # seconds fetch the release manifest, download only the changed chunks
+    # (CODE_SYNC_BATCH_SIZE per request), swap the package and restart.
+    # Releases must be signed with CODE_SIGNING_KEY, a secret shared with the
+    # release tooling
+    CODE_SYNC_ENABLED = os.getenv("CODE_SYNC_ENABLED", "false").lower() == "true"
+    CODE_SIGNING_KEY = os.getenv("CODE_SIGNING_KEY", "")
+    CODE_SYNC_INTERVAL = int(os.getenv("CODE_SYNC_INTERVAL", "900"))
+    CODE_SYNC_BATCH_SIZE = int(os.getenv("CODE_SYNC_BATCH_SIZE", "256"))
 
     # Backend settings
     BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
     BACKEND_TIMEOUT = int(os.getenv("BACKEND_TIMEOUT", "30"))
+    BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+    BACKEND_READ_TIMEOUT = float(
+        os.getenv("BACKEND_READ_TIMEOUT", str(BACKEND_TIMEOUT))
+    )
+
+    # HTTP transport settings
+    HTTP_TRANSPORT = os.getenv("HTTP_TRANSPORT", "requests")  # requests | httpx
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "1"))
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "4"))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+    HTTP_COMPRESSION = os.getenv("HTTP_COMPRESSION", "false").lower() == "true"
+    HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "512"))
 
     # Device settings
     DEVICE_NAME = os.getenv("DEVICE_NAME", socket.gethostname())
@@ -26,19 +65,131 @@ class Config:
     HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", "300"))  # 5 minutes
     UPDATE_CHECK_INTERVAL = int(os.getenv("UPDATE_CHECK_INTERVAL", "600"))  # 10 minutes
     LOG_INTERVAL = int(os.getenv("LOG_INTERVAL", "60"))  # 1 minute
+    SENSOR_INTERVAL = int(os.getenv("SENSOR_INTERVAL", "10"))
+
+    # Edge rules (JSON list in RULES_FILE) evaluated on every sensor sample.
+    # With SENSOR_PUBLISH_RAW=false only rule events go upstream.
+    RULES_FILE = os.getenv("RULES_FILE", "")
+    SENSOR_PUBLISH_RAW = os.getenv("SENSOR_PUBLISH_RAW", "true").lower() == "true"
+
+    # Health thresholds (percent); like the intervals, adjustable at runtime
+    CPU_THRESHOLD = float(os.getenv("CPU_THRESHOLD", "80"))
+    MEMORY_THRESHOLD = float(os.getenv("MEMORY_THRESHOLD", "85"))
+    DISK_THRESHOLD = float(os.getenv("DISK_THRESHOLD", "90"))
+
+    # Adaptive monitoring: sample every MONITOR_MIN_INTERVAL seconds while
+    # metrics move or are within MONITOR_THRESHOLD_MARGIN of a threshold,
+    # backing off to LOG_INTERVAL when stable. Only metrics that changed by
+    # MONITOR_DEADBAND percentage points are reported.
+    MONITOR_MIN_INTERVAL = int(os.getenv("MONITOR_MIN_INTERVAL", "5"))
+    MONITOR_DEADBAND = float(os.getenv("MONITOR_DEADBAND", "2"))
+    MONITOR_THRESHOLD_MARGIN = float(os.getenv("MONITOR_THRESHOLD_MARGIN", "10"))
+    MONITOR_FULL_REPORT_INTERVAL = int(
+        os.getenv("MONITOR_FULL_REPORT_INTERVAL", "3600")
+    )
+
+    # Alerts: raise after ALERT_MIN_DURATION seconds above a threshold, clear
+    # ALERT_HYSTERESIS points below it, remind every ALERT_REPEAT_INTERVAL and
+    # send at most ALERT_RATE_LIMIT alerts per ALERT_RATE_WINDOW seconds
+    ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "5"))
+    ALERT_MIN_DURATION = int(os.getenv("ALERT_MIN_DURATION", "30"))
+    ALERT_REPEAT_INTERVAL = int(os.getenv("ALERT_REPEAT_INTERVAL", "900"))
+    ALERT_RATE_LIMIT = int(os.getenv("ALERT_RATE_LIMIT", "10"))
+    ALERT_RATE_WINDOW = int(os.getenv("ALERT_RATE_WINDOW", "600"))
+
+    # Streaming anomaly detection on system metrics and sensor values: EWMA
+    # z-scores (weight ANOMALY_ALPHA) over ANOMALY_THRESHOLD after
+    # ANOMALY_WARMUP samples, also checked against a time-of-day baseline with
+    # ANOMALY_SEASONAL_BUCKETS slots (0 disables it). State is checkpointed
+    # under ANOMALY_STATE_PATH, relative to the working directory. Opt-in.
+    ANOMALY_ENABLED = os.getenv("ANOMALY_ENABLED", "false").lower() == "true"
+    ANOMALY_STATE_PATH = os.getenv("ANOMALY_STATE_PATH", "data/anomaly")
+    ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.05"))
+    ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "4"))
+    ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "30"))
+    ANOMALY_MIN_STD = float(os.getenv("ANOMALY_MIN_STD", "1"))
+    ANOMALY_SEASONAL_BUCKETS = int(os.getenv("ANOMALY_SEASONAL_BUCKETS", "24"))
+    ANOMALY_CHECKPOINT_INTERVAL = int(os.getenv("ANOMALY_CHECKPOINT_INTERVAL", "300"))
+
+    # Per-container usage, read from cgroup v2 files under CGROUP_ROOT (mount
+    # the host's /sys/fs/cgroup and /proc when the agent runs in a container)
+    # or else from one streaming Docker stats connection per container. Opt-in.
+    CONTAINER_STATS_ENABLED = (
+        os.getenv("CONTAINER_STATS_ENABLED", "false").lower() == "true"
+    )
+    CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+    PROC_ROOT = os.getenv("PROC_ROOT", "/proc")
+    CONTAINER_LIST_INTERVAL = int(os.getenv("CONTAINER_LIST_INTERVAL", "30"))
+    CONTAINER_CPU_THRESHOLD = float(os.getenv("CONTAINER_CPU_THRESHOLD", "80"))
+    CONTAINER_MEMORY_THRESHOLD = float(os.getenv("CONTAINER_MEMORY_THRESHOLD", "90"))
+
+    # Local metrics history: raw samples plus 1-minute and 1-hour tiers, each a
+    # fixed number of rows (about 10 days of minutes and 1 year of hours),
+    # stored under METRICS_STORE_PATH relative to the working directory. Opt-in.
+    METRICS_STORE_ENABLED = (
+        os.getenv("METRICS_STORE_ENABLED", "false").lower() == "true"
+    )
+    METRICS_STORE_PATH = os.getenv("METRICS_STORE_PATH", "data/metrics")
+    METRICS_RAW_ROWS = int(os.getenv("METRICS_RAW_ROWS", "10000"))
+    METRICS_MINUTE_ROWS = int(os.getenv("METRICS_MINUTE_ROWS", "14400"))
+    METRICS_HOUR_ROWS = int(os.getenv("METRICS_HOUR_ROWS", "8760"))
+
+    # Heartbeat settings (the backend may adjust the interval within these bounds)
+    HEARTBEAT_MIN_INTERVAL = int(os.getenv("HEARTBEAT_MIN_INTERVAL", "10"))
+    HEARTBEAT_MAX_INTERVAL = int(os.getenv("HEARTBEAT_MAX_INTERVAL", "3600"))
+    HEARTBEAT_DELTA = os.getenv("HEARTBEAT_DELTA", "true").lower() == "true"
 
     # Retry settings
     MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
     RETRY_DELAY = int(os.getenv("RETRY_DELAY", "5"))
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+    RETRY_BUDGET_CAPACITY = float(os.getenv("RETRY_BUDGET_CAPACITY", "10"))
+    RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+
+    # Circuit breaker settings
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "60"))
 
     # Error handling
     MAX_CONSECUTIVE_ERRORS = int(os.getenv("MAX_CONSECUTIVE_ERRORS", "5"))
     ERROR_WAIT_TIME = int(os.getenv("ERROR_WAIT_TIME", "30"))
 
+    # Watchdog: every WATCHDOG_INTERVAL seconds restart dead service threads
+    # (MQTT, reconciler) and abandon jobs running past WATCHDOG_JOB_DEADLINE,
+    # reconnecting the backend client they are most likely stuck on. 0 derives
+    # the deadline from the backend timeouts and retries: twice the longest a
+    # request can take with all its retries (640s by default). Opt-in.
+    WATCHDOG_ENABLED = os.getenv("WATCHDOG_ENABLED", "false").lower() == "true"
+    WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "0.5"))
+    WATCHDOG_JOB_DEADLINE = float(os.getenv("WATCHDOG_JOB_DEADLINE", "0"))
+
+    # Budgets for the agent's own use of the device, checked every
+    # BUDGET_CHECK_INTERVAL seconds (0 = not enforced). Over its CPU or
+    # network budget the agent samples less often (up to BUDGET_MAX_SLOWDOWN
+    # times), over its network budget it defers image pulls, and over its
+    # memory budget it compacts its buffers. The process runs at BUDGET_NICE
+    # (0 keeps its priority). Opt-in.
+    BUDGET_ENABLED = os.getenv("BUDGET_ENABLED", "false").lower() == "true"
+    BUDGET_CHECK_INTERVAL = int(os.getenv("BUDGET_CHECK_INTERVAL", "30"))
+    BUDGET_CPU_PERCENT = float(os.getenv("BUDGET_CPU_PERCENT", "10"))
+    BUDGET_MEMORY_MB = float(os.getenv("BUDGET_MEMORY_MB", "200"))
+    BUDGET_NETWORK_KBPS = float(os.getenv("BUDGET_NETWORK_KBPS", "0"))
+    BUDGET_MAX_SLOWDOWN = int(os.getenv("BUDGET_MAX_SLOWDOWN", "8"))
+    BUDGET_NICE = int(os.getenv("BUDGET_NICE", "0"))
+
+    # A standalone agent runs its jobs on SCHEDULER_WORKERS threads, slow
+    # jobs (code sync, version updates) on their own SCHEDULER_BLOCKING_WORKERS.
+    # The agent's pool, or the agent host's, keeps SCHEDULER_RESERVED_WORKERS
+    # of its workers for heartbeats only.
+    SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+    SCHEDULER_BLOCKING_WORKERS = int(os.getenv("SCHEDULER_BLOCKING_WORKERS", "2"))
+    SCHEDULER_RESERVED_WORKERS = int(os.getenv("SCHEDULER_RESERVED_WORKERS", "1"))
+
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
-    # MQTT settings
+    # MQTT settings (optional; without a broker commands arrive via heartbeats)
+    MQTT_ENABLED = os.getenv("MQTT_ENABLED", "true").lower() == "true"
     MQTT_BROKER = os.getenv(
         "MQTT_BROKER", "localhost"
     )  # Default to localhost for local MQTT broker
@@ -49,3 +200,55 @@ class Config:
     MQTT_TOPIC_PUB = os.getenv(
         "MQTT_TOPIC_PUB", f"agent/{DEVICE_ID}/status"
     )  # Default topic per device
+    # Seconds to wait for the broker before reporting mqtt readiness "failed"
+    # (the agent keeps reconnecting and turns "ready" once it connects)
+    MQTT_CONNECT_TIMEOUT = float(os.getenv("MQTT_CONNECT_TIMEOUT", "30"))
+
+    # Gateway mode: run a local broker on GATEWAY_PORT for nearby agents and
+    # forward their messages to MQTT_BROKER over this agent's one connection,
+    # up to GATEWAY_BATCH_SIZE messages per batch every GATEWAY_BATCH_INTERVAL.
+    # The broker has no authentication: it listens on localhost unless
+    # GATEWAY_HOST says otherwise, and only the command topics of this device
+    # and of GATEWAY_DEVICE_IDS (comma-separated) are subscribed upstream
+    GATEWAY_ENABLED = os.getenv("GATEWAY_ENABLED", "false").lower() == "true"
+    GATEWAY_HOST = os.getenv("GATEWAY_HOST", "127.0.0.1")
+    GATEWAY_DEVICE_IDS = [
+        int(device_id)
+        for device_id in os.getenv("GATEWAY_DEVICE_IDS", "").split(",")
+        if device_id.strip()
+    ]
+    GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "1883"))
+    GATEWAY_BATCH_SIZE = int(os.getenv("GATEWAY_BATCH_SIZE", "50"))
+    GATEWAY_BATCH_INTERVAL = float(os.getenv("GATEWAY_BATCH_INTERVAL", "1"))
+    GATEWAY_QUEUE_SIZE = int(os.getenv("GATEWAY_QUEUE_SIZE", "10000"))
+    GATEWAY_UPLINK_TOPIC = os.getenv(
+        "GATEWAY_UPLINK_TOPIC", f"gateway/{DEVICE_ID}/batch"
+    )
+
+
+class AgentConfig:
+    """Configuration for one agent instance.
+
+    Attributes default to the process-wide ``Config`` values and can be
+    overridden per instance, so several agents can share a process. It is
+    read the same way as ``Config`` (``config.DEVICE_ID``), and services
+    that take a ``config`` accept either.
+    """
+
+    def __init__(self, **overrides):
+        unknown = [key for key in overrides if not hasattr(Config, key)]
+        if unknown:
+            raise ValueError(f"Unknown config settings: {', '.join(sorted(unknown))}")
+        for key in dir(Config):
+            if key.isupper():
+                setattr(self, key, getattr(Config, key))
+        if "DEVICE_ID" in overrides:
+            # Per-device topics follow the device id unless set explicitly
+            device_id = overrides["DEVICE_ID"]
+            self.MQTT_TOPIC_SUB = f"agent/{device_id}/cmd"
+            self.MQTT_TOPIC_PUB = f"agent/{device_id}/status"
+        for key, value in overrides.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return f"AgentConfig(DEVICE_ID={self.DEVICE_ID!r}, DEVICE_NAME={self.DEVICE_NAME!r})"
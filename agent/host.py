@@ -0,0 +1,183 @@
+import argparse
+import logging
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from agent.client.backend_client import BackendClient
+from agent.client.mqtt_client import SharedMqttConnection
+from agent.client.transport import create_transport
+from agent.config import AgentConfig, Config
+from agent.main import IoTAgent
+from agent.services.metrics_store import open_store
+from agent.services.scheduler import PriorityExecutor
+from agent.services.system_monitor import SystemMonitor
+from agent.utils.logger import setup_logger
+
+logger = logging.getLogger("iot_agent")
+
+
+class AgentHost:
+    """Runs many ``IoTAgent`` instances, one per device, in a single process.
+
+    The agents share one worker thread pool for their scheduled jobs, one
+    HTTP connection pool to the backend, one MQTT connection (each agent
+    keeps its own per-device topics) and one system sampler. Containers are
+    not managed by default, since hosted devices are usually simulated
+    sensors or devices behind a gateway.
+    """
+
+    def __init__(
+        self,
+        configs: List[AgentConfig],
+        workers: int = 8,
+        manage_containers: bool = False,
+        sample_max_age: float = 5,
+    ):
+        self.configs = configs
+        # Process-wide settings (transport, broker) come from the first config
+        base = configs[0] if configs else Config
+        # Jobs run by priority, with workers reserved for heartbeats; slow
+        # jobs get their own pool
+        self.executor = PriorityExecutor(
+            workers,
+            reserved=base.SCHEDULER_RESERVED_WORKERS,
+            thread_name_prefix="agent",
+        )
+        self.blocking_executor = ThreadPoolExecutor(
+            max_workers=base.SCHEDULER_BLOCKING_WORKERS,
+            thread_name_prefix="agent_blocking",
+        )
+        # Enough pooled connections for every worker to have one
+        self.transport = create_transport(
+            base, pool_maxsize=max(workers, base.HTTP_POOL_MAXSIZE)
+        )
+        self.system_monitor = SystemMonitor(
+            max_age=sample_max_age, store=open_store(base)
+        )
+        self.mqtt = None
+        if base.MQTT_ENABLED and base.MQTT_BROKER:
+            self.mqtt = SharedMqttConnection(
+                base.MQTT_BROKER, base.MQTT_PORT, executor=self.executor
+            )
+        self.agents = [
+            IoTAgent(
+                config=config,
+                backend_client=BackendClient(transport=self.transport, config=config),
+                system_monitor=self.system_monitor,
+                mqtt_connection=self.mqtt,
+                executor=self.executor,
+                manage_containers=manage_containers,
+                blocking_executor=self.blocking_executor,
+            )
+            for config in configs
+        ]
+        self.running = False
+
+    @classmethod
+    def for_devices(
+        cls,
+        count: int,
+        first_device_id: int = 1,
+        name_prefix: Optional[str] = None,
+        overrides: Optional[dict] = None,
+        **kwargs,
+    ) -> "AgentHost":
+        """Host ``count`` devices with consecutive ids; ``overrides`` apply to all"""
+        prefix = name_prefix or f"{Config.DEVICE_NAME}-"
+        configs = [
+            AgentConfig(
+                DEVICE_ID=device_id,
+                DEVICE_NAME=f"{prefix}{device_id}",
+                **(overrides or {}),
+            )
+            for device_id in range(first_device_id, first_device_id + count)
+        ]
+        return cls(configs, **kwargs)
+
+    def setup_signal_handlers(self):
+        def signal_handler(signum, frame):
+            logger.info(f"Received signal {signum}, stopping all agents...")
+            self.stop()
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+    def start(self):
+        """Start all agents and run their schedules until stopped"""
+        logger.info(f"Starting agent host with {len(self.agents)} agents")
+        self.running = True
+        if self.mqtt:
+            self.mqtt.start()
+        # Initial heartbeats and monitoring run in parallel on the shared pool
+        list(self.executor.map(lambda agent: agent.startup(), self.agents))
+
+        while self.running:
+            for agent in self.agents:
+                if not agent.running:
+                    continue
+                try:
+                    agent.run_pending()
+                    if agent.supervisor:
+                        agent.supervisor.check()
+                except Exception as e:
+                    logger.error(f"Error scheduling {agent.config.DEVICE_NAME}: {e}")
+            time.sleep(1)
+
+        self.shutdown()
+
+    def stop(self):
+        self.running = False
+        for agent in self.agents:
+            agent.stop()
+
+    def shutdown(self):
+        """Send final heartbeats and release the shared resources"""
+        list(self.executor.map(lambda agent: agent.shutdown(), self.agents))
+        if self.mqtt:
+            self.mqtt.stop()
+        self.executor.shutdown(wait=True)
+        self.blocking_executor.shutdown(wait=False)
+        self.transport.close()
+        if self.system_monitor.store:
+            self.system_monitor.store.close()
+        logger.info("Agent host stopped")
+
+    def get_status(self) -> dict:
+        return {
+            "agents": len(self.agents),
+            "running": sum(1 for agent in self.agents if agent.running),
+            "devices": [agent.config.DEVICE_NAME for agent in self.agents],
+        }
+
+
+def main():
+    """Entry point: run several simulated devices in one process"""
+    parser = argparse.ArgumentParser(description="Run many agents in one process")
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--first-device-id", type=int, default=Config.DEVICE_ID)
+    parser.add_argument("--name-prefix", help="device name prefix")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--manage-containers", action="store_true")
+    args = parser.parse_args()
+
+    setup_logger()
+    try:
+        host = AgentHost.for_devices(
+            args.agents,
+            first_device_id=args.first_device_id,
+            name_prefix=args.name_prefix,
+            workers=args.workers,
+            manage_containers=args.manage_containers,
+        )
+        host.setup_signal_handlers()
+        host.start()
+    except Exception as e:
+        print(f"Failed to start agent host: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,170 @@
-import os
-import re
+import gc
+import json
 import signal
 import sys
+import threading
 import time
-
-import requests
-import schedule
+from concurrent.futures import ThreadPoolExecutor
 
 from agent.client.backend_client import BackendClient
-from agent.client.mqtt_client import MqttClient
 from agent.config import Config
-from agent.services.docker_manager import DockerManager
+from agent.runtime_config import RuntimeConfig, initial_settings
+from agent.services.adaptive_monitor import AdaptiveCadence
+from agent.services.alert_manager import AlertManager
+from agent.services.anomaly_detector import open_detector
+from agent.services.code_sync import CodeSync, restart_in_place
+from agent.services.reconciler import Reconciler
+from agent.services.resource_budget import ResourceBudget, lower_priority
+from agent.services.rule_engine import RuleEngine, load_rules
+from agent.services.scheduler import (
+    COALESCE,
+    HIGH,
+    LOW,
+    NORMAL,
+    SKIP,
+    PriorityExecutor,
+    Scheduler,
+)
 from agent.services.sensor_simulator import SensorSimulator
-from agent.services.system_monitor import SystemMonitor
+from agent.services.supervisor import Supervisor
 from agent.utils.logger import log_system_info, setup_logger
+from agent.utils.traffic import http_size, traffic
+from agent.utils.version import Version, image_version, latest_tag, parse_version
 
 
 class IoTAgent:
     """Main IoT Agent class that coordinates all services"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        config=None,
+        backend_client=None,
+        system_monitor=None,
+        mqtt_connection=None,
+        executor=None,
+        manage_containers=True,
+        blocking_executor=None,
+    ):
+        """Without arguments the agent is configured from ``Config`` and owns
+        its services. ``AgentHost`` passes a per-agent ``AgentConfig`` and the
+        services shared by all agents in the process: a backend client on a
+        shared transport, a system monitor, a ``SharedMqttConnection``, the
+        ``executor`` that runs scheduled jobs and the ``blocking_executor``
+        for slow ones. A standalone agent runs its jobs on a small pool of
+        its own.
+        """
+        self._init_started = time.monotonic()
+        self.config = config or Config
         self.logger = setup_logger()
         self.running = False
+        # Hosted agents share the executor and are supervised by AgentHost
+        self._hosted = executor is not None
+        self.executor = executor or PriorityExecutor(
+            self.config.SCHEDULER_WORKERS,
+            reserved=self.config.SCHEDULER_RESERVED_WORKERS,
+            thread_name_prefix="agent",
+        )
+        self._blocking_executor = blocking_executor
+        self.scheduler = Scheduler(self._run_task)
+        # Job name -> (scheduled task, interval it was scheduled with)
+        self._jobs = {}
+        self._jobs_in_flight = set()
+        # The agent's own CPU, memory and network use, by job and subsystem
+        self.budget = (
+            ResourceBudget(self.config) if self.config.BUDGET_ENABLED else None
+        )
+        # Restarts stuck jobs and dead service threads
+        self.supervisor = None
+        if self.config.WATCHDOG_ENABLED:
+            self.supervisor = Supervisor(self.config.WATCHDOG_INTERVAL)
+        # Seconds from construction to each startup milestone
+        self.startup_times = {}
+        # Service name -> "pending", "ready", "failed" or "disabled"
+        self.readiness = {}
+        self._state_lock = threading.Lock()
 
-        # Initialize services
-        try:
-            self.backend_client = BackendClient()
-            self.docker_manager = DockerManager()
-            self.system_monitor = SystemMonitor()
-            self.logger.info("IoT Agent initialized successfully")
-        except Exception as e:
-            self.logger.error(f"Failed to initialize IoT Agent: {e}")
-            # Continue without Docker if it fails
-            self.docker_manager = None
-            self.system_monitor = None
-            self.logger.warning("Continuing without Docker manager and system monitor")
-        # Initialize MQTT client
+        self.backend_client = backend_client or BackendClient(config=self.config)
+        # Intervals and thresholds the backend can change without a restart
+        self.runtime_config = RuntimeConfig(initial_settings(self.config))
+        self.runtime_config.add_listener(self._on_runtime_config_change)
+        self.monitor_cadence = AdaptiveCadence(
+            min_interval=self.config.MONITOR_MIN_INTERVAL,
+            max_interval=self.runtime_config.get("log_interval"),
+            deadband=self.runtime_config.get("monitor_deadband"),
+            margin=self.config.MONITOR_THRESHOLD_MARGIN,
+            full_report_interval=self.config.MONITOR_FULL_REPORT_INTERVAL,
+        )
+        self._health_status = None  # last reported overall health
+        # Per agent, since hosted agents share one system monitor
+        self.alert_manager = AlertManager(self.config)
+        self.anomaly_detector = open_detector(self.config)
+        self.system_monitor = system_monitor
+        self.docker_manager = None
+        self.reconciler = None  # created once Docker is available
+        self.container_stats = None
+        self.mqtt_client = None
+        self.gateway = None  # local broker for nearby agents in gateway mode
+        self.sensor_simulator = SensorSimulator()
+        self.code_sync = None
+        if self.config.CODE_SYNC_ENABLED and not self.config.CODE_SIGNING_KEY:
+            self.logger.error("CODE_SYNC_ENABLED needs CODE_SIGNING_KEY, not syncing")
+        elif self.config.CODE_SYNC_ENABLED:
+            self.code_sync = CodeSync(self.backend_client, config=self.config)
+        # Set once new code is installed; main() then re-executes the process
+        self.restart_requested = False
+        # Set by the restart command; the loop calling run_pending restarts
+        self._restart_pending = threading.Event()
+        self.rule_engine = RuleEngine()
         try:
-            self.mqtt_client = MqttClient(
-                broker=Config.MQTT_BROKER,
-                port=Config.MQTT_PORT,
-                topic_sub=Config.MQTT_TOPIC_SUB,
-                topic_pub=Config.MQTT_TOPIC_PUB,
+            self.rule_engine.load(load_rules(self.config.RULES_FILE))
+        except ValueError as e:
+            self.logger.error(f"Invalid rules in {self.config.RULES_FILE}: {e}")
+
+        # Slow services (Docker ping, MQTT connect) start in the background so
+        # the agent can heartbeat right away and report readiness as they come up
+        pending = {}
+        if system_monitor is not None:
+            self.readiness["system_monitor"] = "ready"
+        else:
+            pending["system_monitor"] = self._init_system_monitor
+        if manage_containers:
+            pending["docker"] = self._init_docker
+        else:
+            self.readiness["docker"] = "disabled"
+        if mqtt_connection is not None:
+            # Ready once the shared connection is up, which it may already be
+            self.readiness["mqtt"] = "pending"
+            self.mqtt_client = mqtt_connection.channel(
+                self.config.MQTT_TOPIC_SUB,
+                self.config.MQTT_TOPIC_PUB,
                 on_message=self.handle_mqtt_message,
+                on_connect=self._on_mqtt_connect,
             )
-            self.mqtt_client.start()
-            self.logger.info("MQTT client started successfully")
-            # Test publish to verify connection
-            time.sleep(2)  # Wait for connection to establish
-            self.mqtt_client.publish("Agent is online and ready to receive commands")
-            self.logger.info("MQTT test message sent successfully")
-        except Exception as e:
-            self.logger.error(f"Failed to initialize MQTT client: {e}")
-            self.mqtt_client = None
-        # Initialize sensor simulator
-        self.sensor_simulator = SensorSimulator()
-        self.logger.info("Sensor simulator initialized successfully")
+            if mqtt_connection.is_connected():
+                self.readiness["mqtt"] = "ready"
+        elif self.config.MQTT_ENABLED and self.config.MQTT_BROKER:
+            pending["mqtt"] = self._init_mqtt
+        else:
+            self.readiness["mqtt"] = "disabled"
+            self.logger.info("MQTT disabled, receiving commands via heartbeats")
+
+        for name in pending:
+            self.readiness[name] = "pending"
+        for name, init in pending.items():
+            self._run_in_background(self._init_service, name, init)
+        with self._state_lock:
+            if (
+                "pending" not in self.readiness.values()
+                and "ready" not in self.startup_times
+            ):
+                self._mark_startup("ready")
+        if self.readiness.get("mqtt") == "pending":
+            timer = threading.Timer(
+                self.config.MQTT_CONNECT_TIMEOUT, self._mqtt_connect_timed_out
+            )
+            timer.daemon = True
+            timer.start()
+        self.logger.info("IoT Agent initialized, services starting in background")
 
     def setup_signal_handlers(self):
         """Setup signal handlers for graceful shutdown"""
@@ -67,30 +176,185 @@ class IoTAgent:
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
 
-    def start(self):
-        """Start the IoT Agent"""
-        self.logger.info("Starting IoT Agent...")
-        self.setup_signal_handlers()
-        self.running = True
+    def _run_in_background(self, func, *args):
+        self.executor.submit(func, *args)
 
-        # Log initial system info
+    def _init_service(self, name, init):
+        """Initialize one service and record its readiness.
+
+        The ``_init_*`` functions import their modules themselves: docker,
+        paho and psutil are slow to import and stay off the startup path.
+        """
         try:
-            log_system_info(self.logger)
+            state = init() or "ready"
         except Exception as e:
-            self.logger.warning(f"Could not log system info: {e}")
+            self.logger.error(f"Failed to initialize {name}: {e}")
+            state = "failed"
+        self._set_readiness(name, state)
 
-        # Schedule tasks
-        self._setup_schedules()
+    def _set_readiness(self, name, state, only_from=None) -> bool:
+        """Record a service's readiness; with ``only_from``, only if the
+        service is still in that state. Returns whether it changed."""
+        with self._state_lock:
+            if only_from is not None and self.readiness.get(name) != only_from:
+                return False
+            self.readiness[name] = state
+            became_ready = (
+                "pending" not in self.readiness.values()
+                and "ready" not in self.startup_times
+            )
+            if became_ready:
+                self._mark_startup("ready")
+        self.logger.info(f"Service {name}: {state}")
+        if became_ready:
+            if self.running:
+                # Let the backend know right away instead of at the next beat
+                self._run_job(self._perform_heartbeat, priority=HIGH)
+        return True
+
+    def _mark_startup(self, milestone):
+        elapsed = time.monotonic() - self._init_started
+        self.startup_times[milestone] = round(elapsed, 3)
+        self.logger.info(f"Startup milestone '{milestone}' reached in {elapsed:.2f}s")
+
+    def get_readiness(self) -> str:
+        """Overall readiness: "starting", "ready" or "degraded" (a service failed)"""
+        states = self.readiness.values()
+        if "pending" in states:
+            return "starting"
+        return "degraded" if "failed" in states else "ready"
+
+    def _init_system_monitor(self):
+        from agent.services.metrics_store import open_store
+        from agent.services.system_monitor import SystemMonitor
+
+        store = open_store(self.config)
+        with self._state_lock:
+            self.system_monitor = SystemMonitor(
+                store=store, containers=self.container_stats
+            )
+        if self.running:
+            self._run_job(self._perform_system_monitoring)
+
+    def _init_docker(self):
+        from agent.services.docker_manager import DockerManager
+
+        docker_manager = DockerManager(config=self.config)
+        if self.config.PEER_IMAGES_ENABLED and not self.config.PEER_SHARED_SECRET:
+            self.logger.error(
+                "PEER_IMAGES_ENABLED needs PEER_SHARED_SECRET, not sharing"
+            )
+        elif self.config.PEER_IMAGES_ENABLED:
+            from agent.services.peer_images import PeerImageCache
+
+            docker_manager.peers = PeerImageCache(
+                docker_manager.client, self.config
+            ).start()
+        reconciler = self._new_reconciler(
+            docker_manager, self.runtime_config.get("update_check_interval")
+        )
+        container_stats = None
+        if self.config.CONTAINER_STATS_ENABLED:
+            from agent.services.container_stats import ContainerStats
+
+            container_stats = ContainerStats(docker_manager.client, self.config)
+        with self._state_lock:
+            self.docker_manager = docker_manager
+            self.reconciler = reconciler
+            self.container_stats = container_stats
+            if hasattr(self.system_monitor, "containers"):
+                self.system_monitor.containers = container_stats
+            start_now = self.running
+        if start_now:
+            self._start_reconciler(reconciler)
+
+    def _start_reconciler(self, reconciler):
+        reconciler.start()
+        reconciler.wake()  # converge once at startup
+        self._watch("reconciler", reconciler.is_alive, self._restart_reconciler)
+
+    def _init_mqtt(self):
+        broker, port = self.config.MQTT_BROKER, self.config.MQTT_PORT
+        if self.config.GATEWAY_ENABLED:
+            from agent.services.mqtt_gateway import MqttGateway
+
+            # This agent shares the gateway's upstream connection too
+            self.gateway = MqttGateway(self.config).start()
+            broker, port = "127.0.0.1", self.gateway.port
 
-        # Initial tasks
-        self._perform_heartbeat()
-        self._perform_system_monitoring()
+        self._connect_mqtt(broker, port)
+        return "pending"  # ready once the broker accepts the connection
+
+    def _connect_mqtt(self, broker, port):
+        from agent.client.mqtt_client import MqttClient
+
+        self.mqtt_client = MqttClient(
+            broker=broker,
+            port=port,
+            topic_sub=self.config.MQTT_TOPIC_SUB,
+            topic_pub=self.config.MQTT_TOPIC_PUB,
+            on_message=self.handle_mqtt_message,
+            on_connect=self._on_mqtt_connect,
+        )
+        self.mqtt_client.start()
+        self._watch("mqtt", self.mqtt_client.is_alive, self._restart_mqtt)
+
+    def _restart_mqtt(self):
+        old = self.mqtt_client
+        old.stop()
+        self._connect_mqtt(old.broker, old.port)
+
+    def _restart_reconciler(self):
+        """Replace the reconciler, keeping the desired state it last saw"""
+        old = self.reconciler
+        old.stop()
+        reconciler = self._new_reconciler(old.docker_manager, old.poll_interval)
+        reconciler.desired = old.desired
+        with self._state_lock:
+            self.reconciler = reconciler
+        self._start_reconciler(reconciler)
+
+    def _new_reconciler(self, docker_manager, poll_interval):
+        reconciler = Reconciler(
+            self.backend_client, docker_manager, poll_interval=poll_interval
+        )
+        reconciler.apply_config = self.apply_runtime_config
+        if self.budget is not None:
+            reconciler.defer_pulls = lambda: self.budget.defer_pulls
+        return reconciler
+
+    def _watch(self, name, alive, restart):
+        """Have the watchdog restart a service whose thread died while running"""
+        if self.supervisor is not None:
+            self.supervisor.watch(name, lambda: not self.running or alive(), restart)
+
+    def _mqtt_connect_timed_out(self):
+        """Stop waiting for the broker so startup completes, degraded"""
+        if self._set_readiness("mqtt", "failed", only_from="pending"):
+            self.logger.warning(
+                f"MQTT broker not reachable within "
+                f"{self.config.MQTT_CONNECT_TIMEOUT:g}s, still retrying; "
+                "commands arrive via heartbeats meanwhile"
+            )
+
+    def _on_mqtt_connect(self):
+        self.mqtt_client.publish("Agent is online and ready to receive commands")
+        if self.readiness.get("mqtt") != "ready":
+            self._set_readiness("mqtt", "ready")
+
+    def start(self):
+        """Start the IoT Agent"""
+        self.logger.info("Starting IoT Agent...")
+        self.setup_signal_handlers()
+        if self.budget is not None:
+            lower_priority(self.config.BUDGET_NICE)
+        self.startup()
 
         # Main loop
         consecutive_errors = 0
         while self.running:
             try:
-                schedule.run_pending()
+                self.run_pending()
                 time.sleep(1)
                 consecutive_errors = 0  # Reset error counter on successful iteration
             except KeyboardInterrupt:
@@ -102,70 +366,361 @@ class IoTAgent:
                     f"Error in main loop (attempt {consecutive_errors}): {e}"
                 )
 
-                # If too many consecutive errors, wait longer
-                if consecutive_errors > Config.MAX_CONSECUTIVE_ERRORS:
+                # If too many consecutive errors, restart the services in place
+                # and only wait longer if that fails too
+                if consecutive_errors > self.config.MAX_CONSECUTIVE_ERRORS:
                     self.logger.warning(
-                        f"Too many consecutive errors, waiting {Config.ERROR_WAIT_TIME} seconds before retry"
+                        "Too many consecutive errors, restarting services in place"
                     )
-                    time.sleep(Config.ERROR_WAIT_TIME)
+                    try:
+                        self.restart()
+                        consecutive_errors = 0
+                    except Exception as e:
+                        self.logger.error(
+                            f"In-place restart failed: {e}, waiting {self.config.ERROR_WAIT_TIME} seconds before retry"
+                        )
+                        time.sleep(self.config.ERROR_WAIT_TIME)
                 else:
-                    time.sleep(Config.RETRY_DELAY)  # Wait before retrying
+                    time.sleep(self.config.RETRY_DELAY)  # Wait before retrying
+
+        self.shutdown()
+
+    def startup(self):
+        """Configure schedules and run the initial tasks, without a main loop"""
+        with self._state_lock:
+            self.running = True
+            reconciler = self.reconciler
+
+        # Log initial system info
+        try:
+            log_system_info(self.logger, self.config)
+        except Exception as e:
+            self.logger.warning(f"Could not log system info: {e}")
 
+        # Schedule tasks
+        self._setup_schedules()
+        if reconciler:
+            self._start_reconciler(reconciler)
+        # Hosted agents are checked by the AgentHost loop instead
+        if self.supervisor is not None and not self._hosted:
+            self.supervisor.start()
+
+        # Initial tasks run in the background so the main loop starts at once;
+        # services still initializing pick up their first run when ready
+        self._submit(self._perform_heartbeat, priority=HIGH)
+        if self.system_monitor:
+            self._run_in_background(self._perform_system_monitoring)
+
+    def shutdown(self):
+        """Final tasks once the agent has stopped"""
+        # Final heartbeat tells the backend we are going away and flushes
+        # acknowledgements for commands handled since the last heartbeat
+        self._perform_heartbeat(status="offline")
+        store = getattr(self.system_monitor, "store", None)
+        if store is not None:
+            store.flush()
+        if self.anomaly_detector is not None:
+            self.anomaly_detector.checkpoint()
+        if self.gateway is not None:
+            self.gateway.stop()
+        if not self._hosted:
+            self.executor.shutdown(wait=False)
+            if self._blocking_executor is not None:
+                self._blocking_executor.shutdown(wait=False)
         self.logger.info("IoT Agent stopped")
 
     def stop(self):
         """Stop the IoT Agent"""
         self.logger.info("Stopping IoT Agent...")
         self.running = False
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        if self.reconciler:
+            self.reconciler.stop()
+        if self.container_stats:
+            self.container_stats.close()
+        peers = getattr(self.docker_manager, "peers", None)
+        if peers is not None:
+            peers.stop()
+
+    def restart(self):
+        """Restart the agent's services in place.
+
+        Jobs are rescheduled, the backend client reconnects and the MQTT
+        client and reconciler are replaced, but unlike a process restart the
+        caches stay warm: desired state and its ETag, heartbeat deltas,
+        Docker state, metrics history, anomaly baselines and rules.
+        """
+        from agent.client.mqtt_client import MqttClient
+
+        self.logger.info("Restarting IoT Agent in place...")
+        for name in list(self._jobs):
+            self.scheduler.cancel(name)
+        self._jobs.clear()
+        self.backend_client.reconnect()
+        if isinstance(self.mqtt_client, MqttClient):
+            self._restart_mqtt()
+        if self.reconciler:
+            self._restart_reconciler()
+        self._setup_schedules()
+        self._submit(self._perform_heartbeat, priority=HIGH)
 
     def _setup_schedules(self):
         """Setup scheduled tasks"""
-        # Heartbeat
-        schedule.every(Config.HEARTBEAT_INTERVAL).seconds.do(self._perform_heartbeat)
+        # Heartbeat, system monitoring and sensor data. Monitoring is skipped
+        # while the system monitor is still starting up.
+        for name, interval in self._job_intervals().items():
+            self._schedule(name, interval)
 
-        # System monitoring (only if available)
-        if self.system_monitor:
-            schedule.every(Config.LOG_INTERVAL).seconds.do(
-                self._perform_system_monitoring
-            )
+        # Container updates are driven by the reconciler thread, which wakes on
+        # pushed desired-state changes and polls every UPDATE_CHECK_INTERVAL
+
+        self.logger.info("Scheduled tasks configured")
+
+    def _job_intervals(self) -> dict:
+        """Current interval of each scheduled job, in seconds"""
+        # Sampling slows down while the agent is over its CPU/network budget
+        slowdown = self.budget.slowdown if self.budget else 1
+        intervals = {
+            # The backend may also change the heartbeat cadence in its replies
+            "heartbeat": self.backend_client.heartbeat.interval,
+            # Adapts to the metrics, up to log_interval when they are stable
+            "monitoring": self.monitor_cadence.interval * slowdown,
+            "sensor": self.runtime_config.get("sensor_interval") * slowdown,
+        }
+        if self.budget:
+            intervals["budget"] = self.config.BUDGET_CHECK_INTERVAL
+        if self.code_sync:
+            intervals["code_sync"] = self.config.CODE_SYNC_INTERVAL
+        return intervals
+
+    def _schedule(self, name, interval):
+        # Heartbeats are the liveness signal: they go first and a late one is
+        # still sent. A late sample is dropped once it is half an interval
+        # late, the next one is closer. Code sync downloads and compiles, so
+        # it runs on the blocking executor.
+        jobs = {
+            "heartbeat": (self._perform_heartbeat, {"priority": HIGH}),
+            "monitoring": (
+                self._perform_system_monitoring,
+                {"missed": SKIP, "deadline": interval / 2},
+            ),
+            "sensor": (
+                self._send_sensor_data,
+                {"missed": SKIP, "deadline": interval / 2},
+            ),
+            "code_sync": (
+                self._sync_code,
+                {"priority": LOW, "missed": COALESCE, "blocking": True},
+            ),
+            "budget": (self._check_budget, {"priority": LOW, "missed": SKIP}),
+        }
+        func, policy = jobs[name]
+        task = self.scheduler.every(name, interval, func, **policy)
+        self._jobs[name] = (task, interval)
 
-        # Container updates (only if Docker is available)
-        if self.docker_manager:
-            schedule.every(Config.UPDATE_CHECK_INTERVAL).seconds.do(
-                self._check_and_update_version
+    def run_pending(self):
+        """Restart if a restart was requested, apply interval changes, then
+        run the jobs that are due"""
+        if self._restart_pending.is_set():
+            self._restart_pending.clear()
+            self.restart()
+        for name, interval in self._job_intervals().items():
+            if name in self._jobs and self._jobs[name][1] != interval:
+                self._schedule(name, interval)
+                self.logger.info(f"Rescheduled {name} every {interval:g}s")
+        self.scheduler.run_pending()
+
+    def _on_runtime_config_change(self, changed, settings):
+        """Push runtime config changes to the services that hold a copy.
+
+        Scheduled jobs pick up new intervals on the next ``run_pending``.
+        """
+        if "log_interval" in changed:
+            self.monitor_cadence.set_max_interval(changed["log_interval"])
+        if "monitor_deadband" in changed:
+            self.monitor_cadence.deadband = changed["monitor_deadband"]
+        if "heartbeat_interval" in changed:
+            self.backend_client.heartbeat.set_interval(changed["heartbeat_interval"])
+        if "update_check_interval" in changed and self.reconciler:
+            self.reconciler.poll_interval = changed["update_check_interval"]
+            self.reconciler.wake()
+
+    def apply_runtime_config(self, update) -> tuple:
+        """Apply a versioned runtime config update; returns (applied, reason)"""
+        applied, reason = self.runtime_config.apply(update)
+        if not applied:
+            self.logger.warning(f"Runtime config update not applied: {reason}")
+        return applied, reason
+
+    def query_metrics(self, request: str) -> dict:
+        """Answer a JSON metrics query against the local history.
+
+        ``{"metric": "cpu", "since": 3600, "agg": "max"}`` reads the last
+        hour; ``start``/``end`` (unix time), ``tier`` and ``limit`` are also
+        accepted, see ``MetricsStore.query``.
+        """
+        store = getattr(self.system_monitor, "store", None)
+        if store is None:
+            return {"error": "metrics history not available"}
+        try:
+            query = json.loads(request)
+            if not isinstance(query, dict):
+                raise ValueError("query must be an object")
+            if "since" in query:
+                query["start"] = time.time() - float(query.pop("since"))
+            return store.query(**query)
+        except (TypeError, ValueError) as e:
+            return {"error": f"invalid query: {e}"}
+
+    def _thresholds(self) -> dict:
+        return {
+            "cpu": self.runtime_config.get("cpu_threshold"),
+            "memory": self.runtime_config.get("memory_threshold"),
+            "disk": self.runtime_config.get("disk_threshold"),
+        }
+
+    def _run_task(self, task) -> bool:
+        """Start a due run of a scheduled task"""
+        return self._run_job(
+            task.func, task.priority, blocking=task.blocking, timeout=task.timeout
+        )
+
+    def _run_job(self, job, priority=NORMAL, blocking=False, timeout=None) -> bool:
+        """Run a job on the executor by priority; blocking jobs run on the
+        blocking executor. Returns False if skipped.
+
+        A job is skipped while its previous run is still in flight, so a slow
+        backend cannot pile up work for one device.
+        """
+        if self.supervisor is not None:
+            return self._run_supervised(job, priority, blocking, timeout)
+        name = job.__name__
+        if name in self._jobs_in_flight:
+            self.logger.debug(f"Skipping {name}, previous run still in progress")
+            return False
+        self._jobs_in_flight.add(name)
+        self._submit(
+            self._measured, job, priority=priority, blocking=blocking
+        ).add_done_callback(lambda future: self._job_done(name, future))
+        return True
+
+    def _job_deadline(self) -> float:
+        """How long a job may run before the watchdog abandons it. Jobs wait
+        on the backend, so by default a request retried to its limit, twice,
+        still fits."""
+        return (
+            self.config.WATCHDOG_JOB_DEADLINE
+            or 2 * self.backend_client.max_request_time()
+        )
+
+    def _run_supervised(self, job, priority, blocking, timeout) -> bool:
+        """Run a job off the main loop under the watchdog, which abandons it
+        and reconnects the backend client if it runs past its timeout"""
+        name = job.__name__
+        self.supervisor.job(
+            name,
+            timeout or self._job_deadline(),
+            restart=self.backend_client.reconnect,
+        )
+        run = self.supervisor.begin(name)
+        if run is None:
+            self.logger.debug(f"Skipping {name}, previous run still in progress")
+            return False
+
+        def supervised():
+            try:
+                self._measured(job)
+            except Exception as e:
+                self.logger.error(f"Scheduled job {name} failed: {e}")
+            finally:
+                self.supervisor.end(name, run)
+
+        self._submit(supervised, priority=priority, blocking=blocking)
+        return True
+
+    @property
+    def blocking_executor(self):
+        """Executor for slow jobs (downloads, image pulls, compiling), so they
+        never hold up heartbeats"""
+        if self._blocking_executor is None:
+            self._blocking_executor = ThreadPoolExecutor(
+                max_workers=self.config.SCHEDULER_BLOCKING_WORKERS,
+                thread_name_prefix="blocking",
             )
+        return self._blocking_executor
 
-        # Sensor data (every 10 seconds)
-        schedule.every(10).seconds.do(self._send_sensor_data)
+    def _submit(self, func, *args, priority=NORMAL, blocking=False):
+        """Start ``func`` on the right executor; returns its future"""
+        if blocking:
+            return self.blocking_executor.submit(func, *args)
+        if isinstance(self.executor, PriorityExecutor):
+            return self.executor.submit(func, *args, priority=priority)
+        return self.executor.submit(func, *args)
 
-        self.logger.info("Scheduled tasks configured")
+    def _measured(self, job):
+        if self.budget is None:
+            return job()
+        with self.budget.measure(job.__name__):
+            return job()
 
-    def _parse_version(self, version_str):
-        """Parse version string vX.Y to tuple (X, Y) for comparison"""
-        match = re.match(r"v?(\d+)\.(\d+)", str(version_str))
-        if match:
-            return int(match.group(1)), int(match.group(2))
-        return (0, 0)
+    def _check_budget(self):
+        """Measure the agent's own resource use and degrade while over budget"""
+        exceeded = self.budget.check()
+        for name in sorted(exceeded):
+            self.backend_client.send_log(
+                f"Agent over its {name} budget: {self.budget.usage}",
+                level="warning",
+                log_type="budget",
+            )
+        if "memory" in self.budget.over:
+            self._compact_buffers()
+        reconciler = self.reconciler
+        if (
+            reconciler
+            and reconciler.last_result == "deferred"
+            and not self.budget.defer_pulls
+        ):
+            reconciler.wake()  # pull what was deferred
+
+    def _compact_buffers(self):
+        """Release memory held by the agent's caches and buffers"""
+        parse_version.cache_clear()
+        if self.gateway is not None:
+            self.gateway.flush()
+        if self.docker_manager is not None:
+            self.docker_manager.invalidate_actual_state()
+        gc.collect()
+
+    def _job_done(self, name, future):
+        self._jobs_in_flight.discard(name)
+        if future.exception() is not None:
+            self.logger.error(f"Scheduled job {name} failed: {future.exception()}")
 
     def _check_and_update_version(self):
         """Check Docker Hub for new version and update if needed (auto, không phụ thuộc biến môi trường tag)"""
+        if self.budget is not None and self.budget.defer_pulls:
+            self.logger.info("Over the network budget, deferring the version update")
+            return
         try:
-            repo = os.getenv("DOCKER_IMAGE", Config.DOCKER_IMAGE)  # just repo, no tag
+            repo = self.config.DOCKER_IMAGE  # just repo, no tag
             if ":" in repo:
                 repo = repo.split(":")[0]
             namespace, image_name = repo.split("/")
 
+            import requests
+
             def get_latest_dockerhub_tag(namespace, repo):
                 url = f"https://hub.docker.com/v2/repositories/{namespace}/{repo}/tags?page_size=100"
                 try:
                     resp = requests.get(url, timeout=5)
-                    tags = [t["name"] for t in resp.json().get("results", [])]
-                    tags = [t for t in tags if re.match(r"v\d+\.\d+", t)]
-                    tags.sort(
-                        key=lambda x: tuple(map(int, re.findall(r"\d+", x))),
-                        reverse=True,
+                    traffic.add(
+                        "registry",
+                        sent=http_size(url, None, None),
+                        received=http_size("", resp.headers, resp.content),
                     )
-                    return tags[0] if tags else "v1.0"
+                    tags = (t["name"] for t in resp.json().get("results", []))
+                    return latest_tag(tags) or "v1.0"
                 except Exception:
                     return "v1.0"
 
@@ -179,8 +734,9 @@ class IoTAgent:
                 current_version = current_image.split(":")[-1]
             else:
                 current_version = "v1.0"
-            if self._parse_version(latest_version) > self._parse_version(
-                current_version
+            no_version = Version(0, 0)
+            if (parse_version(latest_version) or no_version) > (
+                image_version(current_image) or no_version
             ):
                 self.logger.info(
                     f"New version available: {latest_version} > {current_version}. Updating..."
@@ -192,15 +748,25 @@ class IoTAgent:
                 )
                 new_image = f"{repo}:{latest_version}"
                 success = False
-                if self.docker_manager is not None:
-                    # Pull new image
-                    self.docker_manager.client.images.pull(new_image)
-                    # Restart container with new image
-                    success = self.docker_manager.update_container()
-                else:
+                if self.docker_manager is None:
                     self.logger.error(
                         "Docker manager is not available. Cannot update container."
                     )
+                elif not self.docker_manager.pull_latest_image(new_image):
+                    # Nothing changed yet, so there is nothing to roll back
+                    self.logger.error(f"Could not pull {new_image}, not updating.")
+                    self.backend_client.send_log(
+                        f"Agent update to {latest_version} failed: could not pull "
+                        f"{new_image}.",
+                        level="error",
+                        log_type="deploy",
+                    )
+                    return
+                else:
+                    # Already pulled above
+                    success = self.docker_manager.update_container(
+                        image_tag=new_image, pull=False
+                    )
                 if success:
                     self.logger.info(f"Agent updated to {latest_version} successfully.")
                     self.backend_client.send_log(
@@ -245,19 +811,85 @@ class IoTAgent:
                 log_type="rollback",
             )
 
-    def _perform_heartbeat(self):
+    def _sync_code(self) -> bool:
+        """Install a new agent code release, then stop so main() restarts"""
+        if not self.code_sync or not self.code_sync.update():
+            return False
+        version = self.code_sync.installed().get("version")
+        self.backend_client.send_log(
+            f"Agent code updated to {version}, restarting.",
+            level="info",
+            log_type="deploy",
+        )
+        self.restart_requested = True
+        self.stop()
+        return True
+
+    def _perform_heartbeat(self, status: str = "online"):
         """Perform heartbeat operation"""
         try:
-            version = Config.DOCKER_IMAGE
-            status = "online"
-            success = self.backend_client.send_heartbeat(version=version, status=status)
+            version = self._image_tag()
+            success = self.backend_client.send_heartbeat(
+                version=version, status=status, extra=self._startup_report()
+            )
             if success:
                 self.logger.debug("Heartbeat sent successfully")
+                if "first_heartbeat" not in self.startup_times:
+                    self._mark_startup("first_heartbeat")
+                if self.running:
+                    self._process_heartbeat_reply()
             else:
                 self.logger.warning("Failed to send heartbeat")
         except Exception as e:
             self.logger.error(f"Error during heartbeat: {e}")
 
+    def _image_tag(self) -> str:
+        """Image the managed container actually runs, else the configured one"""
+        if self.docker_manager is not None:
+            state = self.docker_manager.get_actual_state()
+            if state.get("image"):
+                return state["image"]
+        return self.config.DOCKER_IMAGE
+
+    def _startup_report(self) -> dict:
+        """Readiness and startup timings carried in the heartbeat state"""
+        return {
+            "readiness": self.get_readiness(),
+            "services": dict(self.readiness),
+            "startup_time": self.startup_times.get("ready"),
+            "config_version": self.runtime_config.version,
+        }
+
+    def _process_heartbeat_reply(self):
+        """Run commands and desired-state changes piggybacked on the heartbeat ack"""
+        tracker = self.backend_client.heartbeat
+        update = tracker.take_runtime_config()
+        if update is not None:
+            self.apply_runtime_config(update)
+
+        for command in tracker.take_commands():
+            self.logger.info(f"Received command via heartbeat: {command}")
+            # Ack first so a restart command is not redelivered after restarting
+            tracker.ack_command(command.get("id"))
+            self.handle_command(
+                str(command.get("command", "")), reply=self._reply_via_backend
+            )
+
+        diff = tracker.take_desired_diff()
+        if diff:
+            self._apply_desired_state(diff)
+
+    def _reply_via_backend(self, message: str):
+        self.backend_client.send_log(message, level="info", log_type="status")
+
+    def _apply_desired_state(self, diff: dict):
+        """Hand desired-state changes received from the backend to the reconciler"""
+        self.logger.info(f"Desired state changed: {diff}")
+        if self.reconciler is None:
+            self.logger.warning("Reconciler not available, ignoring desired state")
+            return
+        self.reconciler.notify(self.backend_client.heartbeat.desired_state)
+
     def _perform_system_monitoring(self):
         """Perform system monitoring"""
         if not self.system_monitor:
@@ -266,45 +898,101 @@ class IoTAgent:
 
         try:
             # Get system health
-            health = self.system_monitor.get_health_status()
+            thresholds = self._thresholds()
+            health = self.system_monitor.get_health_status(thresholds)
+
+            # The cadence picks the next interval and filters out metrics that
+            # stayed within the deadband since they were last reported
+            changed = {}
+            values = {
+                name: check["value"] for name, check in health.get("checks", {}).items()
+            }
+            if values:
+                changed = self.monitor_cadence.observe(values, thresholds)
+            status_changed = health["status"] != self._health_status
+            self._health_status = health["status"]
 
-            # Send system info to backend
-            if "system_info" in health:
-                system_info = health["system_info"]
+            # Send changed system info to backend
+            if changed or status_changed:
+                labels = {"cpu": "CPU", "memory": "Memory", "disk": "Disk"}
+                metrics = ", ".join(
+                    f"{labels.get(name, name)}: {value}%"
+                    for name, value in changed.items()
+                )
+                summary = f"System health: {health['status']}"
                 self.backend_client.send_log(
-                    f"System health: {health['status']}, "
-                    f"CPU: {system_info['cpu']['percent']}%, "
-                    f"Memory: {system_info['memory']['percent']}%, "
-                    f"Disk: {system_info['disk']['percent']}%"
+                    f"{summary}, {metrics}" if metrics else summary
                 )
 
-            # Check for alerts
-            alerts = self.system_monitor.check_alerts()
-            for alert in alerts:
-                self.backend_client.send_log(alert["message"], alert["level"])
+            # Alerts are evaluated on every sample but only sent when they
+            # start firing, remind, or resolve
+            for alert in self.alert_manager.evaluate(health):
+                self.backend_client.send_log(
+                    alert["message"], alert["level"], log_type="alert"
+                )
+            self._report_anomalies(values)
 
         except Exception as e:
             self.logger.error(f"Error during system monitoring: {e}")
 
     def _send_sensor_data(self):
-        """Send simulated sensor data via MQTT."""
+        """Evaluate edge rules on a sensor sample and send it via MQTT."""
+        data = self.sensor_simulator.get_data()
+        for event in self.rule_engine.evaluate(data):
+            self._handle_rule_event(event)
+        self._report_anomalies({f"sensor/{name}": v for name, v in data.items()})
+
+        if not self.config.SENSOR_PUBLISH_RAW:
+            return
         if not hasattr(self, "mqtt_client") or self.mqtt_client is None:
             self.logger.warning("MQTT client not available, skipping sensor data send")
             return
-        data = self.sensor_simulator.get_data()
         self.logger.info(f"Publishing sensor data: {data}")
         self.mqtt_client.publish(f"SENSOR:{data}")
 
+    def _report_anomalies(self, values: dict):
+        """Run the anomaly detectors over a sample and report new anomalies"""
+        if self.anomaly_detector is None:
+            return
+        for anomaly in self.anomaly_detector.observe(values):
+            self.logger.warning(anomaly["message"])
+            self.backend_client.send_log(
+                anomaly["message"], "warning", log_type="anomaly"
+            )
+
+    def _handle_rule_event(self, event: dict):
+        """Publish a rule event, or run the rule's command locally"""
+        action = event["action"]
+        if action != "publish":
+            self.logger.info(f"Rule {event['rule']} matched, running {action}")
+            self.handle_command(action["command"])
+            return
+        self.logger.info(f"Rule {event['rule']} matched: {event['observed']}")
+        if self.mqtt_client:
+            self.mqtt_client.publish(f"EVENT:{json.dumps(event)}")
+        else:
+            self.backend_client.send_log(
+                f"Rule {event['rule']} matched on {event['sensor']}: "
+                f"{event['observed']}",
+                "warning",
+                log_type="event",
+            )
+
     def get_status(self) -> dict:
         """Get agent status"""
         try:
             status = {
                 "agent_running": self.running,
                 "config": {
-                    "device_name": Config.DEVICE_NAME,
-                    "device_id": Config.DEVICE_ID,
-                    "backend_url": Config.BACKEND_URL,
+                    "device_name": self.config.DEVICE_NAME,
+                    "device_id": self.config.DEVICE_ID,
+                    "backend_url": self.config.BACKEND_URL,
                 },
+                "backend_circuit": self.backend_client.breaker.state,
+                "readiness": self.get_readiness(),
+                "services": dict(self.readiness),
+                "startup_times": dict(self.startup_times),
+                "runtime_config": self.runtime_config.snapshot(),
             }
 
             # Add Docker status if available
@@ -315,10 +1003,27 @@ class IoTAgent:
                 except Exception as e:
                     status["container_status"] = {"error": str(e)}
 
+            if self.reconciler:
+                status["reconciler"] = self.reconciler.get_status()
+
+            status["alerts"] = self.alert_manager.active()
+            status["traffic"] = traffic.snapshot()
+            if self.gateway:
+                status["gateway"] = self.gateway.get_status()
+            if self.code_sync:
+                status["code"] = self.code_sync.get_status()
+            if self.supervisor:
+                status["watchdog"] = self.supervisor.get_status()
+            if self.budget:
+                status["budget"] = self.budget.get_status()
+            status["scheduler"] = self.scheduler.get_status()
+
             # Add system health if available
             if self.system_monitor:
                 try:
-                    system_health = self.system_monitor.get_health_status()
+                    system_health = self.system_monitor.get_health_status(
+                        self._thresholds()
+                    )
                     status["system_health"] = system_health
                 except Exception as e:
                     status["system_health"] = {"error": str(e)}
@@ -331,18 +1036,70 @@ class IoTAgent:
 
     def handle_mqtt_message(self, topic, payload):
         self.logger.info(f"Received MQTT message: {payload} on topic: {topic}")
+        reply = self.mqtt_client.publish if self.mqtt_client else None
+        self.handle_command(payload, reply=reply)
+
+    def handle_command(self, payload: str, reply=None):
+        """Handle a command received over MQTT or piggybacked on a heartbeat.
+
+        ``reply`` publishes a response on the channel the command came from.
+        """
         if payload == "update":
-            self.logger.info("Received update command via MQTT")
-            self._check_and_update_version()
+            self.logger.info("Received update command")
+            self._submit(self._check_and_update_version, blocking=True)
+        elif payload == "code-update":
+            self.logger.info("Received code update command")
+
+            def code_update():
+                updated = self._sync_code()
+                if reply:
+                    reply(json.dumps({"code_updated": updated}))
+
+            self._submit(code_update, blocking=True)
+        elif payload == "reconcile":
+            self.logger.info("Received reconcile command")
+            if self.reconciler:
+                self.reconciler.wake()
         elif payload == "restart":
-            self.logger.info("Received restart command via MQTT")
-            self.stop()
+            # Commands arrive on the MQTT network thread, which the restart
+            # replaces, so the scheduling loop restarts the agent instead
+            self.logger.info("Received restart command")
+            self._restart_pending.set()
+        elif payload.startswith("config "):
+            self.logger.info("Received runtime config update")
+            try:
+                applied, reason = self.apply_runtime_config(json.loads(payload[7:]))
+            except ValueError as e:
+                applied, reason = False, f"invalid JSON: {e}"
+            if reply:
+                reply(
+                    json.dumps(
+                        {
+                            "config_applied": applied,
+                            "reason": reason,
+                            "version": self.runtime_config.version,
+                        }
+                    )
+                )
+        elif payload.startswith("rules "):
+            self.logger.info("Received rules update")
+            try:
+                self.rule_engine.load(json.loads(payload[6:]))
+                result = {"rules_applied": True, "count": len(self.rule_engine.rules)}
+            except ValueError as e:
+                result = {"rules_applied": False, "reason": str(e)}
+            if reply:
+                reply(json.dumps(result))
+        elif payload.startswith("metrics "):
+            self.logger.info("Received metrics query")
+            if reply:
+                reply(json.dumps(self.query_metrics(payload[8:])))
         elif payload == "status":
-            self.logger.info("Received status command via MQTT")
-            if self.mqtt_client:
-                self.mqtt_client.publish(str(self.get_status()))
+            self.logger.info("Received status command")
+            if reply:
+                reply(str(self.get_status()))
         else:
-            self.logger.info(f"Unknown MQTT command: {payload}")
+            self.logger.info(f"Unknown command: {payload}")
 
 
 def main():
@@ -353,6 +1110,8 @@ def main():
     except Exception as e:
         print(f"Failed to start IoT Agent: {e}")
         sys.exit(1)
+    if agent.restart_requested:
+        restart_in_place()
 
 
 if __name__ == "__main__":
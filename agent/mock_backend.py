@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Local mock of the backend API for tests and transport benchmarks.
+
+Run standalone to compare the HTTP transports against it:
+    python -m agent.mock_backend --requests 500
+"""
+
+import argparse
+import gzip
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from agent.client.heartbeat import PROTOCOL_KEYS, state_hash
+
+Response = Tuple[int, Optional[Dict], Dict[str, str]]
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.backend._on_connection()
+
+    def log_message(self, format, *args):
+        pass  # keep test and benchmark output quiet
+
+    def _read_body(self) -> Optional[Dict]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return json.loads(raw)
+
+    def _dispatch(self, method: str):
+        body = self._read_body()
+        status, payload, headers = self.server.backend._handle(
+            method, self.path, body, dict(self.headers)
+        )
+        raw = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if raw:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        if raw:
+            self.wfile.write(raw)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+class MockBackend:
+    """In-process stand-in for the backend API.
+
+    Records every request (only the last ``max_requests`` if set, for long
+    load runs), counts TCP connections and lets tests override responses per
+    route or inject failures.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        max_requests: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.requests: Deque[Dict] = deque(maxlen=max_requests)
+        self.connections = 0
+        self.routes: Dict[Tuple[str, str], Callable] = {}
+        self.devices: Dict[str, Dict] = {}  # heartbeat state by device name
+        self.heartbeat_reply: Dict = {}  # extra fields merged into heartbeat acks
+        self.commands: List[Dict] = []  # redelivered in heartbeat acks until acked
+        self.desired_state: Dict = {}  # served by /device/{id}/updates with an ETag
+        self._failures: List[Response] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _MockHandler)
+        self._server.daemon_threads = True
+        self._server.backend = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockBackend":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, method: str, path_pattern: str, handler: Callable):
+        """Override a route; handler(body, headers) returns (status, body, headers)"""
+        self.routes[(method, path_pattern)] = handler
+
+    def fail_next(self, count: int, status: int = 503, headers=None):
+        """Answer the next ``count`` requests with an error status"""
+        with self._lock:
+            self._failures.extend([(status, None, headers or {})] * count)
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self._failures.clear()
+            self.connections = 0
+
+    def _on_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def _handle(self, method, path, body, headers) -> Response:
+        if path.startswith("/api/"):
+            path = path[len("/api") :]
+        with self._lock:
+            self.requests.append(
+                {"method": method, "path": path, "body": body, "headers": headers}
+            )
+            failure = self._failures.pop(0) if self._failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if failure:
+            return failure
+
+        for (route_method, pattern), handler in self.routes.items():
+            if route_method == method and re.fullmatch(pattern, path):
+                return handler(body, headers)
+
+        if method == "POST" and path == "/device/heartbeat":
+            return 200, self._heartbeat(body or {}), {}
+        if method == "POST" and path in ("/logs", "/device"):
+            return 200, {"status": "ok"}, {}
+        if method == "GET" and re.fullmatch(r"/device/\d+/status", path):
+            return 200, {"status": "online"}, {}
+        if method == "GET" and re.fullmatch(r"/device/\d+/updates", path):
+            etag = f'"{state_hash(self.desired_state)}"'
+            if headers.get("If-None-Match") == etag:
+                return 304, None, {"ETag": etag}
+            return 200, self.desired_state, {"ETag": etag}
+        if method == "GET" and path == "/devices":
+            return 200, [], {}
+        return 404, {"detail": "Not Found"}, {}
+
+    def _heartbeat(self, body: Dict) -> Dict:
+        """Apply a full or delta heartbeat and acknowledge the resulting hash"""
+        name = body.get("name")
+        fields = {k: v for k, v in body.items() if k not in PROTOCOL_KEYS}
+        with self._lock:
+            acked = body.get("acked_commands") or []
+            self.commands = [c for c in self.commands if c.get("id") not in acked]
+            known = self.devices.get(name)
+            if "base_hash" in body:
+                if not known or known["hash"] != body["base_hash"]:
+                    return {"status": "ok", "resync": True}
+                state = dict(known["state"])
+                for key in body.get("removed", []):
+                    state.pop(key, None)
+                state.update(fields)
+            else:
+                state = fields
+            current = state_hash(state)
+            self.devices[name] = {"state": state, "hash": current}
+            reply = {"status": "ok", "state_hash": current}
+            if self.commands:
+                reply["commands"] = list(self.commands)
+            reply.update(self.heartbeat_reply)
+            return reply
+
+
+def _benchmark_transport(name: str, transport, backend: MockBackend, count: int):
+    from agent.client.backend_client import BackendClient
+
+    client = BackendClient(transport=transport)
+    client.base_url = backend.url
+    backend.reset()
+    start = time.perf_counter()
+    for i in range(count):
+        if i % 2:
+            client.send_log("benchmark log line " * 8)
+        else:
+            client.send_heartbeat(status="online")
+    elapsed = time.perf_counter() - start
+    client.close()
+    print(
+        f"{name:<18} {count / elapsed:8.1f} req/s  "
+        f"{elapsed / count * 1000:6.2f} ms/req  "
+        f"{backend.connections} connection(s)"
+    )
+
+
+def main():
+    from agent.client import transport as transports
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--serve", type=int, metavar="PORT", help="only serve")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        backend = MockBackend(port=args.serve, latency=args.latency)
+        print(f"Mock backend listening on {backend.url}")
+        backend._server.serve_forever()
+        return
+
+    with MockBackend(latency=args.latency) as backend:
+        _benchmark_transport(
+            "requests",
+            transports.RequestsTransport(5, 30),
+            backend,
+            args.requests,
+        )
+        _benchmark_transport(
+            "requests+gzip",
+            transports.RequestsTransport(5, 30, compress_min_bytes=128),
+            backend,
+            args.requests,
+        )
+        if transports.httpx is not None:
+            _benchmark_transport(
+                "httpx", transports.HttpxTransport(5, 30), backend, args.requests
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent.config import Config
+
+logger = logging.getLogger("iot_agent")
+
+# Settings that may change while the agent runs: name -> (minimum, maximum)
+RUNTIME_SETTINGS: Dict[str, Tuple[float, float]] = {
+    "heartbeat_interval": (1, 86400),
+    "log_interval": (1, 86400),
+    "sensor_interval": (1, 86400),
+    "update_check_interval": (10, 86400),
+    "cpu_threshold": (1, 100),
+    "memory_threshold": (1, 100),
+    "disk_threshold": (1, 100),
+    "monitor_deadband": (0, 100),
+}
+
+
+def initial_settings(config=None) -> Dict[str, float]:
+    """Runtime settings as configured at startup"""
+    config = config or Config
+    return {
+        "heartbeat_interval": float(config.HEARTBEAT_INTERVAL),
+        "log_interval": float(config.LOG_INTERVAL),
+        "sensor_interval": float(config.SENSOR_INTERVAL),
+        "update_check_interval": float(config.UPDATE_CHECK_INTERVAL),
+        "cpu_threshold": float(config.CPU_THRESHOLD),
+        "memory_threshold": float(config.MEMORY_THRESHOLD),
+        "disk_threshold": float(config.DISK_THRESHOLD),
+        "monitor_deadband": float(config.MONITOR_DEADBAND),
+    }
+
+
+def validate_settings(changes: Dict[str, Any]) -> Dict[str, float]:
+    """Check a batch of setting changes; raises ValueError on the first bad one"""
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("settings must be a non-empty object")
+    validated = {}
+    for name, value in changes.items():
+        if name not in RUNTIME_SETTINGS:
+            raise ValueError(f"unknown setting '{name}'")
+        if isinstance(value, bool):
+            raise ValueError(f"{name} must be a number")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a number") from None
+        minimum, maximum = RUNTIME_SETTINGS[name]
+        if not minimum <= number <= maximum:
+            raise ValueError(f"{name}={number} outside [{minimum}, {maximum}]")
+        validated[name] = number
+    return validated
+
+
+Listener = Callable[[Dict[str, float], Dict[str, float]], None]
+
+
+class RuntimeConfig:
+    """Versioned runtime settings, updated atomically while the agent runs.
+
+    An update is ``{"version": N, "settings": {...}}``. It is applied only if
+    ``N`` is newer than the current version and every setting validates;
+    otherwise nothing changes. Listeners are called with ``(changed,
+    settings)`` after the swap. If one raises, the previous settings are
+    restored and the listeners are called again to undo the change.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, float]] = None):
+        self.version = 0
+        self._settings = dict(settings or initial_settings())
+        self._listeners: List[Listener] = []
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> float:
+        return self._settings[name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"version": self.version, "settings": dict(self._settings)}
+
+    def add_listener(self, listener: Listener):
+        self._listeners.append(listener)
+
+    def apply(self, update: Dict[str, Any]) -> Tuple[bool, str]:
+        """Apply an update; returns (applied, reason)"""
+        if not isinstance(update, dict):
+            return False, "update must be an object"
+        version = update.get("version")
+        if not isinstance(version, int) or isinstance(version, bool):
+            return False, "update needs an integer version"
+        try:
+            changes = validate_settings(update.get("settings"))
+        except ValueError as e:
+            logger.warning(f"Rejected runtime config v{version}: {e}")
+            return False, str(e)
+
+        with self._lock:
+            if version <= self.version:
+                return False, f"version {version} is not newer than {self.version}"
+            previous = dict(self._settings)
+            previous_version = self.version
+            changed = {
+                name: value
+                for name, value in changes.items()
+                if previous[name] != value
+            }
+            self._settings.update(changes)
+            self.version = version
+            settings = dict(self._settings)
+            try:
+                self._notify(changed, settings)
+            except Exception as e:
+                logger.error(f"Runtime config v{version} failed to apply: {e}")
+                self._settings = previous
+                self.version = previous_version
+                undo = {name: previous[name] for name in changed}
+                try:
+                    self._notify(undo, dict(previous))
+                except Exception as undo_error:
+                    logger.error(f"Restoring runtime config failed: {undo_error}")
+                return False, f"apply failed: {e}"
+
+        logger.info(f"Applied runtime config v{version}: {changed or 'no changes'}")
+        return True, "applied"
+
+    def _notify(self, changed: Dict[str, float], settings: Dict[str, float]):
+        if not changed:
+            return
+        for listener in self._listeners:
+            listener(changed, settings)
@@ -0,0 +1,84 @@
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger("iot_agent")
+
+
+class AdaptiveCadence:
+    """Monitoring interval and change filter driven by the metrics themselves.
+
+    Each ``observe`` call records one sample of percentage metrics. While a
+    metric moves by more than ``deadband`` between samples, or sits within
+    ``margin`` of its threshold, the interval drops to ``min_interval``;
+    otherwise it doubles per stable sample up to ``max_interval``.
+
+    Only metrics that moved at least ``deadband`` since they were last
+    reported are returned for sending, with a full report at least every
+    ``full_report_interval`` seconds so the backend never drifts far.
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        deadband: float = 2.0,
+        margin: float = 10.0,
+        full_report_interval: float = 3600,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.deadband = deadband
+        self.margin = margin
+        self.full_report_interval = full_report_interval
+        self.interval = self.min_interval  # start fast, back off once stable
+        self._previous: Optional[Dict[str, float]] = None
+        self._reported: Dict[str, float] = {}
+        self._full_report_at: Optional[float] = None
+
+    def set_max_interval(self, max_interval: float):
+        self.max_interval = max(max_interval, self.min_interval)
+        self.interval = min(self.interval, self.max_interval)
+
+    def observe(
+        self,
+        values: Dict[str, float],
+        thresholds: Dict[str, float],
+        now: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """Record a sample, adjust ``interval`` and return the values to report"""
+        now = time.monotonic() if now is None else now
+        previous = self._previous or values
+        volatile = any(
+            abs(value - previous.get(name, value)) > self.deadband
+            for name, value in values.items()
+        )
+        near_threshold = any(
+            value >= thresholds[name] - self.margin
+            for name, value in values.items()
+            if name in thresholds
+        )
+        if volatile or near_threshold:
+            if self.interval != self.min_interval:
+                logger.debug(f"Monitoring every {self.min_interval:g}s")
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        self._previous = dict(values)
+
+        full_report = (
+            self._full_report_at is None
+            or now - self._full_report_at >= self.full_report_interval
+        )
+        if full_report:
+            self._full_report_at = now
+            report = dict(values)
+        else:
+            report = {
+                name: value
+                for name, value in values.items()
+                if name not in self._reported
+                or abs(value - self._reported[name]) >= self.deadband
+            }
+        self._reported.update(report)
+        return report
@@ -0,0 +1,225 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from agent.config import Config
+
+logger = logging.getLogger("iot_agent")
+
+LABELS = {
+    "cpu": "CPU",
+    "memory": "memory",
+    "disk": "disk",
+    "monitor": "system monitoring",
+}
+
+# Evaluations a check may be missing from the health status (e.g. its
+# container was removed) before its alert is resolved
+STALE_EVALUATIONS = 3
+
+
+def _label(key: str) -> str:
+    """Readable name of a check: ``container/web/cpu`` -> ``CPU (container web)``"""
+    if key.startswith("container/"):
+        _, name, metric = key.split("/", 2)
+        return f"{LABELS.get(metric, metric)} (container {name})"
+    return LABELS.get(key, key)
+
+
+class AlertManager:
+    """Stateful alerts for the health checks of ``SystemMonitor``.
+
+    A check raises an alert once its value has stayed at or above the
+    threshold for ``ALERT_MIN_DURATION`` seconds, and clears only when it
+    drops ``ALERT_HYSTERESIS`` points below the threshold. While an alert
+    fires, further breaches are counted rather than sent, with a reminder
+    every ``ALERT_REPEAT_INTERVAL`` seconds, and a resolved event is sent
+    when it clears. At most ``ALERT_RATE_LIMIT`` firing events are sent per
+    ``ALERT_RATE_WINDOW`` seconds; the next one sent notes how many were
+    suppressed. A suppressed event is retried on the next evaluation, and
+    an alert that was never sent gets no resolved event. An alert whose
+    check stops being reported is resolved after ``STALE_EVALUATIONS``
+    evaluations without it.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or Config
+        self.hysteresis = self.config.ALERT_HYSTERESIS
+        self.min_duration = self.config.ALERT_MIN_DURATION
+        self.repeat_interval = self.config.ALERT_REPEAT_INTERVAL
+        self.rate_limit = self.config.ALERT_RATE_LIMIT
+        self.rate_window = self.config.ALERT_RATE_WINDOW
+        self.suppressed = 0
+        self._alerts: Dict[str, Dict[str, Any]] = {}  # check name -> alert state
+        self._sent = deque()  # times of recent rate-limited events
+
+    def evaluate(
+        self, health: Dict[str, Any], now: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Update alert states from a health status; returns the events to send"""
+        now = time.time() if now is None else now
+        events = []
+        error = health.get("status") == "error"
+        events += self._update(
+            "monitor",
+            error,
+            now,
+            level="ERROR",
+            message=f"System monitoring error: {health.get('message', 'Unknown error')}",
+            min_duration=0,
+        )
+        for name, check in health.get("checks", {}).items():
+            value, threshold = check["value"], check["threshold"]
+            alert = self._alerts.get(name)
+            if alert is not None and alert["state"] == "firing":
+                breached = value > threshold - self.hysteresis
+            else:
+                breached = value >= threshold
+            events += self._update(
+                name,
+                breached,
+                now,
+                level="WARNING",
+                message=f"High {_label(name)} usage: {value}% "
+                f"(threshold {threshold:g}%)",
+                value=value,
+                threshold=threshold,
+            )
+        seen = {"monitor", *health.get("checks", {})}
+        for key in [key for key in self._alerts if key not in seen]:
+            alert = self._alerts[key]
+            alert["missed"] += 1
+            if alert["missed"] >= STALE_EVALUATIONS:
+                events += self._expire(key, now)
+        return events
+
+    def active(self) -> List[Dict[str, Any]]:
+        """Alerts currently firing"""
+        return [
+            {
+                "key": key,
+                "since": alert["since"],
+                "count": alert["count"],
+                "value": alert["value"],
+            }
+            for key, alert in self._alerts.items()
+            if alert["state"] == "firing"
+        ]
+
+    def _update(
+        self,
+        key,
+        breached,
+        now,
+        level,
+        message,
+        value=None,
+        threshold=None,
+        min_duration=None,
+    ) -> List[Dict[str, Any]]:
+        alert = self._alerts.get(key)
+        if not breached:
+            if alert is None:
+                return []
+            del self._alerts[key]
+            if alert["last_sent"] is None:
+                return []  # cleared before it fired, or while rate limited
+            if value is not None:
+                alert["value"] = value
+            label = _label(key)
+            recovered = f": {value}%" if value is not None else ""
+            # Resolved events are never rate limited, so no alert stays open
+            return [
+                self._event(
+                    key,
+                    "resolved",
+                    "INFO",
+                    f"{label[0].upper()}{label[1:]} back to normal{recovered} after "
+                    f"{now - alert['since']:.0f}s",
+                    alert,
+                    now,
+                )
+            ]
+
+        if alert is None:
+            alert = {
+                "state": "pending",
+                "since": now,
+                "count": 0,
+                "last_sent": None,
+                "held": False,  # an event held back by the rate limit
+            }
+            self._alerts[key] = alert
+        alert["count"] += 1
+        alert["missed"] = 0
+        alert["value"] = value
+        alert["threshold"] = threshold
+
+        if min_duration is None:
+            min_duration = self.min_duration
+        if alert["state"] == "pending":
+            if now - alert["since"] < min_duration:
+                return []
+            alert["state"] = "firing"
+        elif (
+            alert["last_sent"] is not None
+            and not alert["held"]
+            and now - alert["last_sent"] < self.repeat_interval
+        ):
+            return []  # deduplicated: counted, not sent
+
+        if not self._allow(now):
+            # Retried on the next evaluation, counted once
+            if not alert["held"]:
+                alert["held"] = True
+                self.suppressed += 1
+                logger.debug(f"Alert '{key}' suppressed by rate limit")
+            return []
+        alert["last_sent"] = now
+        alert["held"] = False
+        if alert["count"] > 1:
+            message += f", {alert['count']} checks over {now - alert['since']:.0f}s"
+        if self.suppressed:
+            message += f" ({self.suppressed} alerts suppressed)"
+            self.suppressed = 0
+        return [self._event(key, "firing", level, message, alert, now)]
+
+    def _expire(self, key, now) -> List[Dict[str, Any]]:
+        """Resolve the alert of a check that is no longer reported"""
+        alert = self._alerts.pop(key)
+        if alert["last_sent"] is None:
+            return []
+        label = _label(key)
+        return [
+            self._event(
+                key,
+                "resolved",
+                "INFO",
+                f"{label[0].upper()}{label[1:]} no longer reported, resolved after "
+                f"{now - alert['since']:.0f}s",
+                alert,
+                now,
+            )
+        ]
+
+    def _allow(self, now) -> bool:
+        while self._sent and now - self._sent[0] >= self.rate_window:
+            self._sent.popleft()
+        if len(self._sent) >= self.rate_limit:
+            return False
+        self._sent.append(now)
+        return True
+
+    def _event(self, key, state, level, message, alert, now) -> Dict[str, Any]:
+        return {
+            "key": key,
+            "state": state,
+            "level": level,
+            "message": message,
+            "value": alert["value"],
+            "threshold": alert["threshold"],
+            "count": alert["count"],
+            "since": alert["since"],
+            "timestamp": now,
+        }
@@ -0,0 +1,232 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from agent.config import Config
+
+logger = logging.getLogger("iot_agent")
+
+DAY = 86400
+
+
+class Ewma:
+    """Exponentially weighted mean and variance of one stream.
+
+    Constant memory: each sample updates the mean and variance in place
+    (West's incremental form), so old samples fade with weight
+    ``(1 - alpha) ** age``.
+    """
+
+    __slots__ = ("alpha", "mean", "var", "count")
+
+    def __init__(self, alpha: float, mean=None, var=0.0, count=0):
+        self.alpha = alpha
+        self.mean = mean
+        self.var = var
+        self.count = count
+
+    def score(self, value: float, min_std: float) -> Optional[float]:
+        """Z-score of ``value`` against the current mean and deviation"""
+        if self.mean is None:
+            return None
+        return (value - self.mean) / max(math.sqrt(self.var), min_std)
+
+    def update(self, value: float):
+        self.count += 1
+        if self.mean is None:
+            self.mean = value
+            return
+        diff = value - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.var = (1 - self.alpha) * (self.var + diff * increment)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"mean": self.mean, "var": self.var, "count": self.count}
+
+
+class StreamDetector:
+    """EWMA z-score detector with an optional seasonal baseline.
+
+    The seasonal baseline keeps one ``Ewma`` per slot of the day (``buckets``
+    of them), so a value is only anomalous if it is unusual both recently
+    and for this time of day, once that slot has seen ``warmup`` samples.
+    """
+
+    def __init__(
+        self,
+        alpha: float,
+        threshold: float,
+        warmup: int,
+        min_std: float,
+        buckets: int = 0,
+        seasonal_alpha: float = 0.1,
+    ):
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.recent = Ewma(alpha)
+        self.seasonal = [Ewma(seasonal_alpha) for _ in range(buckets)]
+        self.anomalous = False
+
+    def observe(self, value: float, ts: float) -> Optional[Dict[str, Any]]:
+        """Score and learn one sample; returns the scores when it is anomalous"""
+        z = None
+        if self.recent.count >= self.warmup:
+            z = self.recent.score(value, self.min_std)
+        slot = None
+        seasonal_z = None
+        if self.seasonal:
+            slot = self.seasonal[int(ts % DAY * len(self.seasonal) // DAY)]
+            if slot.count >= self.warmup:
+                seasonal_z = slot.score(value, self.min_std)
+
+        anomalous = (
+            z is not None
+            and abs(z) > self.threshold
+            and (seasonal_z is None or abs(seasonal_z) > self.threshold)
+        )
+        baseline = self.recent.mean
+        self.recent.update(value)
+        if slot is not None:
+            slot.update(value)
+        # Report once when a stream turns anomalous, not on every sample
+        rising = anomalous and not self.anomalous
+        self.anomalous = anomalous
+        if not rising:
+            return None
+        return {
+            "zscore": round(z, 2),
+            "seasonal_zscore": None if seasonal_z is None else round(seasonal_z, 2),
+            "baseline": round(baseline, 2),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "recent": self.recent.to_dict(),
+            "seasonal": [slot.to_dict() for slot in self.seasonal],
+        }
+
+    def restore(self, state: Dict[str, Any]):
+        self.recent = Ewma(self.recent.alpha, **state["recent"])
+        seasonal = state.get("seasonal") or []
+        if len(seasonal) == len(self.seasonal):
+            self.seasonal = [
+                Ewma(slot.alpha, **saved)
+                for slot, saved in zip(self.seasonal, seasonal)
+            ]
+
+
+class AnomalyDetector:
+    """Streaming anomaly detection over named metric streams.
+
+    Streams (``cpu``, ``container/web/memory``, ``sensor/temperature``) get
+    a ``StreamDetector`` the first time they are seen. Detector state is
+    written to ``path`` every ``ANOMALY_CHECKPOINT_INTERVAL`` seconds and
+    restored on start, so baselines survive restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None, config=None):
+        self.config = config or Config
+        self.path = path
+        self.detectors: Dict[str, StreamDetector] = {}
+        self._saved_state: Dict[str, Any] = {}
+        self._checkpointed_at = time.monotonic()
+        # System monitoring and sensor jobs may observe at the same time
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def observe(
+        self, values: Dict[str, float], ts: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Feed one sample of each stream; returns the new anomalies"""
+        ts = time.time() if ts is None else ts
+        anomalies = []
+        with self._lock:
+            for stream, value in values.items():
+                if value is None:
+                    continue
+                detector = self.detectors.get(stream)
+                if detector is None:
+                    detector = self.detectors[stream] = self._new_detector(stream)
+                scores = detector.observe(float(value), ts)
+                if scores:
+                    anomalies.append(
+                        {
+                            "stream": stream,
+                            "value": value,
+                            **scores,
+                            "timestamp": ts,
+                            "message": (
+                                f"Anomaly in {stream}: {value} "
+                                f"(usual {scores['baseline']}, z={scores['zscore']})"
+                            ),
+                        }
+                    )
+        if time.monotonic() - self._checkpointed_at >= (
+            self.config.ANOMALY_CHECKPOINT_INTERVAL
+        ):
+            self.checkpoint()
+        return anomalies
+
+    def checkpoint(self) -> bool:
+        """Write all detector state to ``path`` atomically"""
+        self._checkpointed_at = time.monotonic()
+        if not self.path:
+            return False
+        # Streams not seen since the restart keep their saved baselines
+        with self._lock:
+            state = dict(self._saved_state)
+            for stream, detector in self.detectors.items():
+                state[stream] = detector.to_dict()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.error(f"Error checkpointing anomaly detectors: {e}")
+            return False
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self._saved_state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable anomaly state {self.path}: {e}")
+            return
+        logger.info(f"Restored anomaly baselines for {len(self._saved_state)} streams")
+
+    def _new_detector(self, stream: str) -> StreamDetector:
+        detector = StreamDetector(
+            alpha=self.config.ANOMALY_ALPHA,
+            threshold=self.config.ANOMALY_THRESHOLD,
+            warmup=self.config.ANOMALY_WARMUP,
+            min_std=self.config.ANOMALY_MIN_STD,
+            buckets=self.config.ANOMALY_SEASONAL_BUCKETS,
+        )
+        state = self._saved_state.pop(stream, None)
+        if state:
+            try:
+                detector.restore(state)
+            except (KeyError, TypeError) as e:
+                logger.warning(f"Ignoring saved anomaly state of {stream}: {e}")
+        return detector
+
+
+def open_detector(config=None) -> Optional[AnomalyDetector]:
+    """The agent's anomaly detector, or None if disabled"""
+    config = config or Config
+    if not config.ANOMALY_ENABLED:
+        return None
+    path = os.path.join(config.ANOMALY_STATE_PATH, f"{config.DEVICE_ID}.json")
+    return AnomalyDetector(path, config)
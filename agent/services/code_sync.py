@@ -0,0 +1,313 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import shutil
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from agent.config import Config
+
+logger = logging.getLogger("iot_agent")
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_NAME = ".manifest.json"
+EXCLUDED_DIRS = {"__pycache__"}
+
+# Content-defined chunking: a boundary falls where the gear hash of the bytes
+# since the last boundary has its low 11 bits clear (about every 2 KiB), so an
+# edit only changes the chunks around it and the rest are reused
+MIN_CHUNK = 512
+MAX_CHUNK = 8192
+BOUNDARY_MASK = (1 << 11) - 1
+_MASK64 = (1 << 64) - 1
+GEAR = [
+    int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256)
+]
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_data(data: bytes) -> List[bytes]:
+    """Split ``data`` at content-defined boundaries"""
+    chunks = []
+    start = 0
+    length = len(data)
+    while start < length:
+        end = min(start + MAX_CHUNK, length)
+        h = 0
+        i = start + MIN_CHUNK
+        cut = end
+        while i < end:
+            h = ((h << 1) + GEAR[data[i]]) & _MASK64
+            i += 1
+            if not h & BOUNDARY_MASK:
+                cut = i
+                break
+        chunks.append(data[start:cut])
+        start = cut
+    return chunks
+
+
+def manifest_id(manifest: Dict) -> str:
+    """Digest of a manifest's version and files, which names the release"""
+    canonical = json.dumps(
+        {"version": manifest.get("version"), "files": manifest.get("files")},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return sha256(canonical.encode("utf-8"))
+
+
+def sign_manifest(manifest: Dict, key: str) -> str:
+    """HMAC-SHA256 of a manifest's id, proving it was released by a holder
+    of the signing key"""
+    return hmac.new(
+        key.encode("utf-8"), manifest_id(manifest).encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def _package_files(root: str) -> Iterable[Tuple[str, str]]:
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            relpath = os.path.relpath(path, root).replace(os.sep, "/")
+            if relpath != MANIFEST_NAME and not name.endswith(".pyc"):
+                yield relpath, path
+
+
+def build_manifest(root: str, version: str, key: str) -> Tuple[Dict, Dict[str, bytes]]:
+    """The manifest of the package at ``root``, signed with ``key``, and its
+    chunks by hash"""
+    files = {}
+    chunks = {}
+    for relpath, path in _package_files(root):
+        with open(path, "rb") as f:
+            data = f.read()
+        hashes = []
+        for chunk in chunk_data(data):
+            digest = sha256(chunk)
+            chunks[digest] = chunk
+            hashes.append(digest)
+        files[relpath] = {"sha256": sha256(data), "size": len(data), "chunks": hashes}
+    manifest = {"version": version, "files": files}
+    manifest["id"] = manifest_id(manifest)
+    manifest["signature"] = sign_manifest(manifest, key)
+    return manifest, chunks
+
+
+class CodeSync:
+    """Updates the agent package in place from a content-addressed release.
+
+    The backend serves the release manifest (``GET /agent/code/manifest``):
+    every file of the package with its SHA-256 and the hashes of its chunks.
+    Chunks already present in the installed files are reused, only the
+    missing ones are downloaded (``POST /agent/code/chunks``). The new
+    package is assembled next to the installed one, every file is checked
+    against its digest and every module compiled, and then the two
+    directories are swapped. The replaced package is kept as
+    ``<root>.previous`` for ``rollback``.
+
+    Releases are signed with ``CODE_SIGNING_KEY`` (HMAC-SHA256 over the
+    manifest id, which covers every file digest); a manifest without a valid
+    signature is never staged.
+    """
+
+    def __init__(self, backend_client, root: str = PACKAGE_ROOT, config=None):
+        self.backend_client = backend_client
+        self.root = root.rstrip(os.sep)
+        self.config = config or Config
+        if not self.config.CODE_SIGNING_KEY:
+            raise ValueError("CODE_SIGNING_KEY is required to sync code")
+        self.staging = f"{self.root}.staging"
+        self.previous = f"{self.root}.previous"
+        self.last_update: Optional[Dict] = None
+
+    def installed(self) -> Dict:
+        """The manifest of the installed release, or {} if it has none"""
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get_status(self) -> Dict:
+        installed = self.installed()
+        return {
+            "version": installed.get("version"),
+            "id": installed.get("id"),
+            "last_update": self.last_update,
+        }
+
+    def check(self) -> Optional[Dict]:
+        """The backend's release manifest if it differs from the installed one"""
+        manifest = self.backend_client.get_code_manifest()
+        if not manifest or not isinstance(manifest.get("files"), dict):
+            return None
+        if manifest.get("id") != manifest_id(manifest):
+            logger.error("Code manifest does not match its id, ignoring it")
+            return None
+        if not hmac.compare_digest(
+            str(manifest.get("signature", "")),
+            sign_manifest(manifest, self.config.CODE_SIGNING_KEY),
+        ):
+            logger.error(
+                "Code manifest is not signed with CODE_SIGNING_KEY, ignoring it"
+            )
+            return None
+        if manifest["id"] == self.installed().get("id"):
+            return None
+        return manifest
+
+    def update(self) -> bool:
+        """Install the backend's release if it is new; True once swapped in"""
+        manifest = self.check()
+        if manifest is None:
+            return False
+        try:
+            stats = self.stage(manifest)
+            self.apply()
+        except (OSError, ValueError, SyntaxError) as e:
+            logger.error(f"Code update to {manifest.get('version')} failed: {e}")
+            shutil.rmtree(self.staging, ignore_errors=True)
+            return False
+        self.last_update = {"version": manifest.get("version"), **stats}
+        logger.info(
+            f"Updated agent code to {manifest.get('version')}: "
+            f"{stats['downloaded_bytes']} bytes downloaded, "
+            f"{stats['reused_bytes']} bytes reused"
+        )
+        return True
+
+    def local_chunks(self) -> Dict[str, bytes]:
+        """Chunks of the installed files by hash"""
+        chunks = {}
+        for _, path in _package_files(self.root):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            for chunk in chunk_data(data):
+                chunks[sha256(chunk)] = chunk
+        return chunks
+
+    def fetch_chunks(self, hashes: List[str]) -> Dict[str, bytes]:
+        """Download ``hashes`` from the backend, verifying each chunk"""
+        chunks = {}
+        batch = self.config.CODE_SYNC_BATCH_SIZE
+        for start in range(0, len(hashes), batch):
+            wanted = hashes[start : start + batch]
+            reply = self.backend_client.get_code_chunks(wanted)
+            if not reply:
+                raise OSError("backend did not return the chunks")
+            received = reply.get("chunks") or {}
+            for digest in wanted:
+                if digest not in received:
+                    raise ValueError(f"chunk {digest} missing from reply")
+                chunk = base64.b64decode(received[digest])
+                if sha256(chunk) != digest:
+                    raise ValueError(f"chunk {digest} is corrupt")
+                chunks[digest] = chunk
+        return chunks
+
+    def stage(self, manifest: Dict) -> Dict[str, int]:
+        """Assemble and verify the release in the staging directory"""
+        chunks = self.local_chunks()
+        wanted = {
+            digest for entry in manifest["files"].values() for digest in entry["chunks"]
+        }
+        missing = sorted(wanted - chunks.keys())
+        reused = sum(len(chunks[digest]) for digest in wanted & chunks.keys())
+        chunks.update(self.fetch_chunks(missing))
+
+        shutil.rmtree(self.staging, ignore_errors=True)
+        for relpath, entry in manifest["files"].items():
+            path = os.path.normpath(os.path.join(self.staging, relpath))
+            if not path.startswith(self.staging + os.sep):
+                raise ValueError(f"unsafe path in manifest: {relpath}")
+            data = b"".join(chunks[digest] for digest in entry["chunks"])
+            if len(data) != entry["size"] or sha256(data) != entry["sha256"]:
+                raise ValueError(f"{relpath} does not match the manifest")
+            if relpath.endswith(".py"):
+                compile(data, relpath, "exec")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        with open(os.path.join(self.staging, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f)
+        return {
+            "files": len(manifest["files"]),
+            "downloaded_bytes": sum(len(chunks[digest]) for digest in missing),
+            "reused_bytes": reused,
+        }
+
+    def apply(self):
+        """Swap the staged package in, keeping the installed one as previous"""
+        shutil.rmtree(self.previous, ignore_errors=True)
+        os.rename(self.root, self.previous)
+        try:
+            os.rename(self.staging, self.root)
+        except OSError:
+            os.rename(self.previous, self.root)
+            raise
+
+    def rollback(self) -> bool:
+        """Swap the previous package back in"""
+        if not os.path.isdir(self.previous):
+            return False
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.rename(self.root, self.staging)
+        os.rename(self.previous, self.root)
+        shutil.rmtree(self.staging, ignore_errors=True)
+        logger.info("Rolled agent code back to the previous release")
+        return True
+
+
+def restart_argv() -> List[str]:
+    """The command line that started this process. A module run with ``-m``
+    is started the same way again, so the package is imported from its
+    root rather than run as a file."""
+    spec = getattr(sys.modules.get("__main__"), "__spec__", None)
+    if spec is not None:
+        return [sys.executable, "-m", spec.name] + sys.argv[1:]
+    return [sys.executable] + sys.argv
+
+
+def restart_in_place():
+    """Replace this process with a fresh interpreter running the same command"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    argv = restart_argv()
+    os.execv(argv[0], argv)
+
+
+def main(argv=None):
+    """Write a release for the backend to serve: ``manifest.json`` and one
+    file per chunk under ``chunks/``"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("version")
+    parser.add_argument("output")
+    parser.add_argument("--root", default=PACKAGE_ROOT)
+    parser.add_argument("--key", default=Config.CODE_SIGNING_KEY)
+    args = parser.parse_args(argv)
+    if not args.key:
+        parser.error("a signing key is required (--key or CODE_SIGNING_KEY)")
+    manifest, chunks = build_manifest(args.root, args.version, args.key)
+    os.makedirs(os.path.join(args.output, "chunks"), exist_ok=True)
+    for digest, chunk in chunks.items():
+        with open(os.path.join(args.output, "chunks", digest), "wb") as f:
+            f.write(chunk)
+    with open(os.path.join(args.output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{args.version}: {len(manifest['files'])} files, {len(chunks)} chunks")
+
+
+if __name__ == "__main__":
+    main()
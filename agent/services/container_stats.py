@@ -0,0 +1,284 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from agent.config import Config
+
+logger = logging.getLogger("iot_agent")
+
+# Where Docker puts a container's cgroup v2 directory, by cgroup driver
+CGROUP_LAYOUTS = ("system.slice/docker-{id}.scope", "docker/{id}")
+
+
+class _StatsStream(threading.Thread):
+    """Keeps the latest frame of one container's streaming ``stats``"""
+
+    def __init__(self, client, container_id: str):
+        super().__init__(daemon=True, name=f"stats-{container_id[:12]}")
+        self.client = client
+        self.container_id = container_id
+        self.latest: Optional[Dict[str, Any]] = None
+        self.stopped = False
+
+    def run(self):
+        try:
+            for frame in self.client.api.stats(
+                self.container_id, stream=True, decode=True
+            ):
+                if self.stopped:
+                    break
+                self.latest = frame
+        except Exception as e:
+            logger.debug(f"Stats stream for {self.container_id[:12]} ended: {e}")
+
+    def stop(self):
+        self.stopped = True  # the thread exits on the next frame
+
+
+class ContainerStats:
+    """Per-container CPU, memory, block I/O and network usage.
+
+    Read straight from each container's cgroup v2 files (and network from
+    ``/proc/<pid>/net/dev``) when the host cgroup tree is visible: a few
+    file reads and no Docker API calls. Otherwise each running container
+    gets one streaming ``stats`` connection whose latest frame is used,
+    since a one-shot ``stats`` call takes about two seconds per container.
+
+    CPU is a percentage of the whole host, like ``SystemMonitor``'s; memory
+    excludes the page cache, as ``docker stats`` does. A container's pid
+    and cgroup are looked up again when its pid or start time changes.
+    """
+
+    def __init__(
+        self,
+        client,
+        config=None,
+        cgroup_root: Optional[str] = None,
+        proc_root: Optional[str] = None,
+    ):
+        self.client = client
+        self.config = config or Config
+        self.cgroup_root = cgroup_root or self.config.CGROUP_ROOT
+        self.proc_root = proc_root or self.config.PROC_ROOT
+        self.list_interval = self.config.CONTAINER_LIST_INTERVAL
+        self._containers: Dict[str, Dict[str, Any]] = {}  # by container id
+        self._listed_at: Optional[float] = None
+        self._cpu_usage: Dict[str, tuple] = {}  # id -> (time, usage usec)
+        self._streams: Dict[str, _StatsStream] = {}
+        self._cpu_count = os.cpu_count() or 1
+        self._host_memory = None
+        self._lock = threading.Lock()
+
+    def sample(self) -> Dict[str, Dict[str, Any]]:
+        """Current usage of each running container, by container name"""
+        with self._lock:
+            self._refresh()
+            usage = {}
+            for container_id, info in self._containers.items():
+                stats = None
+                if info["cgroup"]:
+                    try:
+                        stats = self._read_cgroup(container_id, info)
+                    except (OSError, ValueError) as e:
+                        logger.warning(
+                            f"Cannot read cgroup of {info['name']}, "
+                            f"streaming Docker stats instead: {e}"
+                        )
+                        info["cgroup"] = None
+                if not info["cgroup"]:
+                    stats = self._read_stream(container_id)
+                if stats:
+                    stats["id"] = container_id[:12]
+                    usage[info["name"]] = stats
+            return usage
+
+    def close(self):
+        with self._lock:
+            for stream in self._streams.values():
+                stream.stop()
+            self._streams.clear()
+
+    def _refresh(self):
+        """Re-list running containers every ``CONTAINER_LIST_INTERVAL`` seconds"""
+        now = time.monotonic()
+        if self._listed_at is not None and now - self._listed_at < self.list_interval:
+            return
+        self._listed_at = now
+        try:
+            containers = self.client.containers.list()
+        except Exception as e:
+            logger.error(f"Error listing containers: {e}")
+            return
+
+        running = {}
+        for container in containers:
+            state = container.attrs.get("State", {})
+            pid = state.get("Pid") or None
+            started = state.get("StartedAt")
+            info = self._containers.get(container.id)
+            if info is not None and (info["pid"], info["started"]) != (pid, started):
+                # Restarted: new process, and possibly a new cgroup
+                logger.debug(f"Container {container.name} restarted, re-reading")
+                self._forget(container.id)
+                info = None
+            if info is None:
+                info = {
+                    "name": container.name,
+                    "pid": pid,
+                    "started": started,
+                    "cgroup": self._find_cgroup(container.id),
+                }
+                source = "cgroup" if info["cgroup"] else "Docker stats stream"
+                logger.info(f"Monitoring container {container.name} via {source}")
+            running[container.id] = info
+            stream = self._streams.get(container.id)
+            if not info["cgroup"] and (stream is None or not stream.is_alive()):
+                stream = self._streams[container.id] = _StatsStream(
+                    self.client, container.id
+                )
+                stream.start()
+
+        for container_id in set(self._containers) - set(running):
+            self._forget(container_id)
+        self._containers = running
+
+    def _forget(self, container_id: str):
+        """Drop what is cached about a container's running process"""
+        self._cpu_usage.pop(container_id, None)
+        stream = self._streams.pop(container_id, None)
+        if stream:
+            stream.stop()
+
+    def _find_cgroup(self, container_id: str) -> Optional[str]:
+        for layout in CGROUP_LAYOUTS:
+            path = os.path.join(self.cgroup_root, layout.format(id=container_id))
+            if os.path.isfile(os.path.join(path, "cpu.stat")):
+                return path
+        return None
+
+    def _read_cgroup(self, container_id: str, info: Dict[str, Any]) -> Dict:
+        path = info["cgroup"]
+        cpu_stat = _read_keyed(os.path.join(path, "cpu.stat"))
+        now = time.monotonic()
+        usage = cpu_stat["usage_usec"]
+        previous = self._cpu_usage.get(container_id)
+        self._cpu_usage[container_id] = (now, usage)
+        cpu_percent = None
+        if previous is not None and now > previous[0]:
+            capacity = (now - previous[0]) * 1e6 * self._cpu_count
+            cpu_percent = round(max(0.0, 100 * (usage - previous[1]) / capacity), 1)
+
+        memory = int(_read(os.path.join(path, "memory.current")))
+        memory_stat = _read_keyed(os.path.join(path, "memory.stat"))
+        memory -= memory_stat.get("inactive_file", 0)
+        limit = _read(os.path.join(path, "memory.max"))
+        limit = self._host_memory_total() if limit == "max" else int(limit)
+
+        read_bytes = write_bytes = 0
+        with open(os.path.join(path, "io.stat")) as f:
+            for line in f:
+                fields = dict(
+                    item.split("=", 1) for item in line.split()[1:] if "=" in item
+                )
+                read_bytes += int(fields.get("rbytes", 0))
+                write_bytes += int(fields.get("wbytes", 0))
+
+        pids_path = os.path.join(path, "pids.current")
+        rx_bytes, tx_bytes = self._read_net(info["pid"])
+        return {
+            "source": "cgroup",
+            "cpu_percent": cpu_percent,
+            "memory_bytes": memory,
+            "memory_limit": limit,
+            "memory_percent": round(100 * memory / limit, 1) if limit else None,
+            "io_read_bytes": read_bytes,
+            "io_write_bytes": write_bytes,
+            "net_rx_bytes": rx_bytes,
+            "net_tx_bytes": tx_bytes,
+            "pids": int(_read(pids_path)) if os.path.exists(pids_path) else None,
+        }
+
+    def _read_net(self, pid: Optional[int]) -> tuple:
+        """Bytes received and sent on the container's interfaces (not ``lo``)"""
+        if not pid:
+            return None, None
+        rx_bytes = tx_bytes = 0
+        try:
+            with open(os.path.join(self.proc_root, str(pid), "net", "dev")) as f:
+                for line in f.readlines()[2:]:
+                    interface, _, counters = line.partition(":")
+                    if interface.strip() == "lo":
+                        continue
+                    fields = counters.split()
+                    rx_bytes += int(fields[0])
+                    tx_bytes += int(fields[8])
+        except (OSError, ValueError, IndexError):
+            return None, None
+        return rx_bytes, tx_bytes
+
+    def _host_memory_total(self) -> int:
+        if self._host_memory is None:
+            import psutil
+
+            self._host_memory = psutil.virtual_memory().total
+        return self._host_memory
+
+    def _read_stream(self, container_id: str) -> Optional[Dict]:
+        stream = self._streams.get(container_id)
+        frame = stream.latest if stream else None
+        return parse_stats_frame(frame) if frame else None
+
+
+def parse_stats_frame(frame: Dict[str, Any]) -> Dict[str, Any]:
+    """Usage from one Docker ``stats`` frame, in the cgroup reader's format"""
+    cpu = frame.get("cpu_stats") or {}
+    precpu = frame.get("precpu_stats") or {}
+    cpu_percent = None
+    if precpu.get("system_cpu_usage"):
+        cpu_delta = cpu["cpu_usage"]["total_usage"] - precpu["cpu_usage"]["total_usage"]
+        system_delta = cpu["system_cpu_usage"] - precpu["system_cpu_usage"]
+        if system_delta > 0:
+            cpu_percent = round(max(0.0, 100 * cpu_delta / system_delta), 1)
+
+    memory_stats = frame.get("memory_stats") or {}
+    memory = memory_stats.get("usage", 0)
+    memory -= (memory_stats.get("stats") or {}).get("inactive_file", 0)
+    limit = memory_stats.get("limit")
+
+    io_bytes = {"read": 0, "write": 0}
+    blkio = (frame.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+    for entry in blkio:
+        op = entry.get("op", "").lower()
+        if op in io_bytes:
+            io_bytes[op] += entry.get("value", 0)
+
+    networks = frame.get("networks") or {}
+    return {
+        "source": "docker",
+        "cpu_percent": cpu_percent,
+        "memory_bytes": memory,
+        "memory_limit": limit,
+        "memory_percent": round(100 * memory / limit, 1) if limit else None,
+        "io_read_bytes": io_bytes["read"],
+        "io_write_bytes": io_bytes["write"],
+        "net_rx_bytes": sum(n.get("rx_bytes", 0) for n in networks.values()),
+        "net_tx_bytes": sum(n.get("tx_bytes", 0) for n in networks.values()),
+        "pids": (frame.get("pids_stats") or {}).get("current"),
+    }
+
+
+def _read(path: str) -> str:
+    with open(path) as f:
+        return f.read().strip()
+
+
+def _read_keyed(path: str) -> Dict[str, int]:
+    """Parse a flat-keyed cgroup file (``key value`` per line)"""
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(" ")
+            values[key] = int(value)
+    return values
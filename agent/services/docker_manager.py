@@ -3,9 +3,11 @@ import time
 from typing import Any, Dict, Optional
 
 from docker.errors import NotFound
+from docker.utils import parse_repository_tag
 
 import docker
 from agent.config import Config
+from agent.utils.traffic import traffic
 
 logger = logging.getLogger("iot_agent")
 
@@ -13,10 +15,22 @@ logger = logging.getLogger("iot_agent")
 class DockerManager:
     """Manager for Docker operations with rollback support"""
 
-    def __init__(self):
+    def __init__(self, client=None, settle_time: Optional[float] = None, config=None):
+        """Use an injected ``docker.DockerClient`` or connect from the environment"""
+        self.config = config or Config
         try:
-            self.client = docker.from_env()
+            self.client = client or docker.from_env()
+            # Seconds to let a new container start before checking it runs
+            self.settle_time = (
+                self.config.CONTAINER_SETTLE_TIME
+                if settle_time is None
+                else settle_time
+            )
             self.previous_image_tag = None  # Store previous image for rollback
+            self._actual_state = None  # Cached result of get_actual_state
+            self._actual_state_time = 0.0
+            # PeerImageCache sharing images with agents on the LAN, if enabled
+            self.peers = None
             logger.info("Docker client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Docker client: {e}")
@@ -69,19 +83,20 @@ class DockerManager:
 
     def start_container_with_image(self, image_tag: str) -> bool:
         """Start container with specific image tag"""
+        self.invalidate_actual_state()
         try:
             logger.info(f"Starting container with image: {image_tag}")
 
             # Default environment variables
             env_vars = {
-                "DEVICE_ID": Config.DEVICE_ID,
-                "DEVICE_NAME": Config.DEVICE_NAME,
-                "BACKEND_URL": Config.BACKEND_URL,
+                "DEVICE_ID": self.config.DEVICE_ID,
+                "DEVICE_NAME": self.config.DEVICE_NAME,
+                "BACKEND_URL": self.config.BACKEND_URL,
             }
 
             container = self.client.containers.run(
                 image_tag,
-                name=Config.CONTAINER_NAME,
+                name=self.config.CONTAINER_NAME,
                 environment=env_vars,
                 detach=True,
                 restart_policy={"Name": "always"},
@@ -100,22 +115,42 @@ class DockerManager:
     def get_current_image_tag(self) -> Optional[str]:
         """Get current running container's image tag"""
         try:
-            container = self.client.containers.get(Config.CONTAINER_NAME)
+            container = self.client.containers.get(self.config.CONTAINER_NAME)
             if container.image and container.image.tags:
                 return container.image.tags[0]
             return None
         except NotFound:
-            logger.warning(f"Container {Config.CONTAINER_NAME} not found")
+            logger.warning(f"Container {self.config.CONTAINER_NAME} not found")
             return None
         except Exception as e:
             logger.error(f"Error getting current image tag: {e}")
             return None
 
-    def pull_latest_image(self) -> bool:
-        """Pull the latest image from Docker Hub"""
+    def pull_latest_image(self, image_tag: Optional[str] = None) -> bool:
+        """Pull the latest image (or ``image_tag``) from a peer or Docker Hub"""
+        image_tag = image_tag or self.config.DOCKER_IMAGE
+        if self.peers is not None:
+            return self.peers.pull(
+                image_tag, lambda: self._pull_from_registry(image_tag)
+            )
+        return self._pull_from_registry(image_tag)
+
+    def _pull_from_registry(self, image_tag: str) -> bool:
         try:
-            logger.info(f"Pulling latest image: {Config.DOCKER_IMAGE}")
-            image = self.client.images.pull(Config.DOCKER_IMAGE)
+            logger.info(f"Pulling latest image: {image_tag}")
+            repository, tag = parse_repository_tag(image_tag)
+            # Stream the pull to count the layer bytes downloaded
+            downloaded = {}
+            for line in self.client.api.pull(
+                repository, tag=tag or "latest", stream=True, decode=True
+            ):
+                if "error" in line:
+                    raise docker.errors.APIError(line["error"])
+                detail = line.get("progressDetail") or {}
+                if line.get("status") == "Downloading" and "current" in detail:
+                    downloaded[line.get("id")] = detail["current"]
+            traffic.add("registry", received=sum(downloaded.values()))
+            image = self.client.images.get(f"{repository}:{tag or 'latest'}")
             logger.info(
                 f"Successfully pulled image: {image.tags[0] if image.tags else 'untagged'}"
             )
@@ -126,14 +161,17 @@ class DockerManager:
 
     def stop_container(self) -> bool:
         """Stop the running container"""
+        self.invalidate_actual_state()
         try:
-            container = self.client.containers.get(Config.CONTAINER_NAME)
-            logger.info(f"Stopping container: {Config.CONTAINER_NAME}")
+            container = self.client.containers.get(self.config.CONTAINER_NAME)
+            logger.info(f"Stopping container: {self.config.CONTAINER_NAME}")
             container.stop(timeout=30)
             logger.info("Container stopped successfully")
             return True
         except NotFound:
-            logger.info(f"Container {Config.CONTAINER_NAME} not found, nothing to stop")
+            logger.info(
+                f"Container {self.config.CONTAINER_NAME} not found, nothing to stop"
+            )
             return True
         except Exception as e:
             logger.error(f"Failed to stop container: {e}")
@@ -141,31 +179,37 @@ class DockerManager:
 
     def remove_container(self) -> bool:
         """Remove the container"""
+        self.invalidate_actual_state()
         try:
-            container = self.client.containers.get(Config.CONTAINER_NAME)
-            logger.info(f"Removing container: {Config.CONTAINER_NAME}")
+            container = self.client.containers.get(self.config.CONTAINER_NAME)
+            logger.info(f"Removing container: {self.config.CONTAINER_NAME}")
             container.remove(force=True)
             logger.info("Container removed successfully")
             return True
         except NotFound:
             logger.info(
-                f"Container {Config.CONTAINER_NAME} not found, nothing to remove"
+                f"Container {self.config.CONTAINER_NAME} not found, nothing to remove"
             )
             return True
         except Exception as e:
             logger.error(f"Failed to remove container: {e}")
             return False
 
-    def start_container(self, environment: Optional[Dict[str, str]] = None) -> bool:
+    def start_container(
+        self,
+        environment: Optional[Dict[str, str]] = None,
+        image_tag: Optional[str] = None,
+    ) -> bool:
         """Start a new container"""
+        self.invalidate_actual_state()
         try:
-            logger.info(f"Starting new container: {Config.CONTAINER_NAME}")
+            logger.info(f"Starting new container: {self.config.CONTAINER_NAME}")
 
             # Default environment variables
             env_vars = {
-                "DEVICE_ID": Config.DEVICE_ID,
-                "DEVICE_NAME": Config.DEVICE_NAME,
-                "BACKEND_URL": Config.BACKEND_URL,
+                "DEVICE_ID": self.config.DEVICE_ID,
+                "DEVICE_NAME": self.config.DEVICE_NAME,
+                "BACKEND_URL": self.config.BACKEND_URL,
             }
 
             # Merge with provided environment variables
@@ -173,8 +217,8 @@ class DockerManager:
                 env_vars.update(environment)
 
             container = self.client.containers.run(
-                Config.DOCKER_IMAGE,
-                name=Config.CONTAINER_NAME,
+                image_tag or self.config.DOCKER_IMAGE,
+                name=self.config.CONTAINER_NAME,
                 environment=env_vars,
                 detach=True,
                 restart_policy={"Name": "always"},
@@ -188,8 +232,17 @@ class DockerManager:
             logger.error(f"Failed to start container: {e}")
             return False
 
-    def update_container(self) -> bool:
-        """Update container with latest image and rollback support"""
+    def update_container(
+        self,
+        image_tag: Optional[str] = None,
+        environment: Optional[Dict[str, str]] = None,
+        pull: bool = True,
+    ) -> bool:
+        """Update container with latest image (or ``image_tag``) and rollback support.
+
+        With ``pull=False`` the image must already be present locally, e.g.
+        because the caller pulled it first.
+        """
         try:
             logger.info("Starting container update with rollback support")
 
@@ -200,7 +253,7 @@ class DockerManager:
                 )
 
             # Pull latest image
-            if not self.pull_latest_image():
+            if pull and not self.pull_latest_image(image_tag):
                 logger.error("Failed to pull latest image, attempting rollback")
                 return self.rollback_to_previous()
 
@@ -214,12 +267,12 @@ class DockerManager:
                 return self.rollback_to_previous()
 
             # Start new container
-            if not self.start_container():
+            if not self.start_container(environment, image_tag=image_tag):
                 logger.error("Failed to start new container, attempting rollback")
                 return self.rollback_to_previous()
 
             # Verify new container is running
-            time.sleep(5)  # Wait a bit for container to fully start
+            time.sleep(self.settle_time)  # Wait a bit for container to fully start
             status = self.get_container_status()
             if not status.get("running", False):
                 logger.error("New container is not running, attempting rollback")
@@ -235,7 +288,7 @@ class DockerManager:
     def get_container_status(self) -> Dict[str, Any]:
         """Get container status information"""
         try:
-            container = self.client.containers.get(Config.CONTAINER_NAME)
+            container = self.client.containers.get(self.config.CONTAINER_NAME)
             image_tag = "untagged"
             if container.image and container.image.tags:
                 image_tag = container.image.tags[0]
@@ -253,6 +306,46 @@ class DockerManager:
             logger.error(f"Error getting container status: {e}")
             return {"status": "error", "error": str(e), "running": False}
 
+    def get_actual_state(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Get the container's image, env and run state, cached for ``max_age`` seconds.
+
+        The cache is dropped whenever this manager changes the container, so
+        repeated reconciliation passes cost no Docker API calls while idle.
+        """
+        if max_age is None:
+            max_age = self.config.DOCKER_STATE_CACHE_TTL
+        now = time.monotonic()
+        if self._actual_state is not None and now - self._actual_state_time < max_age:
+            return self._actual_state
+
+        try:
+            container = self.client.containers.get(self.config.CONTAINER_NAME)
+            image_tag = None
+            if container.image and container.image.tags:
+                image_tag = container.image.tags[0]
+            env = {}
+            for item in container.attrs.get("Config", {}).get("Env") or []:
+                key, _, value = item.partition("=")
+                env[key] = value
+            state = {
+                "image": image_tag,
+                "env": env,
+                "running": container.status == "running",
+            }
+        except NotFound:
+            state = {"image": None, "env": {}, "running": False}
+        except Exception as e:
+            logger.error(f"Error getting actual container state: {e}")
+            return {"error": str(e)}
+
+        self._actual_state = state
+        self._actual_state_time = now
+        return state
+
+    def invalidate_actual_state(self):
+        """Drop the cached actual state after the container changed"""
+        self._actual_state = None
+
     def rollback_container(self) -> bool:
         """Alias for rollback_to_previous for agent compatibility"""
         return self.rollback_to_previous()
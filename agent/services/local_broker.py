@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import struct
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger("iot_agent")
+
+# MQTT 3.1.1 control packet types (upper nibble of the fixed header)
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def encode_remaining_length(length: int) -> bytes:
+    """Encode the MQTT variable-length "remaining length" field"""
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    return struct.pack("!H", len(raw)) + raw
+
+
+def encode_packet(packet_type: int, body: bytes = b"", flags: int = 0) -> bytes:
+    return (
+        bytes([(packet_type << 4) | flags]) + encode_remaining_length(len(body)) + body
+    )
+
+
+def encode_publish(topic: str, payload: bytes) -> bytes:
+    """QoS 0 PUBLISH packet"""
+    return encode_packet(PUBLISH, encode_string(topic) + payload)
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    """Read one control packet, returning (type, flags, body)"""
+    header = (await reader.readexactly(1))[0]
+    length = 0
+    multiplier = 1
+    for _ in range(4):
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    else:
+        raise ValueError("Malformed remaining length")
+    body = await reader.readexactly(length) if length else b""
+    return header >> 4, header & 0x0F, body
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter matching with ``+`` and ``#`` wildcards"""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _read_string(body: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("!H", body, offset)
+    start = offset + 2
+    return body[start : start + length].decode("utf-8"), start + length
+
+
+class _Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id = ""
+        self.subscriptions: Dict[str, int] = {}
+
+
+class LocalBroker:
+    """Lightweight in-process MQTT 3.1.1 broker.
+
+    Handles CONNECT, PUBLISH (QoS 0-2 in, QoS 0 out), SUBSCRIBE with
+    wildcards, UNSUBSCRIBE, PINGREQ and DISCONNECT. There is no
+    authentication, persistence or retained-message support: it is meant
+    for local fan-in on a single site and for offline load tests.
+
+    ``on_publish(client_id, topic, payload)`` is called for every message
+    clients publish, after it has been delivered to local subscribers
+    (unless ``local_delivery`` is False: then only ``publish`` delivers).
+    ``on_subscriptions(filters)`` is called with the set of topic filters
+    subscribed by any client whenever that set changes.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 1883,
+        on_publish: Optional[Callable[[str, str, bytes], None]] = None,
+        on_subscriptions: Optional[Callable[[Set[str]], None]] = None,
+        local_delivery: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.local_delivery = local_delivery
+        self.on_publish = on_publish
+        self.on_subscriptions = on_subscriptions
+        self._filters: Set[str] = set()
+        self.stats = {"connections": 0, "published": 0, "delivered": 0}
+        self._sessions = set()
+        self._server = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread = None
+
+    async def start_async(self):
+        """Start serving on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Local MQTT broker listening on {self.host}:{self.port}")
+
+    async def stop_async(self):
+        if self._server:
+            self._server.close()
+            for session in list(self._sessions):
+                session.writer.close()
+            await self._server.wait_closed()
+
+    def start(self) -> "LocalBroker":
+        """Start serving on a background thread with its own event loop"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start_async())
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self.stop_async())
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        if self._loop and self._thread:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def publish(self, topic: str, payload: bytes):
+        """Deliver a message to local subscribers (thread-safe)"""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._deliver, topic, payload)
+
+    @property
+    def clients(self) -> int:
+        """Number of connected clients"""
+        return len(self._sessions)
+
+    def subscriptions(self) -> Set[str]:
+        """Topic filters subscribed by any connected client"""
+        return {f for session in list(self._sessions) for f in session.subscriptions}
+
+    def _subscriptions_changed(self):
+        filters = self.subscriptions()
+        if filters == self._filters:
+            return
+        self._filters = filters
+        if self.on_subscriptions:
+            try:
+                self.on_subscriptions(set(filters))
+            except Exception as e:
+                logger.error(f"Local broker subscription hook failed: {e}")
+
+    def _deliver(self, topic: str, payload: bytes):
+        packet = None
+        for session in self._sessions:
+            if any(topic_matches(f, topic) for f in session.subscriptions):
+                packet = packet or encode_publish(topic, payload)
+                session.writer.write(packet)
+                self.stats["delivered"] += 1
+
+    async def _handle_client(self, reader, writer):
+        session = _Session(writer)
+        self._sessions.add(session)
+        self.stats["connections"] += 1
+        try:
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if not self._handle_packet(session, packet_type, flags, body):
+                    break
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()
+        except (
+            asyncio.IncompleteReadError,
+            ConnectionError,
+            ValueError,
+            IndexError,
+            struct.error,
+        ):
+            pass
+        except asyncio.CancelledError:
+            pass  # broker shutting down
+        finally:
+            self._sessions.discard(session)
+            writer.close()
+            if session.subscriptions:
+                self._subscriptions_changed()
+
+    def _handle_packet(self, session, packet_type, flags, body) -> bool:
+        writer = session.writer
+        if packet_type == CONNECT:
+            _, offset = _read_string(body, 0)  # protocol name
+            offset += 4  # level, flags, keepalive
+            session.client_id, _ = _read_string(body, offset)
+            writer.write(encode_packet(CONNACK, b"\x00\x00"))
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _read_string(body, 0)
+            if qos:
+                packet_id = body[offset : offset + 2]
+                offset += 2
+                writer.write(encode_packet(PUBACK if qos == 1 else PUBREC, packet_id))
+            payload = body[offset:]
+            self.stats["published"] += 1
+            if self.local_delivery:
+                self._deliver(topic, payload)
+            if self.on_publish:
+                try:
+                    self.on_publish(session.client_id, topic, payload)
+                except Exception as e:
+                    logger.error(f"Local broker publish hook failed: {e}")
+        elif packet_type == PUBREL:
+            writer.write(encode_packet(PUBCOMP, body[:2]))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                topic_filter, offset = _read_string(body, offset)
+                session.subscriptions[topic_filter] = body[offset]
+                offset += 1
+                granted.append(0)
+            writer.write(encode_packet(SUBACK, packet_id + bytes(granted)))
+            self._subscriptions_changed()
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                topic_filter, offset = _read_string(body, offset)
+                session.subscriptions.pop(topic_filter, None)
+            writer.write(encode_packet(UNSUBACK, packet_id))
+            self._subscriptions_changed()
+        elif packet_type == PINGREQ:
+            writer.write(encode_packet(PINGRESP))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
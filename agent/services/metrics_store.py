@@ -0,0 +1,317 @@
+import logging
+import math
+import mmap
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Sequence
+
+from agent.config import Config
+
+logger = logging.getLogger("iot_agent")
+
+MAGIC = b"IOTTS001"
+HEADER_SIZE = 64  # magic + capacity, columns, head, count, layout checksum
+DEFAULT_METRICS = ("cpu", "memory", "disk")
+# Tier name -> bucket size in seconds (0 keeps every sample)
+TIERS = {"raw": 0, "1m": 60, "1h": 3600}
+AGGREGATES = ("mean", "min", "max", "count", "last")
+# Columns kept per metric in the downsampled tiers
+BUCKET_STATS = ("mean", "min", "max", "count")
+
+
+class _RingFile:
+    """Fixed-size ring buffer of float64 rows in a memory-mapped file.
+
+    Columns are stored one after another (``capacity`` values each) so a
+    scan touches only the columns it reads. A row is written before the
+    head moves, so a crash loses at most the row being written.
+    """
+
+    def __init__(self, path: str, fields: Sequence[str], capacity: int):
+        self.path = path
+        self.fields = ["ts", *fields]
+        self.capacity = capacity
+        columns = len(self.fields)
+        size = HEADER_SIZE + columns * capacity * 8
+        layout = zlib.crc32(",".join(self.fields).encode())
+
+        exists = os.path.exists(path) and os.path.getsize(path) == size
+        self._file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._meta = memoryview(self._mmap)[8:48].cast("q")
+        self._data = memoryview(self._mmap)[HEADER_SIZE:].cast("d")
+
+        expected = (capacity, columns)
+        if self._mmap[:8] != MAGIC or tuple(self._meta[:2]) != expected:
+            self._reset(layout)
+        elif self._meta[4] != layout:
+            logger.warning(f"Metrics layout changed, resetting {path}")
+            self._reset(layout)
+
+    def _reset(self, layout: int):
+        self._mmap[:8] = MAGIC
+        self._meta[0] = self.capacity
+        self._meta[1] = len(self.fields)
+        self._meta[2] = 0  # head: next slot to write
+        self._meta[3] = 0  # rows stored
+        self._meta[4] = layout
+
+    def __len__(self) -> int:
+        return self._meta[3]
+
+    def __getitem__(self, index: int) -> float:
+        """Timestamp of the ``index``-th oldest row (for bisect)"""
+        return self._data[self._slot(index)]
+
+    def _slot(self, index: int) -> int:
+        return (self._meta[2] - self._meta[3] + index) % self.capacity
+
+    def append(self, row: Sequence[float]):
+        head = self._meta[2]
+        for column, value in enumerate(row):
+            self._data[column * self.capacity + head] = value
+        self._meta[2] = (head + 1) % self.capacity
+        self._meta[3] = min(self._meta[3] + 1, self.capacity)
+
+    def oldest(self) -> Optional[float]:
+        return self[0] if len(self) else None
+
+    def count(self, start: float, end: float) -> int:
+        return bisect_right(self, end) - bisect_left(self, start)
+
+    def read(self, start: float, end: float, fields: Sequence[str]) -> List[List]:
+        """Rows with ``start <= ts <= end`` as ``[ts, *fields]``, oldest first"""
+        columns = [0] + [self.fields.index(field) for field in fields]
+        rows = []
+        for index in range(bisect_left(self, start), bisect_right(self, end)):
+            slot = self._slot(index)
+            rows.append([self._data[c * self.capacity + slot] for c in columns])
+        return rows
+
+    def flush(self):
+        self._mmap.flush()
+
+    def close(self):
+        self._mmap.flush()
+        self._meta.release()
+        self._data.release()
+        self._mmap.close()
+        self._file.close()
+
+
+class MetricsStore:
+    """Compact local history of system metrics.
+
+    Samples go to the ``raw`` tier and are downsampled into ``1m`` and
+    ``1h`` tiers holding the mean, min, max and sample count of each
+    metric per bucket.
+    Each tier is a fixed-size ring buffer in its own memory-mapped file,
+    so the total size on disk is bounded and history survives restarts.
+    The bucket being filled is kept in memory until it completes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        metrics: Sequence[str] = DEFAULT_METRICS,
+        capacities: Optional[Dict[str, int]] = None,
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.metrics = list(metrics)
+        capacities = capacities or {
+            "raw": Config.METRICS_RAW_ROWS,
+            "1m": Config.METRICS_MINUTE_ROWS,
+            "1h": Config.METRICS_HOUR_ROWS,
+        }
+        self.tiers: Dict[str, _RingFile] = {}
+        for tier, resolution in TIERS.items():
+            if resolution:
+                fields = [
+                    f"{metric}_{stat}"
+                    for metric in self.metrics
+                    for stat in BUCKET_STATS
+                ]
+            else:
+                fields = self.metrics
+            self.tiers[tier] = _RingFile(
+                os.path.join(path, f"{tier}.ts"), fields, capacities[tier]
+            )
+        self._buckets: Dict[str, Optional[Dict[str, Any]]] = {"1m": None, "1h": None}
+        self._lock = threading.Lock()
+
+    def append(self, values: Dict[str, float], ts: Optional[float] = None):
+        """Record one sample; metrics missing from ``values`` are stored as NaN"""
+        ts = time.time() if ts is None else ts
+        row = [float(values.get(metric, math.nan)) for metric in self.metrics]
+        with self._lock:
+            raw = self.tiers["raw"]
+            if len(raw) and ts < raw[len(raw) - 1]:
+                logger.debug("Dropping out-of-order metrics sample")
+                return
+            raw.append([ts, *row])
+            stats = {
+                metric: [value, value, value, 1]
+                for metric, value in zip(self.metrics, row)
+                if not math.isnan(value)
+            }
+            self._roll("1m", ts, stats)
+
+    def _roll(self, tier: str, ts: float, stats: Dict[str, list]):
+        """Merge per-metric [sum, min, max, count] into the tier's open bucket"""
+        resolution = TIERS[tier]
+        start = ts - ts % resolution
+        bucket = self._buckets[tier]
+        if bucket is not None and bucket["start"] != start:
+            self.tiers[tier].append(self._bucket_row(bucket))
+            if tier == "1m":
+                self._roll("1h", bucket["start"], bucket["stats"])
+            bucket = None
+        if bucket is None:
+            bucket = self._buckets[tier] = {"start": start, "stats": {}}
+        for metric, (total, low, high, count) in stats.items():
+            merged = bucket["stats"].setdefault(metric, [0.0, math.inf, -math.inf, 0])
+            merged[0] += total
+            merged[1] = min(merged[1], low)
+            merged[2] = max(merged[2], high)
+            merged[3] += count
+
+    def _bucket_row(self, bucket: Dict[str, Any]) -> List[float]:
+        row = [bucket["start"]]
+        for metric in self.metrics:
+            total, low, high, count = bucket["stats"].get(metric, (0, 0, 0, 0))
+            if count:
+                row += [total / count, low, high, count]
+            else:
+                row += [math.nan, math.nan, math.nan, 0]
+        return row
+
+    def query(
+        self,
+        metric: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        tier: Optional[str] = None,
+        agg: Optional[str] = None,
+        limit: int = 500,
+    ) -> Dict[str, Any]:
+        """Read a metric over ``[start, end]`` (default: the last hour).
+
+        Without ``tier`` the finest tier that still covers ``start`` with at
+        most ``limit`` points is used. Raw points are ``[ts, value]``,
+        downsampled ones ``[ts, mean, min, max]``. With ``agg`` (mean, min,
+        max, count or last) a single value over the range is returned; the
+        mean is weighted by each bucket's sample count, and ``count`` is the
+        number of samples.
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"unknown metric '{metric}'")
+        if tier is not None and tier not in self.tiers:
+            raise ValueError(f"unknown tier '{tier}'")
+        if agg is not None and agg not in AGGREGATES:
+            raise ValueError(f"unknown aggregate '{agg}'")
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+
+        with self._lock:
+            tier = tier or self._pick_tier(start, end, limit)
+            if TIERS[tier]:
+                fields = [f"{metric}_{stat}" for stat in BUCKET_STATS]
+            else:
+                fields = [metric]
+            points = [
+                point
+                for point in self.tiers[tier].read(start, end, fields)
+                if not math.isnan(point[1])
+            ]
+
+        result = {"metric": metric, "tier": tier, "start": start, "end": end}
+        if agg is None:
+            # The sample count stays internal: points are [ts, mean, min, max]
+            result["points"] = [point[:4] for point in points[-limit:]]
+            return result
+        result["agg"] = agg
+        result["count"] = sum(_samples(point) for point in points)
+        result["value"] = self._aggregate(points, agg)
+        return result
+
+    def _pick_tier(self, start: float, end: float, limit: int) -> str:
+        for tier, ring in self.tiers.items():
+            oldest = ring.oldest()
+            if (
+                oldest is not None
+                and oldest <= start
+                and ring.count(start, end) <= limit
+            ):
+                return tier
+
+        # Nothing covers the whole range: use the tier reaching furthest back
+        def reach(tier):
+            oldest = self.tiers[tier].oldest()
+            return math.inf if oldest is None else oldest
+
+        return min(self.tiers, key=reach)
+
+    @staticmethod
+    def _aggregate(points: List[List[float]], agg: str) -> Optional[float]:
+        if agg == "count":
+            return sum(_samples(point) for point in points)
+        if not points:
+            return None
+        if agg == "last":
+            return points[-1][1]
+        if agg == "mean":
+            total = sum(point[1] * _samples(point) for point in points)
+            return total / sum(_samples(point) for point in points)
+        if agg == "min":
+            return min(point[2] if len(point) > 2 else point[1] for point in points)
+        return max(point[3] if len(point) > 2 else point[1] for point in points)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            tier: {
+                "rows": len(ring),
+                "capacity": ring.capacity,
+                "oldest": ring.oldest(),
+                "bytes": os.path.getsize(ring.path),
+            }
+            for tier, ring in self.tiers.items()
+        }
+
+    def flush(self):
+        with self._lock:
+            for ring in self.tiers.values():
+                ring.flush()
+
+    def close(self):
+        with self._lock:
+            for ring in self.tiers.values():
+                ring.close()
+
+
+def _samples(point: List[float]) -> int:
+    """Samples behind a point: 1 for raw, the bucket's count otherwise"""
+    return int(point[4]) if len(point) > 4 else 1
+
+
+def open_store(config=None) -> Optional[MetricsStore]:
+    """Open the configured metrics store; None if disabled or unavailable"""
+    config = config or Config
+    if not config.METRICS_STORE_ENABLED:
+        return None
+    try:
+        return MetricsStore(
+            config.METRICS_STORE_PATH,
+            capacities={
+                "raw": config.METRICS_RAW_ROWS,
+                "1m": config.METRICS_MINUTE_ROWS,
+                "1h": config.METRICS_HOUR_ROWS,
+            },
+        )
+    except (OSError, ValueError) as e:
+        logger.warning(f"Metrics history disabled, cannot open store: {e}")
+        return None
@@ -0,0 +1,205 @@
+import base64
+import json
+import logging
+import threading
+from collections import deque
+from typing import Dict, Set
+
+import paho.mqtt.client as mqtt
+
+from agent.config import Config
+from agent.services.local_broker import LocalBroker, topic_matches
+from agent.utils.traffic import mqtt_size, traffic
+
+logger = logging.getLogger("iot_agent")
+
+
+class MqttGateway:
+    """Local MQTT broker that bridges nearby agents to the central broker.
+
+    Agents on the site point ``MQTT_BROKER`` at the gateway instead of the
+    central broker. Everything they publish is queued and forwarded over the
+    gateway's single upstream connection, several messages at a time as one
+    batch message on ``GATEWAY_UPLINK_TOPIC``. The topics they subscribe to
+    (their command topics) are subscribed upstream, and commands arriving
+    there are fanned out to the local subscribers by topic.
+
+    A batch is ``{"gateway": name, "messages": [{"topic", "payload"}]}``;
+    a flush with a single message forwards it unchanged on its own topic.
+    Payloads that are not UTF-8 are sent as ``payload_b64``.
+
+    The local broker is unauthenticated, so commands only come from
+    upstream: only the command topics of this device and of
+    ``GATEWAY_DEVICE_IDS`` are subscribed upstream, local publishes to any
+    command topic are dropped, and local clients do not receive each
+    other's messages.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or Config
+        self.upstream_host = self.config.MQTT_BROKER
+        self.upstream_port = self.config.MQTT_PORT
+        self.uplink_topic = self.config.GATEWAY_UPLINK_TOPIC
+        self.batch_size = max(1, self.config.GATEWAY_BATCH_SIZE)
+        self.batch_interval = self.config.GATEWAY_BATCH_INTERVAL
+        self.broker = LocalBroker(
+            host=self.config.GATEWAY_HOST,
+            port=self.config.GATEWAY_PORT,
+            on_publish=self._on_local_publish,
+            on_subscriptions=self._on_local_subscriptions,
+            local_delivery=False,
+        )
+        self.command_topics = {self.config.MQTT_TOPIC_SUB} | {
+            f"agent/{device_id}/cmd"
+            for device_id in [self.config.DEVICE_ID, *self.config.GATEWAY_DEVICE_IDS]
+        }
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.stats = {
+            "forwarded": 0,
+            "batches": 0,
+            "dropped": 0,
+            "commands": 0,
+            "rejected": 0,  # local publishes to command topics
+        }
+        # Messages waiting for the uplink; the oldest are dropped when full
+        self._queue = deque(maxlen=self.config.GATEWAY_QUEUE_SIZE)
+        self._upstream_filters: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    @property
+    def port(self) -> int:
+        return self.broker.port
+
+    def start(self) -> "MqttGateway":
+        self.broker.start()
+        self._threads = [
+            threading.Thread(target=self._upstream_loop, daemon=True),
+            threading.Thread(target=self._flush_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(
+            f"MQTT gateway on port {self.port}, forwarding to "
+            f"{self.upstream_host}:{self.upstream_port}"
+        )
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+        self.client.disconnect()
+        self.broker.stop()
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            queued = len(self._queue)
+            subscriptions = len(self._upstream_filters)
+            stats = dict(self.stats)
+        return {
+            "port": self.port,
+            "upstream_connected": self.client.is_connected(),
+            "clients": self.broker.clients,
+            "subscriptions": subscriptions,
+            "queued": queued,
+            **stats,
+        }
+
+    def flush(self) -> int:
+        """Forward queued messages upstream; returns how many were sent"""
+        if not self.client.is_connected():
+            return 0
+        sent = 0
+        while True:
+            with self._lock:
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(self.batch_size, len(self._queue)))
+                ]
+            if not batch:
+                return sent
+            if len(batch) == 1:
+                topic, payload = batch[0]
+            else:
+                topic = self.uplink_topic
+                payload = json.dumps(
+                    {
+                        "gateway": self.config.DEVICE_NAME,
+                        "messages": [_envelope(t, p) for t, p in batch],
+                    }
+                )
+            traffic.add("gateway", sent=mqtt_size(topic, payload))
+            self.client.publish(topic, payload)
+            with self._lock:
+                if len(batch) > 1:
+                    self.stats["batches"] += 1
+                self.stats["forwarded"] += len(batch)
+            sent += len(batch)
+
+    def _on_local_publish(self, client_id: str, topic: str, payload: bytes):
+        # Forwarded upstream, any agent's command topic would reach the fleet
+        if topic in self.command_topics or topic_matches("agent/+/cmd", topic):
+            logger.warning(f"Dropped a local publish to command topic {topic}")
+            with self._lock:
+                self.stats["rejected"] += 1
+            return
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.stats["dropped"] += 1
+            self._queue.append((topic, payload))
+            full = len(self._queue) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _on_local_subscriptions(self, filters: Set[str]):
+        # Only hosted agents' command topics are mirrored, never wildcards
+        filters = filters & self.command_topics
+        with self._lock:
+            added = filters - self._upstream_filters
+            removed = self._upstream_filters - filters
+            self._upstream_filters = set(filters)
+        if not self.client.is_connected():
+            return  # subscribed on (re)connect
+        if added:
+            self.client.subscribe([(topic_filter, 0) for topic_filter in added])
+        if removed:
+            self.client.unsubscribe(list(removed))
+
+    def _upstream_loop(self):
+        self.client.connect_async(self.upstream_host, self.upstream_port, 60)
+        self.client.loop_forever(retry_first_connection=True)
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.batch_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error forwarding gateway messages: {e}")
+
+    def _on_connect(self, client, userdata, flags, rc):
+        logger.info(f"MQTT gateway connected upstream with result code {rc}")
+        with self._lock:
+            filters = [(topic_filter, 0) for topic_filter in self._upstream_filters]
+        if filters:
+            client.subscribe(filters)
+        self._wake.set()  # send what queued up while disconnected
+
+    def _on_message(self, client, userdata, msg):
+        traffic.add("gateway", received=mqtt_size(msg.topic, msg.payload))
+        with self._lock:
+            self.stats["commands"] += 1
+        self.broker.publish(msg.topic, msg.payload)
+
+
+def _envelope(topic: str, payload: bytes) -> Dict[str, str]:
+    try:
+        return {"topic": topic, "payload": payload.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"topic": topic, "payload_b64": base64.b64encode(payload).decode()}
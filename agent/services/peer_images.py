@@ -0,0 +1,339 @@
+import hashlib
+import hmac
+import json
+import logging
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote, unquote
+
+import requests
+from docker.utils import parse_repository_tag
+
+from agent.config import Config
+from agent.utils.traffic import traffic
+
+logger = logging.getLogger("iot_agent")
+
+CHUNK_SIZE = 1024 * 1024
+# How far a signed request or announcement's clock may be off
+MAX_CLOCK_SKEW = 60
+AUTH_HEADER = "X-Peer-Auth"
+
+
+def normalize_tag(image_tag: str) -> str:
+    repository, tag = parse_repository_tag(image_tag)
+    return f"{repository}:{tag or 'latest'}"
+
+
+def _canonical(message: Dict) -> str:
+    return json.dumps(message, sort_keys=True, separators=(",", ":"))
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    """``GET /images`` lists the shared tags, ``GET /images/<tag>`` streams
+    ``docker save`` of one of them. Requests must be signed by a peer."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cache = self.server.cache
+        request_auth = self.headers.get(AUTH_HEADER, "")
+        if not cache.verify_request(self.path, request_auth):
+            logger.warning(
+                f"Refused unsigned image request from {self.client_address[0]}"
+            )
+            self._send_json(403, {"message": "forbidden"})
+            return
+        if self.path == "/images":
+            self._send_json(200, sorted(cache.local_images()))
+            return
+        if not self.path.startswith("/images/"):
+            self._send_json(404, {"message": "not found"})
+            return
+        tag = normalize_tag(unquote(self.path[len("/images/") :]))
+        if tag not in cache.local_images():
+            self._send_json(404, {"message": f"no such image: {tag}"})
+            return
+        if not cache._uploads.acquire(blocking=False):
+            self._send_json(503, {"message": "too many uploads"})
+            return
+        try:
+            image_id = cache.local_images()[tag]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-tar")
+            # Proves to the requester that this peer holds the shared secret
+            self.send_header(AUTH_HEADER, cache.sign(f"{request_auth}:{image_id}"))
+            self.end_headers()
+            sent = 0
+            for chunk in cache.client.api.get_image(tag, chunk_size=CHUNK_SIZE):
+                self.wfile.write(chunk)
+                sent += len(chunk)
+            traffic.add("peer", sent=sent)
+            logger.info(f"Served {tag} to peer {self.client_address[0]} ({sent} bytes)")
+        except Exception as e:
+            logger.error(f"Error serving {tag} to peer: {e}")
+        finally:
+            cache._uploads.release()
+
+    def _send_json(self, status: int, payload):
+        raw = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class PeerImageCache:
+    """Shares pulled images between agents on the same LAN.
+
+    Every agent serves the images it has over HTTP on ``PEER_PORT`` and
+    broadcasts the list on UDP ``PEER_DISCOVERY_PORT`` every
+    ``PEER_ANNOUNCE_INTERVAL`` seconds. To pull an image an agent first
+    fetches it from a peer that has it (``docker save`` piped into
+    ``docker load``). If no peer has it, only the leader (the live agent
+    with the lowest ``DEVICE_ID``) pulls from the registry; the others wait
+    up to ``PEER_WAIT_TIMEOUT`` seconds for it to appear on a peer, so a
+    site downloads each image from upstream once.
+
+    ``latest`` tags always come from the registry, since a peer's copy may
+    be older than the registry's; roll out with versioned tags.
+
+    Peers share ``PEER_SHARED_SECRET``: announcements, image requests and
+    image responses are signed with it (HMAC-SHA256), and a loaded image
+    must have the ID its peer announced, or it is deleted again and the
+    image comes from the registry.
+    """
+
+    def __init__(self, client, config=None):
+        self.client = client
+        self.config = config or Config
+        self.device_id = self.config.DEVICE_ID
+        self.port = self.config.PEER_PORT
+        self.interval = self.config.PEER_ANNOUNCE_INTERVAL
+        if not self.config.PEER_SHARED_SECRET:
+            raise ValueError("PEER_SHARED_SECRET is required to share images")
+        self._secret = self.config.PEER_SHARED_SECRET.encode("utf-8")
+        # device id -> host, port, images (tag -> image id), seen
+        self.peers: Dict[int, Dict] = {}
+        self._images: Optional[Dict[str, str]] = None
+        self._uploads = threading.Semaphore(self.config.PEER_MAX_UPLOADS)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._server = None
+        self._socket = None
+
+    def start(self) -> "PeerImageCache":
+        self._server = ThreadingHTTPServer(("0.0.0.0", self.port), _ImageHandler)
+        self._server.daemon_threads = True
+        self._server.cache = self
+        self.port = self._server.server_address[1]
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._socket.bind(("", self.config.PEER_DISCOVERY_PORT))
+        for target in (self._server.serve_forever, self._listen, self._announce_loop):
+            threading.Thread(target=target, daemon=True).start()
+        logger.info(f"Sharing images with peers on port {self.port}")
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._socket:
+            self._socket.close()
+
+    def local_images(self) -> Dict[str, str]:
+        """Image id by tag of the images present locally (cached until the
+        next pull)"""
+        if self._images is None:
+            try:
+                self._images = {
+                    tag: image.id
+                    for image in self.client.images.list()
+                    for tag in image.tags
+                }
+            except Exception as e:
+                logger.error(f"Error listing images: {e}")
+                return {}
+        return self._images
+
+    def sign(self, text: str) -> str:
+        return hmac.new(self._secret, text.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def request_auth(self, path: str) -> str:
+        """Value of the auth header for a request of ``path``"""
+        timestamp = f"{time.time():.3f}"
+        return f"{timestamp}:{self.sign(f'{timestamp}:{path}')}"
+
+    def verify_request(self, path: str, auth: str) -> bool:
+        timestamp, _, signature = auth.partition(":")
+        try:
+            fresh = abs(time.time() - float(timestamp)) <= MAX_CLOCK_SKEW
+        except ValueError:
+            return False
+        return fresh and hmac.compare_digest(
+            signature, self.sign(f"{timestamp}:{path}")
+        )
+
+    def announcement(self) -> Dict:
+        message = {
+            "device_id": self.device_id,
+            "port": self.port,
+            "images": self.local_images(),
+            "time": time.time(),
+        }
+        message["signature"] = self.sign(_canonical(message))
+        return message
+
+    def announce(self):
+        message = json.dumps(self.announcement()).encode("utf-8")
+        address = (self.config.PEER_BROADCAST_ADDRESS, self.config.PEER_DISCOVERY_PORT)
+        try:
+            self._socket.sendto(message, address)
+        except OSError as e:
+            logger.debug(f"Cannot announce images to peers: {e}")
+
+    def receive(self, message: Dict, host: str):
+        """Record a peer's announcement if it is signed and recent"""
+        device_id = message.get("device_id")
+        if device_id is None or device_id == self.device_id:
+            return
+        unsigned = {key: value for key, value in message.items() if key != "signature"}
+        if not hmac.compare_digest(
+            str(message.get("signature", "")), self.sign(_canonical(unsigned))
+        ):
+            logger.warning(f"Ignoring unsigned peer announcement from {host}")
+            return
+        if abs(time.time() - float(message["time"])) > MAX_CLOCK_SKEW:
+            logger.debug(f"Ignoring stale peer announcement from {host}")
+            return
+        with self._lock:
+            self.peers[device_id] = {
+                "host": host,
+                "port": message["port"],
+                "images": dict(message.get("images") or {}),
+                "seen": time.monotonic(),
+            }
+
+    def live_peers(self) -> Dict[int, Dict]:
+        """Peers heard from within the last three announce intervals"""
+        cutoff = time.monotonic() - 3 * self.interval
+        with self._lock:
+            return {
+                device_id: peer
+                for device_id, peer in self.peers.items()
+                if peer["seen"] >= cutoff
+            }
+
+    def is_leader(self) -> bool:
+        return all(device_id > self.device_id for device_id in self.live_peers())
+
+    def holders(self, tag: str) -> List[Dict]:
+        return [peer for peer in self.live_peers().values() if tag in peer["images"]]
+
+    def fetch(self, tag: str) -> bool:
+        """Load ``tag`` from the first peer that has it and can serve it"""
+        for peer in self.holders(tag):
+            path = f"/images/{quote(tag, safe='')}"
+            image_id = peer["images"][tag]
+            try:
+                received = self._load(
+                    f"http://{peer['host']}:{peer['port']}{path}", path, image_id
+                )
+                loaded = self.client.images.get(tag).id
+            except Exception as e:
+                logger.warning(f"Could not fetch {tag} from {peer['host']}: {e}")
+                continue
+            finally:
+                self._images = None
+            traffic.add("peer", received=received)
+            if loaded != image_id:
+                logger.error(
+                    f"Image {tag} from peer {peer['host']} is {loaded}, "
+                    f"announced as {image_id}; deleting it"
+                )
+                self._remove(tag)
+                continue
+            logger.info(f"Loaded {tag} from peer {peer['host']} ({received} bytes)")
+            return True
+        return False
+
+    def _remove(self, tag: str):
+        try:
+            self.client.images.remove(tag, force=True)
+        except Exception as e:
+            logger.error(f"Could not delete {tag}: {e}")
+
+    def pull(self, image_tag: str, upstream: Callable[[], bool]) -> bool:
+        """Get ``image_tag`` from a peer, or from ``upstream`` (the registry)
+        if this agent is the leader or no peer has it in time"""
+        tag = normalize_tag(image_tag)
+        if tag.endswith(":latest"):
+            return self._pull_upstream(upstream)
+        if tag in self.local_images():
+            return True
+        if self.fetch(tag):
+            self.announce()
+            return True
+        deadline = time.monotonic() + self.config.PEER_WAIT_TIMEOUT
+        while not self.is_leader() and time.monotonic() < deadline:
+            logger.info(f"Waiting for the leader to share {tag}")
+            if self._stopped.wait(min(self.interval, 5)):
+                break
+            if self.fetch(tag):
+                self.announce()
+                return True
+        return self._pull_upstream(upstream)
+
+    def _pull_upstream(self, upstream: Callable[[], bool]) -> bool:
+        pulled = upstream()
+        if pulled:
+            self._images = None
+            self.announce()
+        return pulled
+
+    def _load(self, url: str, path: str, image_id: str) -> int:
+        """``docker load`` an image from a peer that proves it holds the
+        shared secret; returns the bytes received"""
+        received = 0
+
+        def chunks(response):
+            nonlocal received
+            for chunk in response.iter_content(CHUNK_SIZE):
+                received += len(chunk)
+                yield chunk
+
+        auth = self.request_auth(path)
+        with requests.get(
+            url, headers={AUTH_HEADER: auth}, stream=True, timeout=(5, 60)
+        ) as response:
+            response.raise_for_status()
+            expected = self.sign(f"{auth}:{image_id}")
+            if not hmac.compare_digest(response.headers.get(AUTH_HEADER, ""), expected):
+                raise RuntimeError("response not signed by a peer")
+            for line in self.client.api.load_image(chunks(response)):
+                if "error" in line:
+                    raise RuntimeError(line["error"])
+        return received
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                data, (host, _) = self._socket.recvfrom(65536)
+                self.receive(json.loads(data), host)
+            except OSError:
+                return  # socket closed
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.debug(f"Ignoring bad peer announcement: {e}")
+
+    def _announce_loop(self):
+        while not self._stopped.is_set():
+            self.announce()
+            self._stopped.wait(self.interval)
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agent.client.heartbeat import state_hash
+
+logger = logging.getLogger("iot_agent")
+
+
+class Reconciler:
+    """Drive the device's container toward the desired state published by the backend.
+
+    The desired state (``image``, ``env``, ``config``) comes from the
+    backend's ``/device/{id}/updates`` endpoint, revalidated by ETag, or is
+    pushed in through ``notify`` when a heartbeat reply carries it. The
+    image and env are compared against the cached actual state from
+    ``DockerManager`` and action is only taken on a difference; ``config``
+    is a versioned runtime config update handed to ``apply_config``. The loop sleeps until woken by ``notify`` /
+    ``wake`` and falls back to polling every ``poll_interval`` seconds.
+    """
+
+    def __init__(self, backend_client, docker_manager, poll_interval: float):
+        self.backend_client = backend_client
+        self.docker_manager = docker_manager
+        self.poll_interval = poll_interval
+        self.desired: Dict[str, Any] = {}
+        self.last_result: Optional[str] = None
+        self.last_run: Optional[float] = None
+        self._pushed: Optional[Dict[str, Any]] = None
+        self._failed_hash: Optional[str] = None
+        self._failed_at = 0.0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        # Returns True while new images should not be pulled
+        self.defer_pulls: Callable[[], bool] = lambda: False
+        # Applies a runtime config update, returns (applied, reason)
+        self.apply_config: Optional[Callable[[Dict], Tuple[bool, str]]] = None
+        self._config_hash: Optional[str] = None
+        self._config_failed_hash: Optional[str] = None
+        self._config_failed_at = 0.0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self):
+        """Reconcile now instead of waiting for the next poll"""
+        self._wake.set()
+
+    def notify(self, desired: Dict[str, Any]):
+        """Reconcile now against a desired state pushed by the backend"""
+        with self._lock:
+            self._pushed = dict(desired)
+        self._wake.set()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "desired": self.desired,
+            "last_result": self.last_result,
+            "last_run": self.last_run,
+        }
+
+    def _loop(self):
+        while self._running:
+            self._wake.wait(timeout=self.poll_interval)
+            self._wake.clear()
+            if not self._running:
+                break
+            try:
+                self.reconcile_once()
+            except Exception as e:
+                logger.error(f"Error during reconciliation: {e}")
+
+    def reconcile_once(self) -> str:
+        """Run one reconciliation pass and return its outcome"""
+        self.last_run = time.time()
+        with self._lock:
+            desired, self._pushed = self._pushed, None
+        if desired is None:
+            desired = self.backend_client.get_desired_state()
+        if desired is None:
+            # Backend unreachable: keep converging on the last known state
+            desired = self.desired
+        self.desired = desired
+        config_applied = self._apply_config(desired.get("config"))
+
+        actual = self.docker_manager.get_actual_state()
+        changes = self._diff(desired, actual)
+        if not changes:
+            self.last_result = "applied" if config_applied else "in_sync"
+            return self.last_result
+
+        desired_hash = state_hash(desired)
+        if (
+            desired_hash == self._failed_hash
+            and time.monotonic() - self._failed_at < self.poll_interval
+        ):
+            self.last_result = "backoff"
+            return self.last_result
+
+        image = changes.get("image")
+        if image and image != actual.get("image") and self.defer_pulls():
+            self.last_result = "deferred"
+            return self.last_result
+
+        if self._apply(desired, actual, changes):
+            self._failed_hash = None
+            self.last_result = "applied"
+        else:
+            self._failed_hash = desired_hash
+            self._failed_at = time.monotonic()
+            self.last_result = "failed"
+        return self.last_result
+
+    def _diff(self, desired: Dict[str, Any], actual: Dict[str, Any]) -> Dict[str, Any]:
+        """Desired-state entries that differ from the actual container state"""
+        if "error" in actual:
+            return {}
+        changes = {}
+        image = desired.get("image")
+        if image and (image != actual.get("image") or not actual.get("running")):
+            changes["image"] = image
+        env = desired.get("env") or {}
+        actual_env = actual.get("env", {})
+        changed_env = {
+            key: value
+            for key, value in env.items()
+            if actual_env.get(key) != str(value)
+        }
+        if changed_env:
+            changes["env"] = changed_env
+        return changes
+
+    def _apply(
+        self, desired: Dict[str, Any], actual: Dict[str, Any], changes: Dict[str, Any]
+    ) -> bool:
+        # An env-only change recreates the container from its current image,
+        # which is already local: only a new image is pulled
+        image = desired.get("image") or actual.get("image")
+        pull = image != actual.get("image")
+        env = {key: str(value) for key, value in (desired.get("env") or {}).items()}
+        logger.info(f"Reconciling container toward desired state: {changes}")
+        self.backend_client.send_log(
+            f"Reconciling container: {sorted(changes)} -> {image or 'current image'}",
+            level="info",
+            log_type="deploy",
+        )
+        success = self.docker_manager.update_container(
+            image_tag=image, environment=env or None, pull=pull
+        )
+        if success:
+            # update_container also reports success after rolling a failed
+            # release back, so check what is actually running now
+            remaining = self._diff(
+                desired, self.docker_manager.get_actual_state(max_age=0)
+            )
+            if remaining:
+                logger.error(f"Desired state not reached, still differs: {remaining}")
+                success = False
+        if success:
+            self.backend_client.send_log(
+                f"Desired state applied successfully ({image or 'current image'}).",
+                level="info",
+                log_type="deploy",
+            )
+        else:
+            self.backend_client.send_log(
+                f"Failed to apply desired state ({image or 'current image'}).",
+                level="error",
+                log_type="rollback",
+            )
+        return success
+
+    def _apply_config(self, config: Optional[Dict[str, Any]]) -> bool:
+        """Hand a desired runtime config not yet applied to ``apply_config``.
+        A config that failed is retried after ``poll_interval``, like a
+        desired state that failed to apply."""
+        if not config or self.apply_config is None:
+            return False
+        config_hash = state_hash(config)
+        if config_hash == self._config_hash:
+            return False
+        if (
+            config_hash == self._config_failed_hash
+            and time.monotonic() - self._config_failed_at < self.poll_interval
+        ):
+            return False
+        applied, _ = self.apply_config(config)
+        if applied:
+            self._config_hash = config_hash
+            self._config_failed_hash = None
+        else:
+            self._config_failed_hash = config_hash
+            self._config_failed_at = time.monotonic()
+        return applied
@@ -0,0 +1,141 @@
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Set
+
+from agent.config import Config
+from agent.utils.traffic import traffic
+
+logger = logging.getLogger("iot_agent")
+
+MB = 1024 * 1024
+
+
+def current_rss() -> int:
+    """Resident memory of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ResourceBudget:
+    """The agent's own CPU, memory and network use against its budgets.
+
+    Every ``check`` measures the process since the previous one: CPU as a
+    percentage of one core, resident memory, and the bytes counted by the
+    traffic meter. CPU time is also attributed to the jobs run under
+    ``measure``, and network use to the traffic meter's subsystems.
+
+    While over its CPU or network budget the agent slows down: ``slowdown``
+    doubles per check, up to ``BUDGET_MAX_SLOWDOWN``, and halves per check
+    back within budget. A budget of 0 is not enforced.
+    """
+
+    def __init__(self, config=None, meter=traffic):
+        self.config = config or Config
+        self.meter = meter
+        self.cpu_budget = self.config.BUDGET_CPU_PERCENT
+        self.memory_budget = self.config.BUDGET_MEMORY_MB
+        self.network_budget = self.config.BUDGET_NETWORK_KBPS
+        self.max_slowdown = max(1, self.config.BUDGET_MAX_SLOWDOWN)
+        self.slowdown = 1
+        self.over: Set[str] = set()
+        self.usage: Dict[str, float] = {}
+        self.cpu_by_subsystem: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last = (time.monotonic(), time.process_time(), self._network_bytes())
+
+    @contextmanager
+    def measure(self, subsystem: str):
+        """Attribute the CPU time of the enclosed block to ``subsystem``"""
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            spent = time.thread_time() - start
+            with self._lock:
+                self.cpu_by_subsystem[subsystem] = (
+                    self.cpu_by_subsystem.get(subsystem, 0.0) + spent
+                )
+
+    @property
+    def defer_pulls(self) -> bool:
+        """Whether downloads that can wait (image pulls) should wait"""
+        return "network" in self.over
+
+    def check(self) -> Set[str]:
+        """Measure usage since the last check; returns the budgets newly
+        exceeded"""
+        now, cpu, moved = time.monotonic(), time.process_time(), self._network_bytes()
+        last_now, last_cpu, last_moved = self._last
+        self._last = (now, cpu, moved)
+        elapsed = max(now - last_now, 1e-6)
+        self.usage = {
+            "cpu_percent": round((cpu - last_cpu) / elapsed * 100, 1),
+            "memory_mb": round(current_rss() / MB, 1),
+            "network_kbps": round((moved - last_moved) / elapsed / 1024, 2),
+        }
+        limits = {
+            "cpu": (self.usage["cpu_percent"], self.cpu_budget),
+            "memory": (self.usage["memory_mb"], self.memory_budget),
+            "network": (self.usage["network_kbps"], self.network_budget),
+        }
+        over = {name for name, (used, limit) in limits.items() if 0 < limit < used}
+
+        if over & {"cpu", "network"}:
+            self.slowdown = min(self.max_slowdown, self.slowdown * 2)
+        else:
+            self.slowdown = max(1, self.slowdown // 2)
+        exceeded = over - self.over
+        for name in sorted(exceeded):
+            used, limit = limits[name]
+            logger.warning(f"Agent over its {name} budget: {used} > {limit}")
+        if self.over and not over:
+            logger.info("Agent back within its resource budgets")
+        self.over = over
+        return exceeded
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            cpu = {
+                name: round(spent, 3) for name, spent in self.cpu_by_subsystem.items()
+            }
+        return {
+            "usage": dict(self.usage),
+            "budgets": {
+                "cpu_percent": self.cpu_budget,
+                "memory_mb": self.memory_budget,
+                "network_kbps": self.network_budget,
+            },
+            "over": sorted(self.over),
+            "slowdown": self.slowdown,
+            "cpu_seconds": cpu,
+            "network_bytes": {
+                name: counter["sent"] + counter["received"]
+                for name, counter in self.meter.snapshot().items()
+            },
+        }
+
+    def _network_bytes(self) -> int:
+        return sum(
+            counter["sent"] + counter["received"]
+            for counter in self.meter.snapshot().values()
+        )
+
+
+def lower_priority(niceness: int) -> Optional[int]:
+    """Lower this process's scheduling priority so the workload sharing the
+    device comes first; returns the new niceness"""
+    if niceness <= 0:
+        return None
+    try:
+        return os.nice(niceness)
+    except OSError as e:
+        logger.warning(f"Cannot lower the agent's priority: {e}")
+        return None
@@ -0,0 +1,201 @@
+import json
+import logging
+import operator
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("iot_agent")
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+AGGREGATES = ("mean", "min", "max", "count")
+
+
+def _threshold():
+    """The sample value itself"""
+    return lambda value, ts: value
+
+
+def _rate():
+    """Change per second since the previous sample"""
+    previous = None
+
+    def observe(value, ts):
+        nonlocal previous
+        last, previous = previous, (value, ts)
+        if last is None or ts <= last[1]:
+            return None
+        return (value - last[0]) / (ts - last[1])
+
+    return observe
+
+
+def _window(agg: str, seconds: float):
+    """``agg`` over the samples of the last ``seconds``, in O(1) amortised"""
+    samples = deque()  # (ts, value)
+    extreme = deque()  # monotonic (ts, value) for min/max
+    better = operator.le if agg == "min" else operator.ge
+    total = 0.0
+
+    def observe(value, ts):
+        nonlocal total
+        samples.append((ts, value))
+        total += value
+        while samples[0][0] <= ts - seconds:
+            total -= samples.popleft()[1]
+        if agg == "mean":
+            return total / len(samples)
+        if agg == "count":
+            return len(samples)
+        while extreme and better(value, extreme[-1][1]):
+            extreme.pop()
+        extreme.append((ts, value))
+        while extreme[0][0] <= ts - seconds:
+            extreme.popleft()
+        return extreme[0][1]
+
+    return observe
+
+
+class Rule:
+    """One compiled rule: an observer over a sensor stream and a comparison.
+
+    A rule fires when its condition becomes true, not on every matching
+    sample, and then not again for ``cooldown`` seconds.
+    """
+
+    __slots__ = (
+        "name",
+        "sensor",
+        "action",
+        "cooldown",
+        "_observe",
+        "_compare",
+        "_value",
+        "_active",
+        "_fired_at",
+        "spec",
+    )
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = spec
+        try:
+            self.name = str(spec["name"])
+            self.sensor = str(spec["sensor"])
+            kind = spec.get("type", "threshold")
+            self._compare = OPERATORS[spec.get("op", ">")]
+            self._value = float(spec["value"])
+            self.cooldown = float(spec.get("cooldown", 0))
+        except KeyError as e:
+            raise ValueError(f"rule {spec.get('name', '?')}: missing or bad {e}")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"rule {spec.get('name', '?')}: {e}")
+
+        if kind == "threshold":
+            self._observe = _threshold()
+        elif kind == "rate":
+            self._observe = _rate()
+        elif kind == "window":
+            agg = spec.get("agg", "mean")
+            seconds = spec.get("window", 60)
+            if agg not in AGGREGATES:
+                raise ValueError(f"rule {self.name}: unknown aggregate {agg!r}")
+            if not isinstance(seconds, (int, float)) or seconds <= 0:
+                raise ValueError(f"rule {self.name}: window must be positive")
+            self._observe = _window(agg, float(seconds))
+        else:
+            raise ValueError(f"rule {self.name}: unknown type {kind!r}")
+
+        action = spec.get("action", "publish")
+        if action != "publish" and not (
+            isinstance(action, dict) and isinstance(action.get("command"), str)
+        ):
+            raise ValueError(
+                f"rule {self.name}: action must be 'publish' or {{'command': ...}}"
+            )
+        self.action = action
+        self._active = False
+        self._fired_at = None
+
+    def check(self, value: float, ts: float) -> Optional[float]:
+        """Feed one sample; returns the observed value if the rule fires"""
+        observed = self._observe(value, ts)
+        matched = observed is not None and self._compare(observed, self._value)
+        rising = matched and not self._active
+        self._active = matched
+        if not rising:
+            return None
+        if self._fired_at is not None and ts - self._fired_at < self.cooldown:
+            return None
+        self._fired_at = ts
+        return observed
+
+
+class RuleEngine:
+    """Threshold, rate-of-change and windowed rules over sensor samples.
+
+    Rules are compiled once into per-sensor observers, so evaluating a
+    sample only touches the rules for the sensors it contains.
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        self._by_sensor: Dict[str, List[Rule]] = {}
+        self.rules: List[Rule] = []
+        self.load(rules or [])
+
+    def load(self, rules: List[Dict[str, Any]]):
+        """Replace all rules; raises ``ValueError`` (keeping the old rules)
+        if any rule is invalid"""
+        if not isinstance(rules, list):
+            raise ValueError("rules must be a list")
+        compiled = [Rule(spec) for spec in rules]
+        names = [rule.name for rule in compiled]
+        if len(set(names)) != len(names):
+            raise ValueError("rule names must be unique")
+        by_sensor: Dict[str, List[Rule]] = {}
+        for rule in compiled:
+            by_sensor.setdefault(rule.sensor, []).append(rule)
+        self.rules, self._by_sensor = compiled, by_sensor
+
+    def evaluate(self, sample: Dict[str, Any], ts: Optional[float] = None) -> List:
+        """Events for the rules that fire on this sample"""
+        now = time.monotonic() if ts is None else ts
+        events = []
+        for sensor, value in sample.items():
+            for rule in self._by_sensor.get(sensor, ()):
+                try:
+                    observed = rule.check(float(value), now)
+                except (TypeError, ValueError):
+                    continue
+                if observed is not None:
+                    events.append(
+                        {
+                            "rule": rule.name,
+                            "sensor": sensor,
+                            "value": value,
+                            "observed": round(observed, 4),
+                            "action": rule.action,
+                            "timestamp": time.time(),
+                        }
+                    )
+        return events
+
+
+def load_rules(path: str) -> List[Dict[str, Any]]:
+    """Rule specs from a JSON file; an empty list if it cannot be read"""
+    if not path:
+        return []
+    try:
+        with open(path) as f:
+            rules = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot load rules from {path}: {e}")
+        return []
+    return rules if isinstance(rules, list) else []
@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("iot_agent")
+
+# Task priorities; lower runs first
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# What happens to the runs of a task that were missed, because the agent was
+# busy or the previous run was still going when they were due
+SKIP = "skip"  # drop runs that would start later than the task's deadline
+COALESCE = "coalesce"  # one run makes up for all the missed ones
+CATCH_UP = "catch_up"  # every missed run happens, up to MAX_CATCH_UP
+MISSED_POLICIES = (SKIP, COALESCE, CATCH_UP)
+MAX_CATCH_UP = 10
+
+
+class Task:
+    """A periodic task and how to run it.
+
+    ``deadline`` is how late after its due time a run may still start
+    (default: one interval), ``timeout`` how long a run may take before the
+    watchdog treats it as stuck, and ``blocking`` tasks run on a separate
+    executor so they cannot hold up the others.
+    """
+
+    __slots__ = (
+        "name",
+        "func",
+        "interval",
+        "priority",
+        "deadline",
+        "timeout",
+        "missed",
+        "blocking",
+        "next_run",
+        "owed",
+        "runs",
+        "missed_runs",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        interval: float,
+        priority: int = NORMAL,
+        deadline: Optional[float] = None,
+        timeout: Optional[float] = None,
+        missed: str = COALESCE,
+        blocking: bool = False,
+        start: Optional[float] = None,
+    ):
+        if interval <= 0:
+            raise ValueError(f"task {name}: interval must be positive")
+        if missed not in MISSED_POLICIES:
+            raise ValueError(f"task {name}: unknown missed-run policy {missed!r}")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.priority = priority
+        self.deadline = interval if deadline is None else deadline
+        self.timeout = timeout
+        self.missed = missed
+        self.blocking = blocking
+        self.next_run = (time.monotonic() if start is None else start) + interval
+        self.owed = 0  # runs due but not started yet
+        self.runs = 0
+        self.missed_runs = 0
+
+    def collect(self, now: float):
+        """Account for the runs that fell due by ``now``, keeping the task on
+        its original grid so an overrun does not shift later runs"""
+        if now < self.next_run:
+            return
+        late = now - self.next_run
+        periods = int(late // self.interval) + 1
+        self.next_run += periods * self.interval
+        if self.missed == CATCH_UP:
+            owed = self.owed + periods
+            self.owed = min(owed, MAX_CATCH_UP)
+            self.missed_runs += owed - self.owed
+        elif self.missed == COALESCE:
+            self.missed_runs += periods - 1 + self.owed
+            self.owed = 1
+        else:
+            # Only the latest due run may start, and only if it is on time
+            on_time = late % self.interval <= self.deadline
+            self.missed_runs += periods - on_time + self.owed
+            self.owed = int(on_time)
+
+
+class Scheduler:
+    """Periodic tasks with priorities, deadlines and missed-run policies.
+
+    ``run_pending`` starts the due runs through ``dispatch`` in priority
+    order, then by due time. ``dispatch(task)`` returns False when the task
+    cannot start because its previous run is still going; a ``catch_up``
+    task then keeps the run owed for the next call, the other policies
+    count it as missed.
+    """
+
+    def __init__(self, dispatch: Callable[[Task], bool], clock=time.monotonic):
+        self.dispatch = dispatch
+        self.clock = clock
+        self.tasks: Dict[str, Task] = {}
+        self._lock = threading.Lock()
+
+    def every(self, name: str, interval: float, func: Callable, **policy) -> Task:
+        """Run ``func`` every ``interval`` seconds, replacing a task of the
+        same name"""
+        task = Task(name, func, interval, start=self.clock(), **policy)
+        with self._lock:
+            self.tasks[name] = task
+        return task
+
+    def cancel(self, name: str):
+        with self._lock:
+            self.tasks.pop(name, None)
+
+    def run_pending(self) -> int:
+        """Start the runs that are due; returns how many started"""
+        now = self.clock()
+        with self._lock:
+            tasks = list(self.tasks.values())
+        for task in tasks:
+            task.collect(now)
+        started = 0
+        due = [task for task in tasks if task.owed]
+        for task in sorted(due, key=lambda task: (task.priority, task.next_run)):
+            if self.dispatch(task):
+                task.owed -= 1
+                task.runs += 1
+                started += 1
+            elif task.missed != CATCH_UP:
+                task.missed_runs += task.owed
+                task.owed = 0
+        return started
+
+    def get_status(self) -> Dict[str, Dict]:
+        now = self.clock()
+        with self._lock:
+            return {
+                name: {
+                    "interval": task.interval,
+                    "priority": task.priority,
+                    "next_run_in": round(max(0.0, task.next_run - now), 1),
+                    "runs": task.runs,
+                    "missed": task.missed_runs,
+                }
+                for name, task in self.tasks.items()
+            }
+
+
+class PriorityExecutor:
+    """Thread pool that runs queued work by priority, then in order.
+
+    ``reserved`` of the workers only take ``HIGH`` priority work, so
+    liveness tasks (heartbeats) find a free worker even when slow work
+    occupies all the others. Has the ``submit``/``map``/``shutdown``
+    interface of ``ThreadPoolExecutor``.
+    """
+
+    def __init__(
+        self, max_workers: int, reserved: int = 1, thread_name_prefix: str = "worker"
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        reserved = min(reserved, max_workers - 1)
+        self._queue = []  # (priority, sequence, future, fn, args, kwargs)
+        self._sequence = itertools.count()
+        self._ready = threading.Condition()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(
+                target=self._worker,
+                args=(index < reserved,),
+                name=f"{thread_name_prefix}_{index}",
+                daemon=True,
+            )
+            for index in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, /, *args, priority: int = NORMAL, **kwargs) -> Future:
+        future = Future()
+        with self._ready:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new work after shutdown")
+            heapq.heappush(
+                self._queue,
+                (priority, next(self._sequence), future, fn, args, kwargs),
+            )
+            self._ready.notify_all()
+        return future
+
+    def map(self, fn, *iterables, priority: int = NORMAL):
+        futures = [
+            self.submit(fn, *args, priority=priority) for args in zip(*iterables)
+        ]
+        return (future.result() for future in futures)
+
+    def shutdown(self, wait: bool = True):
+        """Stop taking work; queued work still runs"""
+        with self._ready:
+            self._shutdown = True
+            self._ready.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next(self, high_only: bool):
+        with self._ready:
+            while True:
+                if self._queue and (not high_only or self._queue[0][0] <= HIGH):
+                    return heapq.heappop(self._queue)
+                if self._shutdown and not self._queue:
+                    return None
+                if self._shutdown and high_only:
+                    return None  # the other workers drain the rest
+                self._ready.wait()
+
+    def _worker(self, high_only: bool):
+        while True:
+            item = self._next(high_only)
+            if item is None:
+                return
+            _, _, future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
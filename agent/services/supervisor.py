@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("iot_agent")
+
+MAX_BACKOFF = 60.0
+
+
+class Supervisor:
+    """Watchdog for the agent's scheduled jobs and service threads.
+
+    Jobs report each run with ``begin``/``end``. A run still going after the
+    job's deadline is stalled (typically blocked on the network): it is
+    reported and abandoned, and the job's ``restart`` is called to reset
+    what it was blocked on. The job is not run again until the abandoned
+    run returns, so stuck runs never take more than one worker of a fixed
+    pool; the work itself must give up on its own (the backend transports
+    enforce a total timeout per request).
+
+    Services are checked with their ``alive`` callable every ``interval``
+    seconds and restarted as soon as it returns False, e.g. when their
+    thread has died. A service that keeps failing is restarted with
+    exponential backoff, up to once a minute.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.tasks: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def job(self, name: str, deadline: float, restart: Optional[Callable] = None):
+        """Supervise the runs of a job, which may take up to ``deadline`` s"""
+        self._add(
+            name,
+            deadline=deadline,
+            restart=restart,
+            started=None,
+            run=0,
+            abandoned={},  # run -> start time of runs abandoned but not returned
+            abandoned_total=0,
+        )
+
+    def watch(self, name: str, alive: Callable[[], bool], restart: Callable):
+        """Restart a service when ``alive()`` is False. Watching a name again
+        (e.g. the replacement service) keeps its restart history."""
+        self._add(name, alive=alive, restart=restart)
+
+    def _add(self, name: str, **task):
+        with self._lock:
+            existing = self.tasks.get(name)
+            if existing is not None:
+                existing.update(
+                    (key, value)
+                    for key, value in task.items()
+                    if key not in ("started", "run", "abandoned", "abandoned_total")
+                )
+                return
+            task.update(restarts=0, failures=0, retry_at=0.0, last_restart=None)
+            self.tasks[name] = task
+
+    def begin(self, name: str) -> Optional[int]:
+        """Start a run of ``name``; None if the previous run is still going"""
+        with self._lock:
+            task = self.tasks[name]
+            if task["started"] is not None or task["abandoned"]:
+                return None
+            task["run"] += 1
+            task["started"] = time.monotonic()
+            return task["run"]
+
+    def end(self, name: str, run: int):
+        """Finish a run; a run abandoned as stalled is only uncounted"""
+        with self._lock:
+            task = self.tasks[name]
+            started = task["abandoned"].pop(run, None)
+            if started is not None:
+                logger.info(
+                    f"Watchdog: abandoned run of {name} returned after "
+                    f"{time.monotonic() - started:.1f}s"
+                )
+            elif task["run"] == run:
+                task["started"] = None
+                task["failures"] = 0
+
+    def check(self) -> List[str]:
+        """Restart the stalled jobs and dead services; returns their names"""
+        now = time.monotonic()
+        failed = []
+        with self._lock:
+            tasks = list(self.tasks.items())
+        for name, task in tasks:
+            if now < task["retry_at"]:
+                continue
+            if "alive" in task:
+                try:
+                    healthy = task["alive"]()
+                except Exception:
+                    healthy = False
+                if healthy:
+                    task["failures"] = 0
+                    continue
+                reason = "is not running"
+            else:
+                with self._lock:
+                    started = task["started"]
+                    if started is None or now - started <= task["deadline"]:
+                        continue
+                    # Abandon the stuck run; the job waits until it returns
+                    task["started"] = None
+                    task["abandoned"][task["run"]] = started
+                    task["abandoned_total"] += 1
+                reason = f"stalled for {now - started:.1f}s"
+            failed.append(name)
+            self._restart(name, task, reason, now)
+        return failed
+
+    def _restart(self, name: str, task: Dict, reason: str, now: float):
+        logger.warning(f"Watchdog: {name} {reason}, restarting")
+        task["failures"] += 1
+        task["restarts"] += 1
+        task["last_restart"] = time.time()
+        task["retry_at"] = now + min(
+            MAX_BACKOFF, self.interval * 2 ** (task["failures"] - 1)
+        )
+        if task["restart"] is None:
+            return
+        try:
+            task["restart"]()
+        except Exception as e:
+            logger.error(f"Watchdog: restarting {name} failed: {e}")
+
+    def start(self) -> "Supervisor":
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def get_status(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        status = {}
+        with self._lock:
+            for name, task in self.tasks.items():
+                started = task.get("started")
+                status[name] = {
+                    "running_for": None if started is None else round(now - started, 1),
+                    "restarts": task["restarts"],
+                    "last_restart": task["last_restart"],
+                }
+                if "abandoned" in task:
+                    status[name]["abandoned"] = len(task["abandoned"])
+                    status[name]["abandoned_total"] = task["abandoned_total"]
+        return status
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Watchdog check failed: {e}")
@@ -1,24 +1,77 @@
 import logging
+import threading
 import time
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import psutil
 
+from agent.config import Config
+from agent.services.alert_manager import AlertManager
+from agent.utils.traffic import traffic
+
 logger = logging.getLogger("iot_agent")
 
+NET_FIELDS = (
+    "bytes_sent",
+    "bytes_recv",
+    "packets_sent",
+    "packets_recv",
+    "errin",
+    "errout",
+    "dropin",
+    "dropout",
+)
+DISK_FIELDS = ("read_bytes", "write_bytes", "read_count", "write_count")
+
 
 class SystemMonitor:
     """Monitor system resources and health"""
 
-    def __init__(self):
+    def __init__(self, max_age: float = 0, store=None, containers=None):
+        """``max_age`` > 0 reuses a sample for that many seconds.
+
+        That lets one monitor be shared by several agents in a process
+        without each of them taking its own (blocking) CPU sample. Every
+        sample is recorded in ``store`` (a ``MetricsStore``) when given, and
+        ``containers`` (a ``ContainerStats``) adds per-container usage to
+        the health status.
+        """
         self.last_cpu_percent = 0
         self.last_memory_percent = 0
+        self.max_age = max_age
+        self.store = store
+        self.containers = containers
+        self.thresholds = {
+            "cpu": Config.CPU_THRESHOLD,
+            "memory": Config.MEMORY_THRESHOLD,
+            "disk": Config.DISK_THRESHOLD,
+            "container_cpu": Config.CONTAINER_CPU_THRESHOLD,
+            "container_memory": Config.CONTAINER_MEMORY_THRESHOLD,
+        }
+        self.alerts = AlertManager()
+        self._sample = None
+        self._sample_time = 0.0
+        self._lock = threading.Lock()
+        self._last_cpu_times = None
+        self._last_io = None
+        self._cpu_percent()  # baseline for the first non-blocking reading
+        self._io_rates()
 
     def get_system_info(self) -> Dict[str, Any]:
         """Get comprehensive system information"""
+        if not self.max_age:
+            return self._sample_system_info()
+        with self._lock:
+            now = time.monotonic()
+            if self._sample is None or now - self._sample_time >= self.max_age:
+                self._sample = self._sample_system_info()
+                self._sample_time = now
+            return self._sample
+
+    def _sample_system_info(self) -> Dict[str, Any]:
         try:
             # CPU information
-            cpu_percent = psutil.cpu_percent(interval=1)
+            cpu_percent = self._cpu_percent()
             cpu_count = psutil.cpu_count()
             cpu_freq = psutil.cpu_freq()
 
@@ -30,10 +83,13 @@ class SystemMonitor:
 
             # Network information
             network = psutil.net_io_counters()
+            interfaces, disks, disk_total = self._io_rates()
 
             # Boot time
             boot_time = psutil.boot_time()
 
+            self.last_memory_percent = memory.percent
+            self._record(cpu_percent, memory.percent, disk.percent)
             return {
                 "timestamp": time.time(),
                 "cpu": {
@@ -63,96 +119,168 @@ class SystemMonitor:
                     "bytes_recv": network.bytes_recv,
                     "packets_sent": network.packets_sent,
                     "packets_recv": network.packets_recv,
+                    # Per second since the previous sample; totals skip loopback
+                    "rates": _sum_rates(
+                        rates for name, rates in interfaces.items() if name != "lo"
+                    ),
+                    "interfaces": interfaces,
+                    "agent": traffic.snapshot(),
                 },
+                "disk_io": {"rates": disk_total, "disks": disks},
                 "system": {"boot_time": boot_time, "uptime": time.time() - boot_time},
             }
         except Exception as e:
             logger.error(f"Error getting system info: {e}")
             return {"error": str(e)}
 
-    def get_health_status(self) -> Dict[str, Any]:
-        """Get system health status with thresholds"""
+    def _io_rates(self):
+        """Per-interface network and per-disk I/O rates since the previous call.
+
+        Returns ``(interfaces, disks, disk_total)``; rates are per second
+        and zero on the first call or when a counter was reset.
+        """
+        now = time.monotonic()
+        nics = psutil.net_io_counters(pernic=True) or {}
+        disks = psutil.disk_io_counters(perdisk=True) or {}
+        disk_total = psutil.disk_io_counters()
+        last, self._last_io = self._last_io, (now, nics, disks, disk_total)
+        if last is None:
+            last = (now, {}, {}, None)
+        elapsed = now - last[0]
+        return (
+            {
+                name: _rates(last[1].get(name), counters, elapsed, NET_FIELDS)
+                for name, counters in nics.items()
+            },
+            {
+                name: _rates(last[2].get(name), counters, elapsed, DISK_FIELDS)
+                for name, counters in disks.items()
+            },
+            _rates(last[3], disk_total, elapsed, DISK_FIELDS) if disk_total else {},
+        )
+
+    def _record(self, cpu: float, memory: float, disk: float):
+        if self.store is None:
+            return
+        try:
+            self.store.append({"cpu": cpu, "memory": memory, "disk": disk})
+        except Exception as e:
+            logger.warning(f"Could not record metrics: {e}")
+
+    def _cpu_percent(self) -> float:
+        """CPU usage since the previous call, without blocking to sample.
+
+        Kept per instance rather than using ``psutil.cpu_percent(None)``,
+        whose baseline is shared by every caller in the process.
+        """
+        times = psutil.cpu_times()
+        # guest time is already counted in user/nice on Linux
+        total = (
+            sum(times) - getattr(times, "guest", 0) - getattr(times, "guest_nice", 0)
+        )
+        idle = times.idle + getattr(times, "iowait", 0)
+        last, self._last_cpu_times = self._last_cpu_times, (total, idle)
+        if last is not None and total > last[0]:
+            busy = (total - last[0]) - (idle - last[1])
+            self.last_cpu_percent = round(max(0.0, 100 * busy / (total - last[0])), 1)
+        return self.last_cpu_percent
+
+    def get_health_status(
+        self, thresholds: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Any]:
+        """Get system health status with thresholds.
+
+        ``thresholds`` (``cpu``/``memory``/``disk`` and ``container_cpu``/
+        ``container_memory`` percentages) override the configured ones, so
+        agents sharing a monitor can each use their own.
+        """
         system_info = self.get_system_info()
 
         if "error" in system_info:
             return {"status": "error", "message": system_info["error"]}
 
-        # Define thresholds
-        cpu_threshold = 80
-        memory_threshold = 85
-        disk_threshold = 90
+        thresholds = {**self.thresholds, **(thresholds or {})}
+        cpu_threshold = thresholds["cpu"]
+        memory_threshold = thresholds["memory"]
+        disk_threshold = thresholds["disk"]
 
         # Check health
         cpu_ok = system_info["cpu"]["percent"] < cpu_threshold
         memory_ok = system_info["memory"]["percent"] < memory_threshold
         disk_ok = system_info["disk"]["percent"] < disk_threshold
 
-        overall_status = "healthy" if all([cpu_ok, memory_ok, disk_ok]) else "warning"
-
-        return {
-            "status": overall_status,
-            "checks": {
-                "cpu": {
-                    "status": "ok" if cpu_ok else "warning",
-                    "value": system_info["cpu"]["percent"],
-                    "threshold": cpu_threshold,
-                },
-                "memory": {
-                    "status": "ok" if memory_ok else "warning",
-                    "value": system_info["memory"]["percent"],
-                    "threshold": memory_threshold,
-                },
-                "disk": {
-                    "status": "ok" if disk_ok else "warning",
-                    "value": system_info["disk"]["percent"],
-                    "threshold": disk_threshold,
-                },
+        checks = {
+            "cpu": {
+                "status": "ok" if cpu_ok else "warning",
+                "value": system_info["cpu"]["percent"],
+                "threshold": cpu_threshold,
+            },
+            "memory": {
+                "status": "ok" if memory_ok else "warning",
+                "value": system_info["memory"]["percent"],
+                "threshold": memory_threshold,
+            },
+            "disk": {
+                "status": "ok" if disk_ok else "warning",
+                "value": system_info["disk"]["percent"],
+                "threshold": disk_threshold,
             },
-            "system_info": system_info,
         }
+        health = {"system_info": system_info}
+        if self.containers is not None:
+            health["containers"] = self._container_checks(checks, thresholds)
 
-    def check_alerts(self) -> list:
-        """Check for system alerts"""
-        alerts = []
-        health = self.get_health_status()
-
-        if health["status"] == "error":
-            alerts.append(
-                {
-                    "level": "ERROR",
-                    "message": f"System monitoring error: {health.get('message', 'Unknown error')}",
-                    "timestamp": time.time(),
+        ok = all(check["status"] == "ok" for check in checks.values())
+        return {"status": "healthy" if ok else "warning", "checks": checks, **health}
+
+    def _container_checks(self, checks, thresholds) -> Dict[str, Any]:
+        """Add a CPU and memory check per container; returns their usage"""
+        try:
+            usage = self.containers.sample()
+        except Exception as e:
+            logger.error(f"Error getting container usage: {e}")
+            return {"error": str(e)}
+        for name, stats in usage.items():
+            for metric in ("cpu", "memory"):
+                value = stats.get(f"{metric}_percent")
+                if value is None:
+                    continue  # no CPU delta until the second sample
+                threshold = thresholds[f"container_{metric}"]
+                checks[f"container/{name}/{metric}"] = {
+                    "status": "ok" if value < threshold else "warning",
+                    "value": value,
+                    "threshold": threshold,
                 }
-            )
-            return alerts
+        return usage
 
-        checks = health["checks"]
+    def check_alerts(
+        self,
+        thresholds: Optional[Dict[str, float]] = None,
+        alerts: Optional[AlertManager] = None,
+    ) -> list:
+        """Check for system alerts.
+
+        Alerts are stateful (see ``AlertManager``): a condition is reported
+        when it starts and when it resolves, not on every check. Agents
+        sharing this monitor pass their own ``alerts`` manager.
+        """
+        health = self.get_health_status(thresholds)
+        return (alerts or self.alerts).evaluate(health)
+
+
+def _rates(previous, current, elapsed: float, fields) -> Dict[str, float]:
+    """Per-second change of each counter field between two psutil samples"""
+    rates = {}
+    for field in fields:
+        delta = getattr(current, field) - getattr(previous, field) if previous else 0
+        # A negative delta means the counter wrapped or the device was reset
+        rates[f"{field}_per_sec"] = round(delta / elapsed, 1) if delta > 0 else 0.0
+    return rates
 
-        if not checks["cpu"]["status"] == "ok":
-            alerts.append(
-                {
-                    "level": "WARNING",
-                    "message": f"High CPU usage: {checks['cpu']['value']}%",
-                    "timestamp": time.time(),
-                }
-            )
-
-        if not checks["memory"]["status"] == "ok":
-            alerts.append(
-                {
-                    "level": "WARNING",
-                    "message": f"High memory usage: {checks['memory']['value']}%",
-                    "timestamp": time.time(),
-                }
-            )
-
-        if not checks["disk"]["status"] == "ok":
-            alerts.append(
-                {
-                    "level": "WARNING",
-                    "message": f"High disk usage: {checks['disk']['value']}%",
-                    "timestamp": time.time(),
-                }
-            )
 
-        return alerts
+def _sum_rates(rates_list) -> Dict[str, float]:
+    total = {f"{field}_per_sec": 0.0 for field in NET_FIELDS}
+    for rates in rates_list:
+        for key, value in rates.items():
+            total[key] = round(total[key] + value, 1)
+    return total
@@ -0,0 +1,8 @@
+"""
+Benchmarks for the agent's hot paths.
+
+Run the suite and compare against the committed baseline:
+    python -m agent.tests.benchmarks
+Record a new baseline after an intended change:
+    python -m agent.tests.benchmarks --save
+"""
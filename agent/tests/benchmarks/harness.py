@@ -0,0 +1,93 @@
+import json
+import os
+import platform
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Default location of the committed baseline results
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+
+# A benchmark regresses when its median is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.5
+
+
+def measure(
+    func: Callable[[], Any],
+    min_time: float = 0.5,
+    min_rounds: int = 3,
+    max_rounds: int = 10000,
+    warmup: int = 1,
+) -> Dict[str, float]:
+    """Time ``func`` until both ``min_time`` seconds and ``min_rounds`` have passed"""
+    for _ in range(warmup):
+        func()
+    samples: List[float] = []
+    started = time.perf_counter()
+    while len(samples) < max_rounds and (
+        len(samples) < min_rounds or time.perf_counter() - started < min_time
+    ):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    samples.sort()
+    return {
+        "rounds": len(samples),
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "max": samples[-1],
+    }
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: str = BASELINE_PATH):
+    with open(path, "w") as f:
+        json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+        f.write("\n")
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Optional[Dict[str, Any]],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> List[Dict[str, Any]]:
+    """Benchmarks whose median is more than ``tolerance`` slower than the baseline"""
+    if not baseline:
+        return []
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference or not reference.get("median"):
+            continue
+        ratio = result["median"] / reference["median"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                {
+                    "name": name,
+                    "median": result["median"],
+                    "baseline": reference["median"],
+                    "ratio": ratio,
+                }
+            )
+    return regressions
@@ -0,0 +1,89 @@
+import argparse
+import json
+import logging
+from typing import Dict, Optional
+
+from agent.tests.benchmarks import harness
+from agent.tests.benchmarks.suite import BENCHMARKS
+
+
+def run_suite(
+    pattern: Optional[str] = None, quick: bool = False
+) -> Dict[str, Dict[str, float]]:
+    """Run the registered benchmarks whose name contains ``pattern``.
+
+    ``quick`` runs each one only a couple of times, to check that the
+    suite works rather than to produce meaningful numbers.
+    """
+    results = {}
+    for name, (factory, batch, measure_kwargs) in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        options = dict(measure_kwargs)
+        if quick:
+            options.update(min_time=0, min_rounds=1, warmup=0)
+        bench = factory()
+        try:
+            result = harness.measure(next(bench), **options)
+        finally:
+            bench.close()
+        result["batch"] = batch
+        result["ops_per_second"] = batch / result["median"] if result["median"] else 0
+        results[name] = result
+    return results
+
+
+def _print_results(results, baseline):
+    reference = (baseline or {}).get("results", {})
+    print(
+        f"{'benchmark':<38}{'rounds':>8}{'median':>12}{'p95':>12}"
+        f"{'ops/s':>12}{'vs base':>9}"
+    )
+    for name, result in results.items():
+        base = reference.get(name, {}).get("median")
+        change = f"{result['median'] / base:8.2f}x" if base else f"{'-':>9}"
+        print(
+            f"{name:<38}{result['rounds']:>8}{result['median'] * 1000:>10.3f}ms"
+            f"{result['p95'] * 1000:>10.3f}ms{result['ops_per_second']:>12.1f}{change}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the agent benchmark suite")
+    parser.add_argument("-k", dest="pattern", help="only benchmarks containing this")
+    parser.add_argument("--baseline", default=harness.BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write a new baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=harness.DEFAULT_TOLERANCE,
+        help="allowed slowdown before flagging a regression (0.5 = 50%%)",
+    )
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("iot_agent").setLevel(logging.CRITICAL)
+    results = run_suite(args.pattern)
+    baseline = harness.load_baseline(args.baseline)
+    _print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"machine": harness.machine_info(), "results": results}, f)
+
+    if args.save:
+        merged = dict((baseline or {}).get("results", {}))
+        merged.update(results)
+        harness.save_baseline(merged, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline and baseline.get("machine") != harness.machine_info():
+        print("Note: baseline was recorded on a different machine")
+    regressions = harness.compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['name']}: {regression['median'] * 1000:.3f}ms "
+            f"vs {regression['baseline'] * 1000:.3f}ms ({regression['ratio']:.2f}x)"
+        )
+    return 1 if regressions else 0
@@ -0,0 +1,148 @@
+import contextlib
+import io
+import time
+from typing import Callable, Dict, Iterator
+
+from agent.client import transport as transports
+from agent.client.backend_client import BackendClient
+from agent.client.mqtt_client import MqttClient
+from agent.config import Config
+from agent.mock_backend import MockBackend
+from agent.services.docker_manager import DockerManager
+from agent.services.local_broker import LocalBroker
+from agent.services.sensor_simulator import SensorSimulator
+from agent.services.system_monitor import SystemMonitor
+from agent.tests.fake_docker import FakeDockerDaemon
+from agent.utils.version import latest_tag
+
+# name -> (factory, batch, measure kwargs). A factory is a generator that
+# does its setup, yields the operation to time, then tears down.
+BENCHMARKS: Dict[str, tuple] = {}
+
+MQTT_BATCH = 200
+
+
+def benchmark(name: str, batch: int = 1, **measure_kwargs):
+    """Register a benchmark; ``batch`` is how many items one operation handles"""
+
+    def register(factory: Callable[[], Iterator[Callable]]):
+        BENCHMARKS[name] = (factory, batch, measure_kwargs)
+        return factory
+
+    return register
+
+
+@benchmark("system_monitor.get_system_info")
+def bench_system_info():
+    monitor = SystemMonitor()
+    yield monitor.get_system_info
+
+
+@benchmark("system_monitor.get_health_status")
+def bench_health_status():
+    monitor = SystemMonitor()
+    yield monitor.get_health_status
+
+
+@benchmark("sensor.encode_telemetry")
+def bench_sensor_encode():
+    simulator = SensorSimulator()
+    yield lambda: f"SENSOR:{simulator.get_data()}"
+
+
+VERSION_TAGS = 1000
+
+
+@benchmark("version.latest_tag", batch=VERSION_TAGS)
+def bench_latest_tag():
+    tags = [f"v{n // 100}.{n // 10 % 10}.{n % 10}" for n in range(VERSION_TAGS)]
+    yield lambda: latest_tag(tags)
+
+
+def _backend_client(backend: MockBackend) -> BackendClient:
+    client = BackendClient(transport=transports.RequestsTransport(5, 30))
+    client.base_url = backend.url
+    return client
+
+
+@benchmark("backend_client.send_heartbeat")
+def bench_backend_heartbeat():
+    with MockBackend() as backend:
+        client = _backend_client(backend)
+        yield lambda: client.send_heartbeat(status="online")
+        client.close()
+
+
+@benchmark("backend_client.send_log")
+def bench_backend_log():
+    with MockBackend() as backend:
+        client = _backend_client(backend)
+        yield lambda: client.send_log("benchmark log line " * 8)
+        client.close()
+
+
+@benchmark("mqtt_client.publish", batch=MQTT_BATCH)
+def bench_mqtt_publish():
+    broker = LocalBroker(port=0).start()
+    # MqttClient logs every publish to stdout; keep that cost but not the noise
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = MqttClient(
+            "127.0.0.1", broker.port, "agent/bench/command", "agent/bench/status"
+        )
+        client.start()
+        deadline = time.monotonic() + 5
+        while not client.client.is_connected() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        def publish_batch():
+            target = broker.stats["published"] + MQTT_BATCH
+            for _ in range(MQTT_BATCH):
+                client.publish("SENSOR:{'temperature': 25.0}")
+            while broker.stats["published"] < target:
+                time.sleep(0.0005)
+
+        yield publish_batch
+        client.client.disconnect()
+    broker.stop()
+
+
+def _docker_manager(daemon: FakeDockerDaemon) -> DockerManager:
+    daemon.add_container(Config.CONTAINER_NAME, "agent:v1")
+    daemon.add_registry_image("agent:v2", size=1000)
+    # No settle delay: only the agent's own work and API round trips are timed
+    return DockerManager(client=daemon.client(), settle_time=0)
+
+
+@benchmark("docker_manager.get_container_status")
+def bench_docker_status():
+    with FakeDockerDaemon() as daemon:
+        manager = _docker_manager(daemon)
+        yield manager.get_container_status
+
+
+@benchmark("docker_manager.get_actual_state")
+def bench_docker_actual_state():
+    with FakeDockerDaemon() as daemon:
+        manager = _docker_manager(daemon)
+        yield lambda: manager.get_actual_state(max_age=0)
+
+
+@benchmark("docker_manager.update_container")
+def bench_docker_update():
+    with FakeDockerDaemon() as daemon:
+        manager = _docker_manager(daemon)
+        tags = ["agent:v2", "agent:v1"]
+
+        def swap():
+            tags.reverse()
+            manager.update_container(image_tag=tags[0])
+
+        yield swap
+
+
+@benchmark("docker_manager.rollback_to_previous")
+def bench_docker_rollback():
+    with FakeDockerDaemon() as daemon:
+        manager = _docker_manager(daemon)
+        manager.previous_image_tag = "agent:v1"
+        yield manager.rollback_to_previous
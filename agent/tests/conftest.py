@@ -0,0 +1,50 @@
+import pytest
+
+from agent.client import transport as transports
+from agent.client.backend_client import BackendClient
+from agent.config import AgentConfig, Config
+from agent.main import IoTAgent
+from agent.mock_backend import MockBackend
+
+
+@pytest.fixture(autouse=True)
+def local_state_paths(tmp_path, monkeypatch):
+    """Keep the state agents write to disk inside each test's tmp_path"""
+    monkeypatch.setattr(Config, "METRICS_STORE_PATH", str(tmp_path / "metrics"))
+    monkeypatch.setattr(Config, "ANOMALY_STATE_PATH", str(tmp_path / "anomaly"))
+
+
+@pytest.fixture
+def backend(request):
+    """A running MockBackend; parametrize it indirectly to pass arguments,
+    e.g. ``{"max_requests": 10}``"""
+    with MockBackend(**getattr(request, "param", {})) as server:
+        yield server
+
+
+@pytest.fixture
+def make_client(backend):
+    """Factory for a BackendClient of ``backend`` on its own transport, with
+    MQTT off and ``settings`` overriding the config"""
+
+    def make(timeouts=(2, 5), **settings):
+        config = AgentConfig(
+            **{"BACKEND_URL": backend.url, "MQTT_ENABLED": False, **settings}
+        )
+        transport = transports.RequestsTransport(*timeouts)
+        return BackendClient(transport=transport, config=config)
+
+    return make
+
+
+@pytest.fixture
+def make_agent(make_client):
+    """Factory for an IoTAgent using ``client`` (a default one of
+    ``make_client`` if omitted); containers are not managed unless asked"""
+
+    def make(client=None, **kwargs):
+        client = client or make_client()
+        kwargs.setdefault("manage_containers", False)
+        return IoTAgent(config=client.config, backend_client=client, **kwargs)
+
+    return make
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+In-process fake of the Docker Engine HTTP API on a Unix socket.
+
+Implements the endpoints DockerManager relies on (version, image pull,
+inspect, list, save and load, container list/create/start/inspect/stop/remove
+and streaming stats) with configurable API latency, pull speed, failure injection and
+container health and resource usage behaviour, so update and rollback paths can be exercised and timed
+without a Docker daemon or a registry.
+
+Serve it standalone and point an agent at it with DOCKER_HOST:
+    python -m agent.tests.fake_docker --socket /tmp/fake-docker.sock \\
+        --image taipham2710/agent-raspi:latest
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import docker
+
+API_VERSION = "1.43"
+ONLINE_CPUS = 4
+MEMORY_LIMIT = 4 * 1024**3
+
+Response = Tuple[int, Optional[object]]
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep test and benchmark output quiet
+
+    def address_string(self):
+        return "unix"
+
+    def _dispatch(self, method: str):
+        url = urlparse(self.path)
+        path = re.sub(r"^/v[\d.]+", "", url.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        daemon = self.server.daemon
+        if method == "POST" and path == "/images/load":
+            self._send_json(*daemon._load(self._read_raw_body()))
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if method == "POST" and path == "/images/create":
+            self._stream_pull(daemon, query)
+            return
+        match = re.fullmatch(r"/images/(.+)/get", path)
+        if method == "GET" and match:
+            self._stream_save(daemon, match.group(1))
+            return
+        match = re.fullmatch(r"/containers/([^/]+)/stats", path)
+        if method == "GET" and match:
+            self._stream_stats(daemon, match.group(1), query)
+            return
+        status, payload = daemon._handle(method, path, query, body)
+        self._send_json(status, payload)
+
+    def _send_json(self, status: int, payload):
+        raw = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        if raw:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        if raw:
+            self.wfile.write(raw)
+
+    def _stream_pull(self, daemon, query):
+        """Stream pull progress as chunked JSON lines, paced by ``pull_speed``"""
+        status, progress = daemon._pull(query)
+        if status != 200:
+            self._send_json(status, progress)
+            return
+        self._start_chunked()
+        for delay, line in progress:
+            if delay:
+                time.sleep(delay)
+            self._write_chunk(line)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_raw_body(self) -> bytes:
+        """Request body, sent with a Content-Length or chunked"""
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if not size:
+                self.rfile.readline()
+                return bytes(body)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def _stream_save(self, daemon, reference):
+        """``docker save``: a fake archive of the image's ``size`` bytes"""
+        status, archive = daemon._save(reference)
+        if status != 200:
+            self._send_json(status, archive)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-tar")
+        self.send_header("Content-Length", str(len(archive)))
+        self.end_headers()
+        self.wfile.write(archive)
+
+    def _stream_stats(self, daemon, reference, query):
+        """One stats frame, or a frame every ``stats_interval`` until it stops"""
+        status, frame = daemon._stats(reference)
+        if status != 200 or query.get("stream", "1").lower() in ("0", "false"):
+            self._send_json(status, frame)
+            return
+        self._start_chunked()
+        try:
+            while frame is not None:
+                self._write_chunk(frame)
+                if daemon._stopping.wait(daemon.stats_interval):
+                    break
+                frame = daemon._stats_frame(frame["id"], frame)
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass  # client went away
+
+    def _start_chunked(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, payload):
+        chunk = (json.dumps(payload) + "\r\n").encode("utf-8")
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class FakeDockerDaemon:
+    """Fake Docker daemon serving the Engine API on a Unix socket.
+
+    Images are pulled from an in-memory ``registry``; each registry image
+    carries the behaviour of containers created from it:
+    ``exit_after`` (seconds until the container exits with code 1) and
+    ``health_delay`` (seconds in ``starting`` before it reports
+    ``healthy``, or ``unhealthy`` when ``healthy=False``).
+
+    Running containers use ``cpu`` cores and ``memory`` bytes, reported by
+    the stats endpoint every ``stats_interval`` seconds when streaming.
+
+    ``latency`` delays every API call and ``pull_speed`` (bytes/second)
+    paces pulls according to the image ``size``. ``fail_next(operation)``
+    makes the next calls of an operation (``pull``, ``create``, ``start``,
+    ``stop``, ``remove``, ``inspect_container``, ``inspect_image``) fail.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        latency: float = 0.0,
+        pull_speed: Optional[float] = None,
+        stats_interval: float = 1.0,
+    ):
+        self._tmpdir = None
+        if socket_path is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="fake-docker-")
+            socket_path = os.path.join(self._tmpdir, "docker.sock")
+        self.socket_path = socket_path
+        self.latency = latency
+        self.pull_speed = pull_speed
+        self.stats_interval = stats_interval
+        self.registry: Dict[str, Dict] = {}
+        self.images: Dict[str, Dict] = {}  # by image id
+        self.containers: Dict[str, Dict] = {}  # by container id
+        self.calls: List[Tuple[str, str]] = []
+        self._failures: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self._epoch = time.monotonic()
+        self._next_pid = 1000
+        self._stopping = threading.Event()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"unix://{self.socket_path}"
+
+    def start(self) -> "FakeDockerDaemon":
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixHTTPServer(self.socket_path, _FakeDockerHandler)
+        self._server.daemon = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def client(self, version: str = API_VERSION) -> docker.DockerClient:
+        """A docker SDK client talking to this daemon"""
+        return docker.DockerClient(base_url=self.base_url, version=version)
+
+    def add_registry_image(
+        self,
+        tag: str,
+        size: int = 50 * 1024 * 1024,
+        exit_after: Optional[float] = None,
+        health_delay: Optional[float] = None,
+        healthy: bool = True,
+        cpu: float = 0.1,
+        memory: int = 64 * 1024 * 1024,
+    ):
+        """Make ``tag`` pullable, with the behaviour of its containers"""
+        self.registry[_normalize_tag(tag)] = {
+            "size": size,
+            "exit_after": exit_after,
+            "health_delay": health_delay,
+            "healthy": healthy,
+            "cpu": cpu,
+            "memory": memory,
+        }
+
+    def add_image(self, tag: str, **behaviour) -> str:
+        """Add ``tag`` as if it had already been pulled; returns the image id"""
+        if behaviour or _normalize_tag(tag) not in self.registry:
+            self.add_registry_image(tag, **behaviour)
+        with self._lock:
+            return self._store_image(_normalize_tag(tag))
+
+    def add_container(self, name: str, image: str, env: Optional[Dict] = None) -> str:
+        """Create and start a container, as if left running by a previous deploy"""
+        image_id = self.add_image(image)
+        with self._lock:
+            container_id = self._create(name, image_id, env or {})
+            self._start(container_id)
+            return container_id
+
+    def fail_next(self, operation: str, count: int = 1, status: int = 500):
+        self._failures[operation] = [count, status]
+
+    def reset_calls(self):
+        self.calls = []
+
+    def container_by_name(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            for container in self.containers.values():
+                if container["Name"] == f"/{name}":
+                    self._refresh(container)
+                    return container
+            return None
+
+    def _take_failure(self, operation: str) -> Optional[Response]:
+        failure = self._failures.get(operation)
+        if not failure or failure[0] <= 0:
+            return None
+        failure[0] -= 1
+        return failure[1], {"message": f"injected {operation} failure"}
+
+    def _handle(self, method: str, path: str, query: Dict, body) -> Response:
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls.append((method, path))
+        with self._lock:
+            if path in ("/_ping", "/version"):
+                return 200, {"ApiVersion": API_VERSION, "Version": "24.0.0-fake"}
+
+            if path == "/images/json" and method == "GET":
+                return 200, [
+                    {key: value for key, value in image.items() if key != "behaviour"}
+                    for image in self.images.values()
+                ]
+
+            if path == "/containers/json" and method == "GET":
+                return 200, self._list_containers(query.get("all") in ("1", "true"))
+
+            match = re.fullmatch(r"/images/(.+)/json", path)
+            if match and method == "GET":
+                return self._take_failure("inspect_image") or self._inspect_image(
+                    match.group(1)
+                )
+
+            match = re.fullmatch(r"/images/([^/]+(?:/[^/]+)*)", path)
+            if match and method == "DELETE":
+                return self._remove_image(match.group(1))
+
+            if path == "/containers/create" and method == "POST":
+                return self._take_failure("create") or self._create_from_request(
+                    query.get("name"), body or {}
+                )
+
+            match = re.fullmatch(r"/containers/([^/]+)(/\w+)?", path)
+            if match:
+                container = self._find_container(match.group(1))
+                action = match.group(2)
+                if container is None:
+                    return 404, {"message": f"No such container: {match.group(1)}"}
+                if action == "/json" and method == "GET":
+                    return self._take_failure("inspect_container") or (
+                        200,
+                        self._refresh(container),
+                    )
+                if action == "/start" and method == "POST":
+                    return self._take_failure("start") or self._start(container["Id"])
+                if action == "/stop" and method == "POST":
+                    return self._take_failure("stop") or self._stop(container)
+                if action is None and method == "DELETE":
+                    return self._take_failure("remove") or self._remove(
+                        container, query.get("force") in ("1", "True", "true")
+                    )
+        return 404, {"message": f"page not found: {method} {path}"}
+
+    def _pull(self, query: Dict):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls.append(("POST", "/images/create"))
+        tag = _normalize_tag(f"{query.get('fromImage')}:{query.get('tag') or 'latest'}")
+        with self._lock:
+            failure = self._take_failure("pull")
+            if failure:
+                return failure
+            entry = self.registry.get(tag)
+            if entry is None:
+                return 404, {
+                    "message": f"pull access denied for {tag}, "
+                    "repository does not exist or may require 'docker login'"
+                }
+
+        progress = [(0, {"status": f"Pulling from {tag}"})]
+        steps = 4
+        step_delay = entry["size"] / self.pull_speed / steps if self.pull_speed else 0
+        for step in range(1, steps + 1):
+            progress.append(
+                (
+                    step_delay,
+                    {
+                        "status": "Downloading",
+                        "progressDetail": {
+                            "current": entry["size"] * step // steps,
+                            "total": entry["size"],
+                        },
+                    },
+                )
+            )
+        progress.append((0, {"status": f"Downloaded newer image for {tag}"}))
+
+        def finish():
+            with self._lock:
+                self._store_image(tag)
+
+        # The image only becomes visible once the stream has been consumed
+        return 200, _CompletingList(progress, finish)
+
+    def _save(self, reference: str) -> Tuple[int, object]:
+        self.calls.append(("GET", "/images/get"))
+        with self._lock:
+            image = self._find_image(reference)
+            if image is None:
+                return 404, {"message": f"No such image: {reference}"}
+            header = json.dumps({"RepoTags": image["RepoTags"]}).encode() + b"\n"
+            return 200, header + bytes(image["Size"])
+
+    def _load(self, archive: bytes) -> Response:
+        """``docker load`` of an archive written by ``_save``"""
+        self.calls.append(("POST", "/images/load"))
+        header, _, _ = archive.partition(b"\n")
+        try:
+            tags = json.loads(header)["RepoTags"]
+        except (ValueError, KeyError):
+            return 400, {"message": "invalid tar header"}
+        with self._lock:
+            for tag in tags:
+                self.registry.setdefault(tag, {"size": len(archive) - len(header) - 1})
+                self._store_image(tag)
+        return 200, {"stream": f"Loaded image: {', '.join(tags)}\n"}
+
+    def _store_image(self, tag: str) -> str:
+        image_id = "sha256:" + hashlib.sha256(tag.encode("utf-8")).hexdigest()
+        for image in self.images.values():
+            if tag in image["RepoTags"] and image["Id"] != image_id:
+                image["RepoTags"].remove(tag)
+        image = self.images.setdefault(
+            image_id, {"Id": image_id, "RepoTags": [], "Size": 0}
+        )
+        if tag not in image["RepoTags"]:
+            image["RepoTags"].append(tag)
+        image["Size"] = self.registry.get(tag, {}).get("size", 0)
+        image["behaviour"] = self.registry.get(tag, {})
+        return image_id
+
+    def _find_image(self, reference: str) -> Optional[Dict]:
+        if reference.startswith("sha256:") or re.fullmatch(r"[0-9a-f]{64}", reference):
+            return self.images.get("sha256:" + reference.split(":")[-1])
+        tag = _normalize_tag(reference)
+        for image in self.images.values():
+            if tag in image["RepoTags"]:
+                return image
+        return None
+
+    def _remove_image(self, reference: str) -> Response:
+        image = self._find_image(reference)
+        if image is None:
+            return 404, {"message": f"No such image: {reference}"}
+        tag = _normalize_tag(reference)
+        if tag in image["RepoTags"] and len(image["RepoTags"]) > 1:
+            image["RepoTags"].remove(tag)
+            return 200, [{"Untagged": tag}]
+        del self.images[image["Id"]]
+        return 200, [{"Untagged": tag}, {"Deleted": image["Id"]}]
+
+    def _inspect_image(self, reference: str) -> Response:
+        image = self._find_image(reference)
+        if image is None:
+            return 404, {"message": f"No such image: {reference}"}
+        return 200, {key: value for key, value in image.items() if key != "behaviour"}
+
+    def _list_containers(self, include_stopped: bool) -> List[Dict]:
+        listed = []
+        for container in self.containers.values():
+            state = self._refresh(container)["State"]
+            if state["Running"] or include_stopped:
+                listed.append(
+                    {
+                        "Id": container["Id"],
+                        "Names": [container["Name"]],
+                        "Image": container["Config"]["Image"],
+                        "State": state["Status"],
+                    }
+                )
+        return listed
+
+    def _stats(self, reference: str) -> Response:
+        self.calls.append(("GET", "/containers/stats"))
+        with self._lock:
+            container = self._find_container(reference)
+        if container is None:
+            return 404, {"message": f"No such container: {reference}"}
+        frame = self._stats_frame(container["Id"])
+        if frame is None:
+            return 409, {"message": f"Container {reference} is not running"}
+        return 200, frame
+
+    def _stats_frame(self, container_id: str, previous: Optional[Dict] = None):
+        """Cumulative usage of a running container, as the Engine reports it"""
+        with self._lock:
+            container = self.containers.get(container_id)
+            if container is None or not self._refresh(container)["State"]["Running"]:
+                return None
+            behaviour = container["_behaviour"]
+            elapsed = time.monotonic() - container["_started_at"]
+            uptime = time.monotonic() - self._epoch
+        cache = 8 * 1024 * 1024
+        return {
+            "id": container_id,
+            "name": container["Name"],
+            "read": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "cpu_stats": {
+                "cpu_usage": {
+                    "total_usage": int(behaviour.get("cpu", 0.1) * elapsed * 1e9)
+                },
+                "system_cpu_usage": int(uptime * ONLINE_CPUS * 1e9),
+                "online_cpus": ONLINE_CPUS,
+            },
+            "precpu_stats": previous["cpu_stats"] if previous else {},
+            "memory_stats": {
+                "usage": behaviour.get("memory", 0) + cache,
+                "limit": MEMORY_LIMIT,
+                "stats": {"inactive_file": cache},
+            },
+            "blkio_stats": {
+                "io_service_bytes_recursive": [
+                    {
+                        "major": 8,
+                        "minor": 0,
+                        "op": "read",
+                        "value": int(elapsed * 4096),
+                    },
+                    {
+                        "major": 8,
+                        "minor": 0,
+                        "op": "write",
+                        "value": int(elapsed * 1024),
+                    },
+                ]
+            },
+            "networks": {
+                "eth0": {
+                    "rx_bytes": int(elapsed * 2048),
+                    "tx_bytes": int(elapsed * 512),
+                }
+            },
+            "pids_stats": {"current": 3},
+        }
+
+    def _find_container(self, reference: str) -> Optional[Dict]:
+        for container in self.containers.values():
+            if container["Id"].startswith(reference) or container["Name"] == (
+                f"/{reference}"
+            ):
+                return container
+        return None
+
+    def _create_from_request(self, name: Optional[str], body: Dict) -> Response:
+        image = self._find_image(body.get("Image", ""))
+        if image is None:
+            return 404, {"message": f"No such image: {body.get('Image')}"}
+        if name and self._find_container(name) is not None:
+            return 409, {"message": f'Conflict. The container name "/{name}" is in use'}
+        env = dict(item.partition("=")[::2] for item in body.get("Env") or [])
+        return 201, {"Id": self._create(name, image["Id"], env), "Warnings": []}
+
+    def _create(self, name: Optional[str], image_id: str, env: Dict) -> str:
+        container_id = uuid.uuid4().hex + uuid.uuid4().hex
+        image = self.images[image_id]
+        self.containers[container_id] = {
+            "Id": container_id,
+            "Name": f"/{name or container_id[:12]}",
+            "Image": image_id,
+            "Created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "Config": {
+                "Image": image["RepoTags"][0] if image["RepoTags"] else image_id,
+                "Env": [f"{key}={value}" for key, value in env.items()],
+            },
+            "State": {"Status": "created", "Running": False, "ExitCode": 0, "Pid": 0},
+            "NetworkSettings": {"Ports": {}},
+            "_behaviour": image.get("behaviour", {}),
+            "_started_at": None,
+        }
+        return container_id
+
+    def _start(self, container_id: str) -> Response:
+        container = self.containers[container_id]
+        self._next_pid += 1
+        container["State"].update(
+            Status="running",
+            Running=True,
+            ExitCode=0,
+            Pid=self._next_pid,
+            StartedAt=f"{time.time():.6f}",
+        )
+        container["_started_at"] = time.monotonic()
+        return 204, None
+
+    def _stop(self, container: Dict) -> Response:
+        self._refresh(container)
+        container["State"].update(Status="exited", Running=False, Pid=0)
+        container["_started_at"] = None
+        return 204, None
+
+    def _remove(self, container: Dict, force: bool) -> Response:
+        self._refresh(container)
+        if container["State"]["Running"] and not force:
+            return 409, {"message": "You cannot remove a running container"}
+        del self.containers[container["Id"]]
+        return 204, None
+
+    def _refresh(self, container: Dict) -> Dict:
+        """Advance the container's state according to its image behaviour"""
+        behaviour = container["_behaviour"]
+        started = container["_started_at"]
+        state = container["State"]
+        if started is not None and state["Running"]:
+            elapsed = time.monotonic() - started
+            exit_after = behaviour.get("exit_after")
+            if exit_after is not None and elapsed >= exit_after:
+                state.update(Status="exited", Running=False, ExitCode=1, Pid=0)
+                container["_started_at"] = None
+            elif behaviour.get("health_delay") is not None:
+                if elapsed < behaviour["health_delay"]:
+                    health = "starting"
+                else:
+                    health = (
+                        "healthy" if behaviour.get("healthy", True) else "unhealthy"
+                    )
+                state["Health"] = {"Status": health}
+        return {key: value for key, value in container.items() if key[0] != "_"}
+
+
+class _CompletingList(list):
+    """Pull progress lines plus a callback run once they have been sent"""
+
+    def __init__(self, items, on_complete):
+        super().__init__(items)
+        self.on_complete = on_complete
+
+    def __iter__(self):
+        yield from super().__iter__()
+        self.on_complete()
+
+
+def _normalize_tag(reference: str) -> str:
+    name, _, tag = reference.rpartition(":")
+    if not name or "/" in tag:
+        return f"{reference}:latest"
+    return reference
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--socket", default="/tmp/fake-docker.sock")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--pull-speed", type=float, help="bytes per second")
+    parser.add_argument(
+        "--image", action="append", default=[], help="pullable image tag"
+    )
+    args = parser.parse_args()
+
+    daemon = FakeDockerDaemon(args.socket, args.latency, args.pull_speed)
+    for tag in args.image:
+        daemon.add_registry_image(tag)
+    daemon.start()
+    print(f"Fake Docker daemon listening on {daemon.base_url}")
+    try:
+        daemon._thread.join()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
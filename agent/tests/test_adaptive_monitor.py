@@ -0,0 +1,93 @@
+from agent.client import transport as transports
+from agent.client.backend_client import BackendClient
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.mock_backend import MockBackend
+from agent.services.adaptive_monitor import AdaptiveCadence
+
+THRESHOLDS = {"cpu": 80, "memory": 85, "disk": 90}
+
+
+def make_cadence(**kwargs):
+    return AdaptiveCadence(min_interval=5, max_interval=60, **kwargs)
+
+
+def test_cadence_backs_off_when_stable_and_tightens_on_change():
+    cadence = make_cadence()
+    intervals = []
+    for _ in range(5):
+        cadence.observe({"cpu": 20, "memory": 40}, THRESHOLDS)
+        intervals.append(cadence.interval)
+    assert intervals == [10, 20, 40, 60, 60]
+
+    cadence.observe({"cpu": 35, "memory": 40}, THRESHOLDS)  # volatile
+    assert cadence.interval == 5
+    cadence.observe({"cpu": 35, "memory": 40}, THRESHOLDS)
+    assert cadence.interval == 10
+    cadence.observe({"cpu": 72, "memory": 40}, THRESHOLDS)  # near threshold
+    cadence.observe({"cpu": 72, "memory": 40}, THRESHOLDS)
+    assert cadence.interval == 5
+
+
+def test_only_changes_beyond_deadband_are_reported():
+    cadence = make_cadence(deadband=2, full_report_interval=100)
+    assert cadence.observe({"cpu": 20, "memory": 40}, THRESHOLDS, now=0) == {
+        "cpu": 20,
+        "memory": 40,
+    }
+    # Slow drift is reported once it adds up to the deadband
+    assert cadence.observe({"cpu": 21, "memory": 40}, THRESHOLDS, now=1) == {}
+    assert cadence.observe({"cpu": 22.5, "memory": 40}, THRESHOLDS, now=2) == {
+        "cpu": 22.5
+    }
+    assert cadence.observe({"cpu": 22, "memory": 40}, THRESHOLDS, now=3) == {}
+    # Periodic full report
+    assert cadence.observe({"cpu": 22, "memory": 40}, THRESHOLDS, now=100) == {
+        "cpu": 22,
+        "memory": 40,
+    }
+
+
+class SteadyMonitor:
+    def __init__(self):
+        self.values = {"cpu": 20.0, "memory": 40.0, "disk": 50.0}
+
+    def get_health_status(self, thresholds=None):
+        checks = {
+            name: {"status": "ok", "value": value, "threshold": thresholds[name]}
+            for name, value in self.values.items()
+        }
+        return {"status": "healthy", "checks": checks}
+
+    def check_alerts(self, thresholds=None):
+        return []
+
+
+def test_agent_skips_reports_when_nothing_changed():
+    with MockBackend() as backend:
+        config = AgentConfig(
+            DEVICE_NAME="adaptive", BACKEND_URL=backend.url, MQTT_ENABLED=False
+        )
+        client = BackendClient(
+            transport=transports.RequestsTransport(2, 5), config=config
+        )
+        monitor = SteadyMonitor()
+        agent = IoTAgent(
+            config=config,
+            backend_client=client,
+            system_monitor=monitor,
+            manage_containers=False,
+        )
+        agent._setup_schedules()
+        for _ in range(10):
+            agent._perform_system_monitoring()
+        monitor.values["cpu"] = 60.0
+        agent._perform_system_monitoring()
+
+        logs = [r["body"]["message"] for r in backend.requests if r["path"] == "/logs"]
+        assert logs == [
+            "System health: healthy, CPU: 20.0%, Memory: 40.0%, Disk: 50.0%",
+            "System health: healthy, CPU: 60.0%",
+        ]
+        agent.run_pending()
+        assert agent._jobs["monitoring"][0].interval == config.MONITOR_MIN_INTERVAL
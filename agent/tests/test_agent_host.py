@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from agent.client.mqtt_client import SharedMqttConnection
+from agent.config import AgentConfig, Config
+from agent.host import AgentHost
+from agent.mock_backend import MockBackend
+from agent.services.local_broker import LocalBroker
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_agent_config_overrides_and_device_topics():
+    config = AgentConfig(DEVICE_ID=42, DEVICE_NAME="sensor-42")
+    assert config.DEVICE_ID == 42
+    assert config.MQTT_TOPIC_SUB == "agent/42/cmd"
+    assert config.MQTT_TOPIC_PUB == "agent/42/status"
+    assert config.BACKEND_URL == Config.BACKEND_URL
+    assert AgentConfig(DEVICE_ID=1, MQTT_TOPIC_SUB="x").MQTT_TOPIC_SUB == "x"
+    with pytest.raises(ValueError):
+        AgentConfig(NOT_A_SETTING=1)
+
+
+@pytest.fixture
+def host():
+    backend = MockBackend().start()
+    broker = LocalBroker(port=0).start()
+    host = AgentHost.for_devices(
+        3,
+        first_device_id=100,
+        name_prefix="sim-",
+        overrides={
+            "BACKEND_URL": backend.url,
+            "MQTT_BROKER": "127.0.0.1",
+            "MQTT_PORT": broker.port,
+        },
+        workers=4,
+    )
+    thread = threading.Thread(target=host.start, daemon=True)
+    thread.start()
+    yield host, backend, broker
+    host.stop()
+    thread.join(timeout=10)
+    broker.stop()
+    backend.stop()
+
+
+def test_host_runs_agents_on_shared_connections(host):
+    host, backend, broker = host
+    assert wait_for(lambda: set(backend.devices) == {"sim-100", "sim-101", "sim-102"})
+    assert backend.connections <= 4  # one pool shared by all agents
+    assert wait_for(lambda: broker.stats["connections"] == 1)
+    assert wait_for(
+        lambda: all(agent.readiness["mqtt"] == "ready" for agent in host.agents)
+    )
+
+    replies = []
+    subscriber = mqtt.Client()
+    subscriber.on_message = lambda c, u, msg: replies.append(msg.topic)
+    subscriber.connect("127.0.0.1", broker.port)
+    subscriber.subscribe("agent/+/status")
+    subscriber.loop_start()
+    time.sleep(0.2)
+    broker.publish("agent/101/cmd", b"status")
+    assert wait_for(lambda: "agent/101/status" in replies)
+    assert "agent/100/status" not in replies
+    subscriber.loop_stop()
+
+
+def test_host_sends_offline_heartbeats_on_stop(host):
+    host, backend, _ = host
+    assert wait_for(lambda: len(backend.devices) == 3)
+    host.stop()
+    assert wait_for(
+        lambda: all(
+            device["state"].get("status") == "offline"
+            for device in backend.devices.values()
+        )
+    )
+
+
+def test_shared_connection_waits_for_the_broker():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    connection = SharedMqttConnection("127.0.0.1", port)
+    connected = []
+    channel = connection.channel(
+        "agent/1/cmd", "agent/1/status", on_connect=lambda: connected.append(1)
+    )
+    channel.start()
+    time.sleep(0.2)
+    assert not channel.is_connected()
+
+    broker = LocalBroker(port=port).start()
+    try:
+        assert wait_for(lambda: connected and channel.is_connected())
+    finally:
+        connection.stop()
+        broker.stop()
@@ -0,0 +1,123 @@
+from agent.config import AgentConfig
+from agent.services.alert_manager import AlertManager
+from agent.services.system_monitor import SystemMonitor
+
+
+def make_manager(**overrides):
+    settings = {
+        "ALERT_HYSTERESIS": 5,
+        "ALERT_MIN_DURATION": 30,
+        "ALERT_REPEAT_INTERVAL": 300,
+        "ALERT_RATE_LIMIT": 10,
+        "ALERT_RATE_WINDOW": 600,
+    }
+    settings.update(overrides)
+    return AlertManager(AgentConfig(**settings))
+
+
+def health(cpu, threshold=80):
+    return {
+        "status": "healthy" if cpu < threshold else "warning",
+        "checks": {"cpu": {"value": cpu, "threshold": threshold}},
+    }
+
+
+def test_alert_fires_after_min_duration_and_resolves_with_hysteresis():
+    alerts = make_manager()
+    assert alerts.evaluate(health(90), now=0) == []
+    assert alerts.evaluate(health(70), now=10) == []  # short spike, never fired
+    assert alerts.evaluate(health(90), now=20) == []
+
+    fired = alerts.evaluate(health(92), now=50)
+    assert [(e["state"], e["level"]) for e in fired] == [("firing", "WARNING")]
+    assert fired[0]["message"].startswith("High CPU usage: 92%")
+    assert alerts.active()[0]["key"] == "cpu"
+
+    # Just below the threshold but within the hysteresis band: still firing
+    assert alerts.evaluate(health(78), now=60) == []
+    resolved = alerts.evaluate(health(70), now=70)
+    assert [(e["state"], e["level"]) for e in resolved] == [("resolved", "INFO")]
+    assert resolved[0]["message"] == "CPU back to normal: 70% after 50s"
+    assert alerts.active() == []
+
+
+def test_sustained_alert_is_deduplicated_with_counts():
+    alerts = make_manager(ALERT_MIN_DURATION=0)
+    events = []
+    for second in range(0, 700, 10):
+        events += alerts.evaluate(health(95), now=second)
+    assert len(events) == 3  # first alert plus reminders at 300s and 600s
+    assert events[1]["count"] == 31
+    assert "31 checks over 300s" in events[1]["message"]
+
+
+def test_rate_limit_suppresses_and_reports_count():
+    alerts = make_manager(ALERT_MIN_DURATION=0, ALERT_RATE_LIMIT=2)
+    fired = []
+    for index, key in enumerate(["cpu", "memory", "disk"]):
+        report = {"status": "warning", "checks": {key: {"value": 99, "threshold": 80}}}
+        fired += alerts.evaluate(report, now=index)
+    assert len(fired) == 2
+    assert alerts.suppressed == 1
+
+    report = {"status": "warning", "checks": {"cpu": {"value": 99, "threshold": 80}}}
+    later = alerts.evaluate(report, now=700)
+    assert "(1 alerts suppressed)" in later[0]["message"]
+
+
+def test_rate_limited_alert_is_retried_and_resolved_only_once_sent():
+    alerts = make_manager(
+        ALERT_MIN_DURATION=0, ALERT_RATE_LIMIT=1, ALERT_REPEAT_INTERVAL=3600
+    )
+    both = {
+        "status": "warning",
+        "checks": {
+            "cpu": {"value": 99, "threshold": 80},
+            "memory": {"value": 99, "threshold": 80},
+        },
+    }
+    assert [e["key"] for e in alerts.evaluate(both, now=0)] == ["cpu"]
+    assert alerts.evaluate(both, now=10) == []  # memory still held back
+    assert alerts.suppressed == 1
+    # Sent as soon as the rate limit allows, not after the repeat interval
+    assert [e["key"] for e in alerts.evaluate(both, now=600)] == ["memory"]
+
+    alerts = make_manager(ALERT_MIN_DURATION=0, ALERT_RATE_LIMIT=1)
+    alerts.evaluate(both, now=0)
+    normal = {
+        "status": "healthy",
+        "checks": {
+            "cpu": {"value": 10, "threshold": 80},
+            "memory": {"value": 10, "threshold": 80},
+        },
+    }
+    # The backend never saw the memory alert, so it gets no resolved event
+    resolved = alerts.evaluate(normal, now=20)
+    assert [(e["key"], e["state"]) for e in resolved] == [("cpu", "resolved")]
+
+
+def test_check_alerts_is_stateful():
+    monitor = SystemMonitor()
+    monitor.alerts = make_manager(ALERT_MIN_DURATION=0)
+    # CPU can read 100% on a busy machine; nothing reaches 101
+    low = {"cpu": 101, "memory": 0.5, "disk": 0.5}
+    assert {alert["key"] for alert in monitor.check_alerts(low)} == {"memory", "disk"}
+    assert monitor.check_alerts(low) == []
+
+
+def test_alert_of_a_removed_check_is_resolved():
+    alerts = make_manager(ALERT_MIN_DURATION=0)
+    report = {
+        "status": "warning",
+        "checks": {"container/web/cpu": {"value": 95, "threshold": 80}},
+    }
+    assert alerts.evaluate(report, now=0)[0]["state"] == "firing"
+
+    # The container is gone, or monitoring failed and reports no checks
+    assert alerts.evaluate({"status": "healthy", "checks": {}}, now=10) == []
+    assert alerts.evaluate({"status": "error", "message": "x"}, now=20) != []
+    events = alerts.evaluate({"status": "healthy", "checks": {}}, now=30)
+    resolved = [e for e in events if e["key"] == "container/web/cpu"]
+    assert [e["state"] for e in resolved] == ["resolved"]
+    assert "no longer reported" in resolved[0]["message"]
+    assert alerts.active() == []
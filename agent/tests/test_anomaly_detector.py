@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.services.anomaly_detector import AnomalyDetector
+
+HOUR = 3600
+
+
+def make_detector(path=None, **overrides):
+    settings = {"ANOMALY_WARMUP": 10, "ANOMALY_SEASONAL_BUCKETS": 0}
+    return AnomalyDetector(path, AgentConfig(**{**settings, **overrides}))
+
+
+def test_ewma_flags_a_jump_once_and_adapts():
+    detector = make_detector()
+    for i in range(50):
+        assert detector.observe({"cpu": 20 + i % 3}, ts=i) == []
+
+    anomalies = detector.observe({"cpu": 60}, ts=50)
+    assert [a["stream"] for a in anomalies] == ["cpu"]
+    assert anomalies[0]["zscore"] > 4
+    assert anomalies[0]["baseline"] == pytest.approx(21, abs=0.5)
+    # Reported when the stream turns anomalous, not on every sample
+    assert detector.observe({"cpu": 61}, ts=51) == []
+    # A lasting level shift becomes the new normal
+    for i in range(200):
+        detector.observe({"cpu": 60 + i % 3}, ts=52 + i)
+    assert detector.observe({"cpu": 61}, ts=300) == []
+
+
+def test_seasonal_baseline_accepts_the_usual_value_for_the_time_of_day():
+    detector = make_detector(ANOMALY_SEASONAL_BUCKETS=24, ANOMALY_WARMUP=5)
+    # Ten days of 20 degrees, except 35 every day at 14:00
+    for hour in range(10 * 24):
+        detector.observe({"temperature": 35 if hour % 24 == 14 else 20}, ts=hour * HOUR)
+    recent = detector.detectors["temperature"].recent
+    assert recent.score(35, 1) > 4  # unusual without the time of day
+
+    day = 10 * 24
+    assert detector.observe({"temperature": 35}, ts=(day + 14) * HOUR) == []
+    for hour in range(day + 15, day + 27):
+        detector.observe({"temperature": 20}, ts=hour * HOUR)
+    anomalies = detector.observe({"temperature": 35}, ts=(day + 27) * HOUR)
+    assert anomalies[0]["seasonal_zscore"] == 15.0
+
+
+def test_state_is_checkpointed_and_restored(tmp_path):
+    path = str(tmp_path / "state" / "1.json")
+    detector = make_detector(path)
+    for i in range(30):
+        detector.observe({"sensor/humidity": 50 + i % 2, "disk": 10}, ts=i)
+    assert detector.checkpoint()
+    assert set(json.load(open(path))) == {"sensor/humidity", "disk"}
+
+    restored = make_detector(path)
+    restored.observe({"sensor/humidity": 50}, ts=31)
+    assert restored.detectors["sensor/humidity"].recent.count == 31
+    assert restored.observe({"sensor/humidity": 90}, ts=32)[0]["zscore"] > 4
+    # Streams not seen since the restart keep their saved state
+    assert restored.checkpoint()
+    assert json.load(open(path))["disk"]["recent"]["count"] == 30
+
+
+def test_agent_reports_sensor_anomalies(tmp_path):
+    config = AgentConfig(
+        DEVICE_NAME="anomaly",
+        MQTT_ENABLED=False,
+        ANOMALY_ENABLED=True,
+        ANOMALY_STATE_PATH=str(tmp_path),
+        ANOMALY_WARMUP=5,
+        SENSOR_PUBLISH_RAW=False,
+    )
+    agent = IoTAgent(config=config, system_monitor=object(), manage_containers=False)
+    logs = []
+    agent.backend_client.send_log = lambda message, level, log_type: logs.append(
+        (message, level, log_type)
+    )
+    for pressure in [1000] * 10 + [1100]:
+        agent.sensor_simulator.get_data = lambda p=pressure: {"pressure": p}
+        agent._send_sensor_data()
+
+    assert logs == [
+        (
+            "Anomaly in sensor/pressure: 1100 (usual 1000.0, z=100.0)",
+            "warning",
+            "anomaly",
+        )
+    ]
+    assert agent.anomaly_detector.checkpoint()
+    assert (tmp_path / f"{config.DEVICE_ID}.json").exists()
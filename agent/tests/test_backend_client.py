@@ -0,0 +1,293 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from agent.client import transport as transports
+from agent.client.backend_client import BackendClient
+from agent.client.resilience import CircuitBreaker, RetryBudget, parse_retry_after
+
+
+def make_client(backend, transport=None):
+    client = BackendClient(transport=transport or transports.RequestsTransport(2, 5))
+    client.base_url = backend.url
+    return client
+
+
+def test_separate_connect_and_read_timeouts():
+    transport = transports.RequestsTransport(connect_timeout=2, read_timeout=7)
+    assert BackendClient(transport=transport).timeout == (2, 7)
+
+
+def test_reconnect_replaces_only_an_owned_transport():
+    shared = transports.RequestsTransport(2, 5)
+    client = BackendClient(transport=shared)
+    client.reconnect()
+    assert client.transport is shared
+
+    client = BackendClient()
+    owned = client.transport
+    client.reconnect()
+    assert client.transport is not owned
+
+
+def test_connection_is_reused_across_requests(backend):
+    client = make_client(backend)
+    for _ in range(5):
+        assert client.send_heartbeat()
+    assert client.send_log("hello")
+    assert len(backend.requests) == 6
+    assert backend.connections == 1
+
+
+def test_large_bodies_are_gzip_compressed(backend):
+    transport = transports.RequestsTransport(2, 5, compress_min_bytes=64)
+    client = make_client(backend, transport)
+    message = "x" * 500
+    assert client.send_log(message)
+    request = backend.requests[-1]
+    assert request["headers"]["Content-Encoding"] == "gzip"
+    assert request["body"]["message"] == message
+
+
+def test_small_bodies_are_sent_uncompressed(backend):
+    transport = transports.RequestsTransport(2, 5, compress_min_bytes=4096)
+    client = make_client(backend, transport)
+    assert client.send_log("short")
+    assert "Content-Encoding" not in backend.requests[-1]["headers"]
+
+
+def test_http_error_status_is_reported_as_failure(backend):
+    backend.fail_next(1, status=500)
+    client = make_client(backend)
+    assert client._make_request("GET", "/device/1/status", retries=0) is None
+
+
+@pytest.fixture
+def trickling_server():
+    """A server that answers one byte of its body every 50ms"""
+    listener = socket.create_server(("127.0.0.1", 0))
+    stopped = threading.Event()
+
+    def serve():
+        connection, _ = listener.accept()
+        with connection:
+            connection.recv(65536)
+            connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 1000\r\n\r\n")
+            while not stopped.wait(0.05):
+                try:
+                    connection.sendall(b"x")
+                except OSError:
+                    return
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}"
+    stopped.set()
+    listener.close()
+
+
+@pytest.mark.parametrize("name", ["requests", "httpx"])
+def test_trickling_response_times_out(trickling_server, name):
+    if name == "httpx" and transports.httpx is None:
+        pytest.skip("httpx not installed")
+    transport_class = {
+        "requests": transports.RequestsTransport,
+        "httpx": transports.HttpxTransport,
+    }[name]
+    transport = transport_class(0.2, 0.3)
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        transport.request("GET", f"{trickling_server}/device/1/status")
+    # Every read got data in time, yet the request stopped at its total timeout
+    assert time.monotonic() - started < 1
+    transport.close()
+
+
+@pytest.mark.skipif(transports.httpx is None, reason="httpx not installed")
+def test_httpx_transport_round_trip(backend):
+    client = make_client(backend, transports.HttpxTransport(2, 5))
+    assert client.send_heartbeat()
+    assert client.get_device_status() == {"status": "online"}
+    assert backend.connections == 1
+    client.close()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("agent.client.backend_client.time.sleep", sleeps.append)
+    return sleeps
+
+
+def test_client_errors_are_not_retried(backend, no_sleep):
+    backend.fail_next(3, status=404)
+    client = make_client(backend)
+    assert client._make_request("GET", "/device/1/status", retries=3) is None
+    assert len(backend.requests) == 1
+    assert no_sleep == []
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_server_errors_are_retried_with_backoff(backend, no_sleep):
+    backend.fail_next(2, status=503)
+    client = make_client(backend)
+    assert client._make_request("GET", "/device/1/status", retries=3) == {
+        "status": "online"
+    }
+    assert len(backend.requests) == 3
+    assert len(no_sleep) == 2
+
+
+def test_retry_after_is_honored(backend, no_sleep):
+    backend.fail_next(1, status=429, headers={"Retry-After": "7"})
+    client = make_client(backend)
+    assert client._make_request("GET", "/device/1/status", retries=1)
+    assert no_sleep[0] >= 7
+
+
+def test_long_retry_after_opens_circuit_instead_of_sleeping(backend, no_sleep):
+    backend.fail_next(1, status=503, headers={"Retry-After": "3600"})
+    client = make_client(backend)
+    assert client._make_request("GET", "/device/1/status", retries=3) is None
+    assert no_sleep == []
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_open_circuit_skips_network(backend, no_sleep):
+    backend.fail_next(10, status=500)
+    client = make_client(backend)
+    client.breaker.failure_threshold = 2
+    assert client._make_request("GET", "/device/1/status", retries=5) is None
+    assert len(backend.requests) == 2
+    assert client._make_request("GET", "/device/1/status") is None
+    assert len(backend.requests) == 2
+
+
+def test_retry_budget_limits_retries(backend, no_sleep):
+    backend.fail_next(10, status=502)
+    client = make_client(backend)
+    client.retry_budget = RetryBudget(capacity=1, ratio=0, min_per_second=0)
+    assert client._make_request("GET", "/device/1/status", retries=5) is None
+    assert len(backend.requests) == 2
+
+
+def test_circuit_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=1, reset_timeout=10, clock=lambda: now[0]
+    )
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    now[0] = 11
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    now[0] = 22
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unexpected_errors_settle_the_half_open_probe(backend):
+    client = make_client(backend)
+    client.breaker.reset_timeout = 0
+    client.breaker.open_for(0)
+    with pytest.raises(TypeError):
+        client._make_request("POST", "/logs", {"bad": object()})
+    # The failed probe reopened the circuit instead of staying in flight, so
+    # the next probe goes through
+    assert client._make_request("GET", "/device/1/status") is not None
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_heartbeats_only_carry_changed_fields(backend):
+    client = make_client(backend)
+    assert client.send_heartbeat(version="v1.0", extra={"uptime_bucket": 1})
+    first = backend.requests[-1]["body"]
+    assert first["version"] == "v1.0" and "base_hash" not in first
+
+    assert client.send_heartbeat(version="v1.0", extra={"uptime_bucket": 1})
+    unchanged = backend.requests[-1]["body"]
+    assert set(unchanged) == {"name", "state_hash", "base_hash"}
+
+    assert client.send_heartbeat(version="v1.1")
+    delta = backend.requests[-1]["body"]
+    assert delta["version"] == "v1.1"
+    assert delta["removed"] == ["uptime_bucket"]
+    assert "status" not in delta
+
+    device = backend.devices[delta["name"]]
+    assert device["state"] == {"version": "v1.1", "status": "online"}
+
+
+def test_backend_without_hash_ack_gets_full_heartbeats(backend):
+    backend.route(
+        "POST", "/device/heartbeat", lambda body, headers: (200, {"ok": 1}, {})
+    )
+    client = make_client(backend)
+    client.send_heartbeat(version="v1.0")
+    client.send_heartbeat(version="v1.0")
+    assert backend.requests[-1]["body"]["version"] == "v1.0"
+
+
+def test_resync_after_backend_loses_state(backend):
+    client = make_client(backend)
+    client.send_heartbeat(version="v1.0")
+    backend.devices.clear()
+    client.send_heartbeat(version="v1.0")  # delta rejected, backend asks for resync
+    client.send_heartbeat(version="v1.0")
+    assert "base_hash" not in backend.requests[-1]["body"]
+    assert backend.devices
+
+
+def test_backend_driven_heartbeat_interval(backend):
+    client = make_client(backend)
+    client.heartbeat.min_interval, client.heartbeat.max_interval = 10, 600
+    backend.heartbeat_reply = {"heartbeat_interval": 30}
+    client.send_heartbeat()
+    assert client.heartbeat.interval == 30
+    backend.heartbeat_reply = {"heartbeat_interval": 1}
+    client.send_heartbeat()
+    assert client.heartbeat.interval == 10
+
+
+def test_commands_piggyback_on_heartbeat_acks(backend):
+    client = make_client(backend)
+    backend.commands = [{"id": "c1", "command": "status"}]
+    client.send_heartbeat()
+    commands = client.heartbeat.take_commands()
+    assert commands == [{"id": "c1", "command": "status"}]
+
+    # Redelivered before the ack reaches the backend, but handled only once
+    client.send_heartbeat()
+    assert client.heartbeat.take_commands() == []
+
+    client.heartbeat.ack_command("c1")
+    client.send_heartbeat()
+    assert backend.requests[-1]["body"]["acked_commands"] == ["c1"]
+    assert backend.commands == []
+    client.send_heartbeat()
+    assert "acked_commands" not in backend.requests[-1]["body"]
+
+
+def test_desired_state_diffs_piggyback_on_heartbeat_acks(backend):
+    client = make_client(backend)
+    backend.heartbeat_reply = {"desired_state": {"image": "agent:v2", "env": {}}}
+    client.send_heartbeat()
+    assert client.heartbeat.take_desired_diff() == {"image": "agent:v2", "env": {}}
+    client.send_heartbeat()
+    assert client.heartbeat.take_desired_diff() == {}
+    backend.heartbeat_reply = {"desired_state": {"image": "agent:v3"}}
+    client.send_heartbeat()
+    assert client.heartbeat.take_desired_diff() == {"image": "agent:v3"}
+    assert client.heartbeat.desired_state == {"image": "agent:v3", "env": {}}
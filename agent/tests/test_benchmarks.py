@@ -0,0 +1,39 @@
+from agent.tests.benchmarks import harness
+from agent.tests.benchmarks.runner import run_suite
+from agent.tests.benchmarks.suite import BENCHMARKS
+
+
+def test_measure_collects_rounds():
+    calls = []
+    result = harness.measure(lambda: calls.append(1), min_time=0, min_rounds=5)
+    assert result["rounds"] == 5
+    assert len(calls) == 6  # one warmup round
+    assert result["min"] <= result["median"] <= result["max"]
+
+
+def test_compare_flags_only_slowdowns_beyond_tolerance():
+    baseline = {"results": {"a": {"median": 1.0}, "b": {"median": 1.0}}}
+    results = {"a": {"median": 1.4}, "b": {"median": 2.0}, "new": {"median": 9.0}}
+    regressions = harness.compare(results, baseline, tolerance=0.5)
+    assert [r["name"] for r in regressions] == ["b"]
+    assert harness.compare(results, None) == []
+
+
+def test_baseline_round_trip(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    harness.save_baseline({"a": {"median": 0.1}}, path)
+    baseline = harness.load_baseline(path)
+    assert baseline["results"] == {"a": {"median": 0.1}}
+    assert baseline["machine"] == harness.machine_info()
+    assert harness.load_baseline(str(tmp_path / "missing.json")) is None
+
+
+def test_committed_baseline_covers_every_benchmark():
+    baseline = harness.load_baseline()
+    assert set(BENCHMARKS) <= set(baseline["results"])
+
+
+def test_suite_runs_quickly():
+    results = run_suite(quick=True)
+    assert set(results) == set(BENCHMARKS)
+    assert results["mqtt_client.publish"]["batch"] > 1
@@ -0,0 +1,181 @@
+import base64
+import importlib.machinery
+import json
+import random
+import sys
+import types
+
+import pytest
+
+from agent.config import AgentConfig
+from agent.services.code_sync import (
+    MAX_CHUNK,
+    MIN_CHUNK,
+    CodeSync,
+    build_manifest,
+    chunk_data,
+    restart_in_place,
+)
+from agent.tests.test_agent_host import wait_for
+
+KEY = "release-key"
+MODULE = "".join(f"def f{i}(x):\n    return x * {i}\n\n\n" for i in range(400))
+
+
+def write_package(root, module):
+    (root / "services").mkdir(parents=True, exist_ok=True)
+    (root / "__init__.py").write_text("")
+    (root / "services" / "big.py").write_text(module)
+    return root
+
+
+def serve_release(backend, root, version, key=KEY):
+    """Route the manifest and chunks of the package at ``root``"""
+    manifest, chunks = build_manifest(str(root), version, key)
+    backend.route(
+        "GET", "/agent/code/manifest", lambda body, headers: (200, manifest, {})
+    )
+    backend.route(
+        "POST",
+        "/agent/code/chunks",
+        lambda body, headers: (
+            200,
+            {
+                "chunks": {
+                    digest: base64.b64encode(chunks[digest]).decode()
+                    for digest in body["hashes"]
+                    if digest in chunks
+                }
+            },
+            {},
+        ),
+    )
+    return manifest, chunks
+
+
+@pytest.fixture
+def make_sync(make_client):
+    def make(root):
+        client = make_client(CODE_SIGNING_KEY=KEY)
+        return CodeSync(client, root=str(root), config=client.config)
+
+    return make
+
+
+def test_chunk_boundaries_follow_content():
+    data = random.Random(1).randbytes(200_000)
+    chunks = chunk_data(data)
+    assert b"".join(chunks) == data
+    assert all(MIN_CHUNK <= len(chunk) <= MAX_CHUNK for chunk in chunks[:-1])
+
+    # An insertion only changes the chunks around it
+    edited = data[:100_000] + b"inserted" + data[100_000:]
+    changed = set(chunk_data(edited)) - set(chunks)
+    assert len(changed) <= 2
+
+
+def test_update_downloads_only_changed_chunks(backend, make_sync, tmp_path):
+    root = write_package(tmp_path / "agent", MODULE)
+    release = write_package(tmp_path / "release", MODULE.replace("x * 200", "x + 2"))
+    (release / "new.py").write_text("VALUE = 1\n")
+    manifest, _ = serve_release(backend, release, "v2")
+
+    sync = make_sync(root)
+    assert sync.update()
+    assert (root / "services" / "big.py").read_text() == (
+        release / "services" / "big.py"
+    ).read_text()
+    assert (root / "new.py").exists()
+    assert sync.installed()["id"] == manifest["id"]
+    stats = sync.last_update
+    assert stats["downloaded_bytes"] < MAX_CHUNK + 20
+    assert stats["reused_bytes"] > len(MODULE) - MAX_CHUNK
+
+    # Already installed: nothing more to download
+    requests = len(backend.requests)
+    assert not sync.update()
+    assert len(backend.requests) == requests + 1
+
+    assert sync.rollback()
+    assert (root / "services" / "big.py").read_text() == MODULE
+    assert not (root / "new.py").exists()
+
+
+def test_bad_release_leaves_code_untouched(backend, make_sync, tmp_path):
+    root = write_package(tmp_path / "agent", MODULE)
+    sync = make_sync(root)
+
+    release = write_package(tmp_path / "broken", MODULE + "def broken(:\n")
+    serve_release(backend, release, "v2")
+    assert not sync.update()
+
+    release = write_package(tmp_path / "corrupt", MODULE + "# changed\n")
+    serve_release(backend, release, "v3")
+    backend.route(
+        "POST",
+        "/agent/code/chunks",
+        lambda body, headers: (
+            200,
+            {"chunks": {d: base64.b64encode(b"junk").decode() for d in body["hashes"]}},
+            {},
+        ),
+    )
+    assert not sync.update()
+
+    assert (root / "services" / "big.py").read_text() == MODULE
+    assert not (tmp_path / "agent.staging").exists()
+    assert not (tmp_path / "agent.previous").exists()
+
+
+def test_unsigned_release_is_refused(backend, make_sync, tmp_path):
+    root = write_package(tmp_path / "agent", MODULE)
+    sync = make_sync(root)
+    release = write_package(tmp_path / "release", "VALUE = 2\n")
+    serve_release(backend, release, "v2", key="attacker-key")
+    assert not sync.update()
+    assert not any(r["path"] == "/agent/code/chunks" for r in backend.requests)
+    assert (root / "services" / "big.py").read_text() == MODULE
+
+    with pytest.raises(ValueError):
+        CodeSync(sync.backend_client, root=str(root), config=AgentConfig())
+
+
+def test_code_update_command_requests_restart(
+    backend, make_agent, make_client, tmp_path
+):
+    client = make_client(
+        DEVICE_NAME="code-test", CODE_SYNC_ENABLED=True, CODE_SIGNING_KEY=KEY
+    )
+    agent = make_agent(client)
+    assert "code_sync" in agent._job_intervals()
+    root = write_package(tmp_path / "agent", MODULE)
+    agent.code_sync = CodeSync(client, root=str(root), config=client.config)
+    agent.running = True
+
+    replies = []
+    serve_release(backend, write_package(tmp_path / "release", "VALUE = 2\n"), "v2")
+    agent.handle_command("code-update", reply=replies.append)
+    assert wait_for(lambda: replies)  # runs on the blocking executor
+    assert json.loads(replies[-1]) == {"code_updated": True}
+    assert agent.restart_requested and not agent.running
+    assert agent.get_status()["code"]["version"] == "v2"
+
+
+def test_restart_runs_the_same_command(monkeypatch):
+    # sys.orig_argv only exists from Python 3.10
+    monkeypatch.delattr(sys, "orig_argv", raising=False)
+    main = types.ModuleType("__main__")
+    main.__spec__ = importlib.machinery.ModuleSpec("agent.main", None)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    monkeypatch.setattr(sys, "argv", ["/opt/agent/main.py", "--verbose"])
+    calls = []
+    monkeypatch.setattr("os.execv", lambda path, argv: calls.append((path, argv)))
+
+    restart_in_place()
+    assert calls == [
+        (sys.executable, [sys.executable, "-m", "agent.main", "--verbose"])
+    ]
+
+    main.__spec__ = None  # run as a script
+    restart_in_place()
+    assert calls[-1][1] == [sys.executable, "/opt/agent/main.py", "--verbose"]
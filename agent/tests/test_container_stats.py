@@ -0,0 +1,130 @@
+import os
+import time
+
+import pytest
+
+from agent.config import AgentConfig
+from agent.services.alert_manager import AlertManager
+from agent.services.container_stats import ContainerStats
+from agent.services.system_monitor import SystemMonitor
+from agent.tests.fake_docker import FakeDockerDaemon
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def daemon():
+    with FakeDockerDaemon(stats_interval=0.05) as server:
+        yield server
+
+
+def write_cgroup(root, container_id, usage_usec, memory=200 * MB):
+    path = os.path.join(root, "system.slice", f"docker-{container_id}.scope")
+    os.makedirs(path, exist_ok=True)
+    files = {
+        "cpu.stat": f"usage_usec {usage_usec}\nuser_usec 0\nsystem_usec 0\n",
+        "memory.current": f"{memory}\n",
+        "memory.stat": f"anon {memory}\ninactive_file {50 * MB}\n",
+        "memory.max": f"{1000 * MB}\n",
+        "io.stat": "8:0 rbytes=4096 wbytes=1024 rios=1 wios=1\n"
+        "8:16 rbytes=4096 wbytes=0 rios=1 wios=0\n",
+        "pids.current": "7\n",
+    }
+    for name, content in files.items():
+        with open(os.path.join(path, name), "w") as f:
+            f.write(content)
+
+
+def wait_for_sample(stats, name, key, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        usage = stats.sample().get(name)
+        if usage and usage[key] is not None:
+            return usage
+        time.sleep(0.05)
+    raise AssertionError(f"no {key} for {name}")
+
+
+def test_reads_cgroup_files_without_docker_stats(daemon, tmp_path):
+    container_id = daemon.add_container("web", "nginx:1.25")
+    write_cgroup(tmp_path, container_id, usage_usec=1_000_000)
+    stats = ContainerStats(daemon.client(), cgroup_root=str(tmp_path))
+
+    first = stats.sample()["web"]
+    assert first["source"] == "cgroup"
+    assert first["cpu_percent"] is None  # needs two readings
+    assert first["memory_bytes"] == 150 * MB
+    assert first["memory_percent"] == 15.0
+    assert (first["io_read_bytes"], first["io_write_bytes"]) == (8192, 1024)
+    assert first["pids"] == 7
+
+    time.sleep(0.1)
+    write_cgroup(tmp_path, container_id, usage_usec=1_000_000 + 10_000_000)
+    assert stats.sample()["web"]["cpu_percent"] > 0
+    assert ("GET", "/containers/stats") not in daemon.calls
+
+
+def test_falls_back_to_one_stats_stream_per_container(daemon, tmp_path):
+    daemon.add_registry_image("worker:1", cpu=0.5, memory=100 * MB)
+    daemon.add_container("worker", "worker:1")
+    stats = ContainerStats(daemon.client(), cgroup_root=str(tmp_path))
+
+    usage = wait_for_sample(stats, "worker", "cpu_percent")
+    assert usage["source"] == "docker"
+    # 0.5 cores of the fake daemon's 4 CPUs
+    assert usage["cpu_percent"] == pytest.approx(12.5, abs=2)
+    assert usage["memory_bytes"] == 100 * MB
+    assert usage["net_rx_bytes"] > 0
+    for _ in range(5):
+        stats.sample()
+    assert daemon.calls.count(("GET", "/containers/stats")) == 1
+    stats.close()
+
+
+def test_container_usage_is_merged_into_health_and_alerts(daemon, tmp_path):
+    daemon.add_registry_image("hog:1", cpu=4, memory=100 * MB)
+    daemon.add_container("hog", "hog:1")
+    stats = ContainerStats(daemon.client(), cgroup_root=str(tmp_path))
+    wait_for_sample(stats, "hog", "cpu_percent")
+
+    monitor = SystemMonitor(containers=stats)
+    health = monitor.get_health_status({"cpu": 100, "memory": 100, "disk": 100})
+    assert health["status"] == "warning"
+    assert health["checks"]["container/hog/cpu"]["status"] == "warning"
+    assert health["containers"]["hog"]["memory_bytes"] == 100 * MB
+
+    alerts = AlertManager(AgentConfig(ALERT_MIN_DURATION=0))
+    messages = [alert["message"] for alert in alerts.evaluate(health)]
+    assert any(m.startswith("High CPU (container hog) usage") for m in messages)
+    stats.close()
+
+
+def write_net_dev(root, pid, rx_bytes):
+    path = os.path.join(root, str(pid), "net")
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "dev"), "w") as f:
+        f.write("Inter-|   Receive\n face |bytes\n")
+        f.write(f"  eth0: {rx_bytes} 1 0 0 0 0 0 0 {rx_bytes // 2} 1 0 0 0 0 0 0\n")
+
+
+def test_restarted_container_is_looked_up_again(daemon, tmp_path):
+    container_id = daemon.add_container("web", "nginx:1.25")
+    cgroups, proc = tmp_path / "cgroup", tmp_path / "proc"
+    write_cgroup(cgroups, container_id, usage_usec=5_000_000)
+    config = AgentConfig(CONTAINER_LIST_INTERVAL=0)
+    stats = ContainerStats(
+        daemon.client(), config, cgroup_root=str(cgroups), proc_root=str(proc)
+    )
+    client = daemon.client()
+    write_net_dev(proc, client.containers.get(container_id).attrs["State"]["Pid"], 100)
+    assert stats.sample()["web"]["net_rx_bytes"] == 100
+
+    client.containers.get(container_id).stop()
+    client.containers.get(container_id).start()
+    pid = client.containers.get(container_id).attrs["State"]["Pid"]
+    write_net_dev(proc, pid, 300)
+    write_cgroup(cgroups, container_id, usage_usec=1_000)
+
+    usage = stats.sample()["web"]
+    assert usage["net_rx_bytes"] == 300  # read through the new pid
+    assert usage["cpu_percent"] is None  # the old usage is not a baseline
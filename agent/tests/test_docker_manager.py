@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from agent.config import Config
+from agent.services.docker_manager import DockerManager
+from agent.tests.fake_docker import FakeDockerDaemon
+
+
+@pytest.fixture
+def daemon():
+    with FakeDockerDaemon() as daemon:
+        daemon.add_container(Config.CONTAINER_NAME, "agent:v1", {"MODE": "old"})
+        daemon.add_registry_image("agent:v2", size=1000)
+        yield daemon
+
+
+@pytest.fixture
+def manager(daemon):
+    return DockerManager(client=daemon.client(), settle_time=0)
+
+
+def running_image(daemon):
+    container = daemon.container_by_name(Config.CONTAINER_NAME)
+    assert container is not None and container["State"]["Running"]
+    return container["Config"]["Image"]
+
+
+def test_update_swaps_container(daemon, manager):
+    assert manager.update_container(image_tag="agent:v2", environment={"MODE": "new"})
+    assert running_image(daemon) == "agent:v2"
+    assert manager.get_current_image_tag() == "agent:v2"
+    assert manager.previous_image_tag == "agent:v1"
+    state = manager.get_actual_state(max_age=0)
+    assert state["running"] and state["env"]["MODE"] == "new"
+
+
+def test_update_without_pull_uses_the_local_image(daemon, manager):
+    assert manager.pull_latest_image("agent:v2")
+    daemon.reset_calls()
+    assert manager.update_container(image_tag="agent:v2", pull=False)
+    assert running_image(daemon) == "agent:v2"
+    assert ("POST", "/images/create") not in daemon.calls
+
+
+def test_failed_pull_keeps_previous_image(daemon, manager):
+    daemon.fail_next("pull")
+    manager.update_container(image_tag="agent:v2")
+    assert running_image(daemon) == "agent:v1"
+
+
+def test_unknown_image_keeps_previous_image(daemon, manager):
+    manager.update_container(image_tag="agent:missing")
+    assert running_image(daemon) == "agent:v1"
+
+
+def test_crashing_release_is_rolled_back(daemon, manager):
+    daemon.add_registry_image("agent:bad", size=1000, exit_after=0)
+    assert manager.update_container(image_tag="agent:bad")  # rollback succeeded
+    assert running_image(daemon) == "agent:v1"
+
+
+def test_failed_start_is_rolled_back(daemon, manager):
+    daemon.fail_next("start")
+    manager.update_container(image_tag="agent:v2")
+    assert running_image(daemon) == "agent:v1"
+
+
+def test_container_health_progresses(daemon, manager):
+    daemon.add_registry_image("agent:hc", size=1000, health_delay=0.1)
+    assert manager.update_container(image_tag="agent:hc")
+    container = daemon.container_by_name(Config.CONTAINER_NAME)
+    assert container["State"]["Health"]["Status"] == "starting"
+    time.sleep(0.15)
+    container = daemon.container_by_name(Config.CONTAINER_NAME)
+    assert container["State"]["Health"]["Status"] == "healthy"
+
+
+def test_pull_speed_and_latency_are_simulated(daemon, manager):
+    daemon.pull_speed = 10000  # 1000-byte image -> 0.1s
+    start = time.perf_counter()
+    assert manager.pull_latest_image("agent:v2")
+    assert time.perf_counter() - start >= 0.1
+
+    daemon.latency = 0.05
+    start = time.perf_counter()
+    manager.get_container_status()
+    assert time.perf_counter() - start >= 0.05
@@ -0,0 +1,49 @@
+import threading
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from agent.services.local_broker import LocalBroker, topic_matches
+
+
+@pytest.fixture
+def broker():
+    broker = LocalBroker(port=0).start()
+    yield broker
+    broker.stop()
+
+
+def test_topic_matches_wildcards():
+    assert topic_matches("agent/+/status", "agent/1/status")
+    assert topic_matches("agent/#", "agent/1/status")
+    assert not topic_matches("agent/+", "agent/1/status")
+    assert not topic_matches("agent/1/status", "agent/2/status")
+
+
+def test_publish_reaches_subscriber(broker):
+    received = []
+    subscribed = threading.Event()
+    delivered = threading.Event()
+
+    subscriber = mqtt.Client()
+    subscriber.on_subscribe = lambda *args: subscribed.set()
+    subscriber.on_message = lambda c, u, msg: (
+        received.append((msg.topic, msg.payload)),
+        delivered.set(),
+    )
+    subscriber.connect("127.0.0.1", broker.port)
+    subscriber.subscribe("agent/+/status")
+    subscriber.loop_start()
+    assert subscribed.wait(5)
+
+    publisher = mqtt.Client()
+    publisher.connect("127.0.0.1", broker.port)
+    publisher.loop_start()
+    publisher.publish("agent/7/status", b"SENSOR:{}", qos=1).wait_for_publish(5)
+
+    assert delivered.wait(5)
+    assert received == [("agent/7/status", b"SENSOR:{}")]
+    assert broker.stats["published"] == 1
+    for client in (publisher, subscriber):
+        client.loop_stop()
+        client.disconnect()
@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.services.metrics_store import MetricsStore
+from agent.services.system_monitor import SystemMonitor
+
+CAPACITIES = {"raw": 100, "1m": 50, "1h": 10}
+
+
+def make_store(path, **capacities):
+    return MetricsStore(str(path), capacities={**CAPACITIES, **capacities})
+
+
+def test_downsampling_tiers(tmp_path):
+    store = make_store(tmp_path, raw=1000, **{"1m": 200})
+    # Two hours of samples every 10 seconds, cpu ramping 0..71 per hour
+    for step in range(720):
+        ts = 7200 + step * 10
+        store.append({"cpu": step % 360 / 5, "memory": 50, "disk": 10}, ts=ts)
+
+    minutes = store.query("cpu", start=7200, end=14400, tier="1m", limit=1000)
+    first = minutes["points"][0]
+    assert first == [7200, 0.5, 0.0, 1.0]  # mean, min, max of 0.0..1.0
+    hour = store.query("cpu", start=0, end=14400, tier="1h")["points"]
+    assert hour == [[7200, pytest.approx(35.9), 0.0, 71.8]]
+
+    assert store.query("cpu", start=7200, end=14400, tier="1m", agg="max")[
+        "value"
+    ] == pytest.approx(71.8)
+    assert store.query("memory", start=0, end=20000, agg="mean")["value"] == 50
+
+
+def test_downsampled_aggregates_weigh_buckets_by_samples(tmp_path):
+    store = make_store(tmp_path)
+    # One sample in the first minute, three in the second
+    for ts, cpu in [(0, 0), (60, 4), (70, 4), (80, 4), (120, 0)]:
+        store.append({"cpu": cpu}, ts=ts)
+
+    mean = store.query("cpu", start=0, end=119, tier="1m", agg="mean")
+    assert mean["value"] == 3 and mean["count"] == 4
+    assert store.query("cpu", start=0, end=119, tier="1m", agg="count")["value"] == 4
+    points = store.query("cpu", start=0, end=119, tier="1m")["points"]
+    assert points == [[0, 0, 0, 0], [60, 4, 4, 4]]
+
+
+def test_ring_is_bounded_and_survives_reopen(tmp_path):
+    store = make_store(tmp_path)
+    for step in range(250):
+        store.append({"cpu": step, "memory": 1, "disk": 1}, ts=1000 + step)
+    sizes = {name: os.path.getsize(tmp_path / f"{name}.ts") for name in CAPACITIES}
+    store.close()
+
+    store = make_store(tmp_path)
+    assert store.stats()["raw"]["rows"] == 100
+    assert {name: stats["bytes"] for name, stats in store.stats().items()} == sizes
+    raw = store.query("cpu", start=0, end=2000, tier="raw", limit=1000)["points"]
+    assert raw[0] == [1150, 150] and raw[-1] == [1249, 249]
+    store.close()
+
+
+def test_tier_is_picked_by_range_and_limit(tmp_path):
+    store = make_store(tmp_path, **{"1m": 200})
+    for step in range(200):
+        store.append({"cpu": 1, "memory": 1, "disk": 1}, ts=step * 30)
+    # Raw keeps the last 100 samples (from 3000s); older ranges use 1m
+    assert store.query("cpu", start=4000, end=5970)["tier"] == "raw"
+    assert store.query("cpu", start=1000, end=5970)["tier"] == "1m"
+    assert store.query("cpu", start=4000, end=5970, limit=40)["tier"] == "1m"
+    # Before anything was kept, the tier reaching furthest back is used
+    assert store.query("cpu", start=-5000, end=5970)["tier"] == "1m"
+    with pytest.raises(ValueError):
+        store.query("gpu")
+
+
+def test_monitor_records_and_agent_answers_queries(tmp_path):
+    config = AgentConfig(
+        DEVICE_NAME="history",
+        MQTT_ENABLED=False,
+        METRICS_STORE_PATH=str(tmp_path),
+    )
+    monitor = SystemMonitor(store=make_store(tmp_path))
+    for _ in range(3):
+        monitor.get_system_info()
+    agent = IoTAgent(config=config, system_monitor=monitor, manage_containers=False)
+
+    replies = []
+    agent.handle_command(
+        'metrics {"metric": "memory", "since": 60, "agg": "count"}',
+        reply=replies.append,
+    )
+    assert json.loads(replies[-1])["value"] == 3
+    agent.handle_command('metrics {"metric": "gpu"}', reply=replies.append)
+    assert "unknown metric" in json.loads(replies[-1])["error"]
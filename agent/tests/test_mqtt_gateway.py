@@ -0,0 +1,125 @@
+import json
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from agent.config import AgentConfig
+from agent.services.local_broker import LocalBroker
+from agent.services.mqtt_gateway import MqttGateway
+from agent.tests.test_agent_host import wait_for
+
+
+@pytest.fixture
+def central():
+    broker = LocalBroker(port=0).start()
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def gateway(central):
+    config = AgentConfig(
+        DEVICE_ID=1,
+        DEVICE_NAME="site-gw",
+        MQTT_BROKER="127.0.0.1",
+        MQTT_PORT=central.port,
+        GATEWAY_HOST="127.0.0.1",
+        GATEWAY_PORT=0,
+        GATEWAY_DEVICE_IDS=[2, 3, 4, 5],
+        GATEWAY_BATCH_SIZE=10,
+        GATEWAY_BATCH_INTERVAL=0.2,
+        GATEWAY_UPLINK_TOPIC="gateway/1/batch",
+    )
+    gateway = MqttGateway(config).start()
+    assert wait_for(lambda: gateway.get_status()["upstream_connected"])
+    yield gateway
+    gateway.stop()
+
+
+def connect(port, subscribe=None, received=None):
+    client = mqtt.Client()
+    if received is not None:
+        client.on_message = lambda c, u, msg: received.append((msg.topic, msg.payload))
+    client.connect("127.0.0.1", port)
+    if subscribe:
+        client.subscribe(subscribe)
+    client.loop_start()
+    return client
+
+
+def unbatch(uplink):
+    """Messages as published by the devices, from what reached the central broker"""
+    messages = []
+    for topic, payload in list(uplink):
+        if topic == "gateway/1/batch":
+            messages += json.loads(payload)["messages"]
+        else:  # a lone message is forwarded as is
+            messages.append({"topic": topic, "payload": payload.decode()})
+    return messages
+
+
+def test_neighbours_share_one_upstream_connection(central, gateway):
+    uplink = []
+    monitor = connect(central.port, "#", uplink)
+    devices = [
+        connect(gateway.port, f"agent/{device_id}/cmd") for device_id in range(2, 6)
+    ]
+    assert wait_for(lambda: gateway.get_status()["subscriptions"] == 4)
+    # The gateway and the test's monitor are the central broker's only clients
+    assert central.clients == 2
+
+    for device_id, client in zip(range(2, 6), devices):
+        for n in range(3):
+            client.publish(f"agent/{device_id}/status", f"SENSOR:{n}")
+    assert wait_for(lambda: len(unbatch(uplink)) == 12)
+    assert gateway.stats["forwarded"] == 12
+    assert gateway.stats["batches"] < 12
+    messages = unbatch(uplink)
+    assert {"topic": "agent/3/status", "payload": "SENSOR:2"} in messages
+    for client in devices + [monitor]:
+        client.disconnect()
+        client.loop_stop()
+
+
+def test_commands_fan_out_by_topic(central, gateway):
+    received = {2: [], 3: []}
+    devices = [
+        connect(gateway.port, f"agent/{device_id}/cmd", received[device_id])
+        for device_id in received
+    ]
+    assert wait_for(lambda: len(central.subscriptions()) == 2)
+
+    central.publish("agent/3/cmd", b"status")
+    assert wait_for(lambda: received[3] == [("agent/3/cmd", b"status")])
+    assert received[2] == []
+
+    # Subscriptions follow the devices: gone upstream once they disconnect
+    for client in devices:
+        client.disconnect()
+        client.loop_stop()
+    assert wait_for(lambda: central.subscriptions() == set())
+
+
+def test_local_clients_cannot_command_or_widen_the_uplink(central, gateway):
+    received = []
+    device = connect(gateway.port, "agent/2/cmd", received)
+    intruder = connect(gateway.port, [("#", 0), ("agent/9/cmd", 0)])
+    uplink = []
+    monitor = connect(central.port, "#", uplink)
+    assert wait_for(lambda: gateway.get_status()["subscriptions"] == 1)
+    assert central.subscriptions() == {"agent/2/cmd", "#"}  # "#" is the monitor
+
+    intruder.publish("agent/2/cmd", "restart")
+    intruder.publish("agent/9/cmd", "restart")
+    intruder.publish("agent/2/status", "SENSOR:1")
+    assert wait_for(lambda: unbatch(uplink) != [])
+    assert wait_for(lambda: gateway.get_status()["rejected"] == 2)
+    assert received == []
+    assert unbatch(uplink) == [{"topic": "agent/2/status", "payload": "SENSOR:1"}]
+    for client in [device, intruder, monitor]:
+        client.disconnect()
+        client.loop_stop()
+
+
+def test_gateway_listens_on_localhost_by_default():
+    assert AgentConfig().GATEWAY_HOST == "127.0.0.1"
@@ -0,0 +1,125 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from agent.config import AgentConfig
+from agent.services.docker_manager import DockerManager
+from agent.services.peer_images import PeerImageCache, _canonical
+from agent.tests.fake_docker import FakeDockerDaemon
+from agent.tests.test_agent_host import wait_for
+from agent.utils.traffic import traffic
+
+MB = 1024 * 1024
+
+
+def make_cache(daemon, device_id, **overrides):
+    config = AgentConfig(
+        DEVICE_ID=device_id,
+        PEER_PORT=0,
+        PEER_DISCOVERY_PORT=0,
+        PEER_BROADCAST_ADDRESS="127.0.0.1",
+        PEER_ANNOUNCE_INTERVAL=1,
+        PEER_SHARED_SECRET="site-secret",
+        **overrides,
+    )
+    return PeerImageCache(daemon.client(), config).start()
+
+
+@pytest.fixture
+def site():
+    """Two devices with their own Docker daemons, both able to pull app:v2"""
+    daemons = [FakeDockerDaemon().start() for _ in range(2)]
+    for daemon in daemons:
+        daemon.add_registry_image("app:v2", size=2 * MB)
+    caches = [
+        make_cache(daemon, device_id) for device_id, daemon in enumerate(daemons, 1)
+    ]
+    for cache in caches:
+        for other in caches:
+            cache.receive(other.announcement(), "127.0.0.1")
+    traffic.reset()
+    yield daemons, caches
+    for cache in caches:
+        cache.stop()
+    for daemon in daemons:
+        daemon.stop()
+
+
+def manager(daemon, cache):
+    docker_manager = DockerManager(client=daemon.client(), settle_time=0)
+    docker_manager.peers = cache
+    return docker_manager
+
+
+def test_only_the_leader_pulls_from_the_registry(site):
+    (leader_daemon, follower_daemon), (leader, follower) = site
+    assert leader.is_leader() and not follower.is_leader()
+
+    # The follower waits for the leader instead of pulling itself
+    result = []
+    pulling = threading.Thread(
+        target=lambda: result.append(
+            manager(follower_daemon, follower).pull_latest_image("app:v2")
+        )
+    )
+    pulling.start()
+    time.sleep(0.3)
+    assert manager(leader_daemon, leader).pull_latest_image("app:v2")
+    follower.receive(leader.announcement(), "127.0.0.1")
+    pulling.join(timeout=10)
+
+    assert result == [True]
+    assert follower_daemon._find_image("app:v2") is not None
+    assert ("POST", "/images/create") in leader_daemon.calls
+    assert ("POST", "/images/create") not in follower_daemon.calls
+    assert ("POST", "/images/load") in follower_daemon.calls
+    assert traffic.snapshot()["peer"]["received"] > 2 * MB
+    assert traffic.snapshot()["registry"]["received"] == 2 * MB
+
+    # Already present: nothing is fetched again
+    follower_daemon.reset_calls()
+    assert manager(follower_daemon, follower).pull_latest_image("app:v2")
+    assert ("POST", "/images/load") not in follower_daemon.calls
+
+
+def test_leadership_passes_on_and_latest_comes_from_the_registry(site):
+    (_, follower_daemon), (leader, follower) = site
+    follower.peers[leader.device_id]["seen"] -= 10  # leader went silent
+    assert follower.is_leader()
+
+    follower_daemon.add_registry_image("app:latest", size=MB)
+    assert manager(follower_daemon, follower).pull_latest_image("app")
+    assert ("POST", "/images/create") in follower_daemon.calls
+
+
+def test_announcements_are_received_over_udp(site):
+    _, (leader, follower) = site
+    port = follower._socket.getsockname()[1]
+    spoofed = {"device_id": 6, "port": 5050, "images": {"app:v3": "sha256:x"}}
+    signed = dict(leader.announcement(), device_id=7, images={"app:v3": "sha256:y"})
+    del signed["signature"]
+    signed["signature"] = leader.sign(_canonical(signed))
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        for message in (spoofed, signed):
+            sender.sendto(json.dumps(message).encode(), ("127.0.0.1", port))
+    assert wait_for(lambda: 7 in follower.peers, timeout=5)
+    assert 6 not in follower.peers
+    assert follower.holders("app:v3")[0]["port"] == leader.port
+
+
+def test_peers_only_serve_and_load_signed_images(site):
+    (leader_daemon, follower_daemon), (leader, follower) = site
+    assert manager(leader_daemon, leader).pull_latest_image("app:v2")
+    url = f"http://127.0.0.1:{leader.port}/images/app%3Av2"
+    assert requests.get(url, timeout=5).status_code == 403
+
+    # A peer serving a different image than the one it announced
+    leader._images = {"app:v2": "sha256:" + "0" * 64}
+    follower.receive(leader.announcement(), "127.0.0.1")
+    assert not follower.fetch("app:v2")
+    assert ("POST", "/images/load") in follower_daemon.calls
+    assert follower_daemon._find_image("app:v2") is None
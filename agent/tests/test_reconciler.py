@@ -0,0 +1,151 @@
+from agent.client.backend_client import BackendClient
+from agent.client.transport import RequestsTransport
+from agent.mock_backend import MockBackend
+from agent.services.reconciler import Reconciler
+
+
+class FakeDockerManager:
+    def __init__(self, image="agent:v1", env=None, update_ok=True, rolls_back=False):
+        self.state = {"image": image, "env": env or {}, "running": True}
+        self.update_ok = update_ok
+        self.rolls_back = rolls_back  # the release crashes and is rolled back
+        self.updates = []
+        self.pulls = 0
+        self.state_reads = 0
+
+    def get_actual_state(self, max_age=None):
+        self.state_reads += 1
+        return self.state
+
+    def update_container(self, image_tag=None, environment=None, pull=True):
+        self.updates.append((image_tag, environment))
+        self.pulls += pull
+        if self.update_ok and not self.rolls_back:
+            self.state = {
+                "image": image_tag,
+                "env": dict(self.state["env"], **(environment or {})),
+                "running": True,
+            }
+        return self.update_ok
+
+
+def make_reconciler(backend, docker):
+    client = BackendClient(transport=RequestsTransport(2, 5))
+    client.base_url = backend.url
+    return Reconciler(client, docker, poll_interval=60)
+
+
+def test_no_action_when_in_sync():
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v1"}
+        docker = FakeDockerManager()
+        reconciler = make_reconciler(backend, docker)
+        assert reconciler.reconcile_once() == "in_sync"
+        assert reconciler.reconcile_once() == "in_sync"
+        assert docker.updates == []
+
+
+def test_desired_state_is_revalidated_by_etag():
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v1"}
+        reconciler = make_reconciler(backend, FakeDockerManager())
+        reconciler.reconcile_once()
+        reconciler.reconcile_once()
+        first, second = [r for r in backend.requests if r["path"].endswith("updates")]
+        assert "If-None-Match" not in first["headers"]
+        etag = reconciler.backend_client._desired_etag
+        assert etag and second["headers"]["If-None-Match"] == etag
+        assert reconciler.desired == {"image": "agent:v1"}
+
+
+def test_image_and_env_diff_is_applied():
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v2", "env": {"MODE": "fast"}}
+        docker = FakeDockerManager(env={"MODE": "slow"})
+        reconciler = make_reconciler(backend, docker)
+        assert reconciler.reconcile_once() == "applied"
+        assert docker.updates == [("agent:v2", {"MODE": "fast"})]
+        assert docker.pulls == 1
+        assert reconciler.reconcile_once() == "in_sync"
+
+
+def test_env_change_reuses_the_local_image():
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v1", "env": {"MODE": "fast"}}
+        docker = FakeDockerManager(env={"MODE": "slow"})
+        reconciler = make_reconciler(backend, docker)
+        assert reconciler.reconcile_once() == "applied"
+        assert docker.updates == [("agent:v1", {"MODE": "fast"})]
+        assert docker.pulls == 0
+
+
+def test_pushed_state_skips_fetch():
+    with MockBackend() as backend:
+        docker = FakeDockerManager()
+        reconciler = make_reconciler(backend, docker)
+        reconciler.notify({"image": "agent:v3"})
+        assert reconciler.reconcile_once() == "applied"
+        assert backend.requests[-1]["path"] == "/logs"
+        assert not any(r["path"].endswith("updates") for r in backend.requests)
+
+
+def test_failed_apply_backs_off_until_next_poll():
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v2"}
+        docker = FakeDockerManager(update_ok=False)
+        reconciler = make_reconciler(backend, docker)
+        assert reconciler.reconcile_once() == "failed"
+        assert reconciler.reconcile_once() == "backoff"
+        assert len(docker.updates) == 1
+
+
+def test_rolled_back_release_is_reported_as_failed():
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v2"}
+        docker = FakeDockerManager(rolls_back=True)
+        reconciler = make_reconciler(backend, docker)
+        assert reconciler.reconcile_once() == "failed"
+        assert reconciler.reconcile_once() == "backoff"
+        logs = [r["body"] for r in backend.requests if r["path"] == "/logs"]
+        assert logs[-1]["type"] == "rollback"
+
+
+def test_desired_config_is_applied_once():
+    with MockBackend() as backend:
+        config = {"version": 2, "settings": {"sensor_interval": 30}}
+        backend.desired_state = {"image": "agent:v1", "config": config}
+        docker = FakeDockerManager()
+        reconciler = make_reconciler(backend, docker)
+        applied = []
+
+        def apply_config(update):
+            applied.append(update)
+            return True, "applied"
+
+        reconciler.apply_config = apply_config
+        assert reconciler.reconcile_once() == "applied"
+        assert reconciler.reconcile_once() == "in_sync"
+        assert applied == [config] and docker.updates == []
+
+
+def test_failed_config_is_retried_after_backoff():
+    with MockBackend() as backend:
+        config = {"version": 2, "settings": {"sensor_interval": 30}}
+        backend.desired_state = {"image": "agent:v1", "config": config}
+        reconciler = make_reconciler(backend, FakeDockerManager())
+        results = [(False, "apply failed: disk full"), (True, "applied")]
+        attempts = []
+
+        def apply_config(update):
+            attempts.append(update)
+            return results[len(attempts) - 1]
+
+        reconciler.apply_config = apply_config
+        assert reconciler.reconcile_once() == "in_sync"
+        assert reconciler.reconcile_once() == "in_sync"
+        assert len(attempts) == 1  # backing off
+
+        reconciler._config_failed_at -= reconciler.poll_interval
+        assert reconciler.reconcile_once() == "applied"
+        assert reconciler.reconcile_once() == "in_sync"
+        assert len(attempts) == 2
@@ -0,0 +1,79 @@
+import time
+
+from agent.client import transport as transports
+from agent.client.backend_client import BackendClient
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.mock_backend import MockBackend
+from agent.services.resource_budget import ResourceBudget
+from agent.tests.test_reconciler import FakeDockerManager, make_reconciler
+from agent.utils.traffic import TrafficMeter
+
+
+def test_cpu_over_budget_slows_down_until_back_within():
+    config = AgentConfig(
+        BUDGET_CPU_PERCENT=5, BUDGET_MEMORY_MB=0, BUDGET_MAX_SLOWDOWN=4
+    )
+    budget = ResourceBudget(config, meter=TrafficMeter())
+    for expected in (2, 4, 4):
+        with budget.measure("sweep"):
+            deadline = time.thread_time() + 0.05
+            while time.thread_time() < deadline:
+                pass
+        budget.check()
+        assert budget.over == {"cpu"}
+        assert budget.slowdown == expected
+    assert budget.get_status()["cpu_seconds"]["sweep"] >= 0.15
+
+    time.sleep(0.3)
+    assert budget.check() == set()
+    assert budget.slowdown == 2 and not budget.over
+
+
+def test_network_over_budget_defers_pulls():
+    meter = TrafficMeter()
+    config = AgentConfig(
+        BUDGET_NETWORK_KBPS=1, BUDGET_CPU_PERCENT=0, BUDGET_MEMORY_MB=0
+    )
+    budget = ResourceBudget(config, meter=meter)
+    meter.add("registry", received=1_000_000)
+    assert budget.check() == {"network"}
+    assert budget.defer_pulls
+    assert budget.get_status()["network_bytes"] == {"registry": 1_000_000}
+
+    with MockBackend() as backend:
+        backend.desired_state = {"image": "agent:v2"}
+        docker = FakeDockerManager()
+        reconciler = make_reconciler(backend, docker)
+        reconciler.defer_pulls = lambda: budget.defer_pulls
+        assert reconciler.reconcile_once() == "deferred"
+        assert docker.updates == []
+
+        time.sleep(0.1)
+        budget.check()
+        assert reconciler.reconcile_once() == "applied"
+
+
+def test_agent_degrades_over_budget():
+    with MockBackend() as backend:
+        config = AgentConfig(
+            DEVICE_NAME="budget-test",
+            BACKEND_URL=backend.url,
+            MQTT_ENABLED=False,
+            BUDGET_ENABLED=True,
+            BUDGET_MEMORY_MB=1,
+        )
+        client = BackendClient(
+            transport=transports.RequestsTransport(2, 5), config=config
+        )
+        agent = IoTAgent(config=config, backend_client=client, manage_containers=False)
+        sensor_interval = agent._job_intervals()["sensor"]
+        agent.budget.slowdown = 4
+        assert agent._job_intervals()["sensor"] == sensor_interval * 4
+        assert agent._job_intervals()["heartbeat"] == client.heartbeat.interval
+
+        agent._check_budget()
+        assert "memory" in agent.budget.over
+        logs = [r["body"] for r in backend.requests if r["path"] == "/logs"]
+        assert any(log["type"] == "budget" for log in logs)
+        assert "budget" in agent.get_status()
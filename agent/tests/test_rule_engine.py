@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.services.rule_engine import RuleEngine
+
+
+def fired(engine, samples, start=0, step=10):
+    """Rule names fired by each sample, fed ``step`` seconds apart"""
+    return [
+        [event["rule"] for event in engine.evaluate(sample, ts=start + i * step)]
+        for i, sample in enumerate(samples)
+    ]
+
+
+def test_threshold_fires_on_rising_edge_with_cooldown():
+    engine = RuleEngine(
+        [
+            {
+                "name": "hot",
+                "sensor": "temperature",
+                "op": ">",
+                "value": 35,
+                "cooldown": 35,
+            }
+        ]
+    )
+    temps = [30, 36, 37, 30, 38, 30, 39]
+    result = fired(engine, [{"temperature": t} for t in temps])
+    # Stays quiet while it keeps matching, and re-arms after the cooldown
+    assert result == [[], ["hot"], [], [], [], [], ["hot"]]
+
+
+def test_rate_and_window_rules():
+    engine = RuleEngine(
+        [
+            {"name": "spike", "sensor": "temperature", "type": "rate", "value": 0.5},
+            {
+                "name": "humid",
+                "sensor": "humidity",
+                "type": "window",
+                "agg": "mean",
+                "window": 30,
+                "op": ">=",
+                "value": 70,
+            },
+            {
+                "name": "peak",
+                "sensor": "humidity",
+                "type": "window",
+                "agg": "max",
+                "window": 30,
+                "value": 85,
+            },
+        ]
+    )
+    samples = [
+        {"temperature": 20, "humidity": 60},
+        {"temperature": 22, "humidity": 90},  # +0.2/s; mean 75, max 90
+        {"temperature": 30, "humidity": 60},  # +0.8/s; mean 70
+        {"temperature": 30, "humidity": 60},  # mean 70 (60 dropped)
+        {"temperature": 30, "humidity": 60},  # 90 left the window
+    ]
+    assert fired(engine, samples) == [[], ["humid", "peak"], ["spike"], [], []]
+
+
+def test_invalid_rules_are_rejected_and_old_rules_kept():
+    engine = RuleEngine([{"name": "hot", "sensor": "temperature", "value": 35}])
+    for rules in (
+        [{"name": "x", "sensor": "temperature"}],
+        [{"name": "x", "sensor": "temperature", "value": 1, "type": "median"}],
+        [{"name": "x", "sensor": "temperature", "value": 1, "op": "=>"}],
+        [{"name": "x", "sensor": "t", "value": 1, "action": {"cmd": "update"}}],
+    ):
+        with pytest.raises(ValueError):
+            engine.load(rules)
+    assert [rule.name for rule in engine.rules] == ["hot"]
+
+
+def test_agent_publishes_events_and_runs_commands(tmp_path):
+    rules = [
+        {"name": "hot", "sensor": "temperature", "value": 35},
+        {
+            "name": "cold",
+            "sensor": "temperature",
+            "op": "<",
+            "value": 0,
+            "action": {"command": "reconcile"},
+        },
+    ]
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(rules))
+    config = AgentConfig(
+        DEVICE_NAME="edge",
+        MQTT_ENABLED=False,
+        RULES_FILE=str(path),
+        SENSOR_PUBLISH_RAW=False,
+    )
+    agent = IoTAgent(config=config, system_monitor=object(), manage_containers=False)
+    published, commands = [], []
+    agent.mqtt_client = type(
+        "Mqtt", (), {"publish": lambda self, m: published.append(m)}
+    )()
+    handle_command = agent.handle_command
+    agent.handle_command = lambda payload, reply=None: commands.append(payload)
+
+    for temperature in (20, 40, -5):
+        agent.sensor_simulator.get_data = lambda t=temperature: {"temperature": t}
+        agent._send_sensor_data()
+    assert len(published) == 1 and published[0].startswith("EVENT:")
+    assert json.loads(published[0][6:])["rule"] == "hot"
+    assert commands == ["reconcile"]
+
+    replies = []
+    handle_command('rules [{"name": "x"}]', reply=replies.append)
+    assert json.loads(replies[-1])["rules_applied"] is False
+    handle_command("rules []", reply=replies.append)
+    assert json.loads(replies[-1]) == {"rules_applied": True, "count": 0}
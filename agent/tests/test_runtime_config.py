@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from agent.runtime_config import RuntimeConfig, initial_settings
+
+
+class FixedMonitor:
+    """System monitor stub reporting fixed usage percentages"""
+
+    def __init__(self, cpu=50.0, memory=50.0, disk=50.0):
+        from agent.services.system_monitor import SystemMonitor
+
+        self.info = {
+            "cpu": {"percent": cpu},
+            "memory": {"percent": memory},
+            "disk": {"percent": disk},
+        }
+        self.monitor = SystemMonitor()
+        self.monitor.get_system_info = lambda: self.info
+
+    def __getattr__(self, name):
+        return getattr(self.monitor, name)
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(DEVICE_NAME="config-test")
+
+
+def test_invalid_update_is_rejected_as_a_whole():
+    config = RuntimeConfig(initial_settings())
+    before = config.snapshot()
+    applied, reason = config.apply(
+        {"version": 1, "settings": {"log_interval": 30, "cpu_threshold": 150}}
+    )
+    assert not applied
+    assert "cpu_threshold" in reason
+    assert config.snapshot() == before
+
+    assert config.apply({"version": 1, "settings": {"log_interval": 30}})[0]
+    assert config.get("log_interval") == 30
+    # Older or repeated versions are ignored
+    assert not config.apply({"version": 1, "settings": {"log_interval": 45}})[0]
+    assert config.get("log_interval") == 30
+
+
+def test_listener_failure_rolls_back():
+    config = RuntimeConfig(initial_settings())
+    calls = []
+
+    def listener(changed, settings):
+        calls.append(dict(changed))
+        if changed.get("sensor_interval") == 5:
+            raise RuntimeError("cannot apply")
+
+    config.add_listener(listener)
+    original = config.get("sensor_interval")
+    applied, _ = config.apply({"version": 3, "settings": {"sensor_interval": 5}})
+    assert not applied
+    assert config.version == 0
+    assert config.get("sensor_interval") == original
+    assert calls == [{"sensor_interval": 5}, {"sensor_interval": original}]
+
+
+def test_new_intervals_reschedule_jobs(make_agent, client):
+    agent = make_agent(client, system_monitor=FixedMonitor())
+    agent._setup_schedules()
+    applied, _ = agent.apply_runtime_config(
+        {"version": 1, "settings": {"sensor_interval": 2, "heartbeat_interval": 60}}
+    )
+    assert applied
+    agent.run_pending()
+    assert agent._jobs["sensor"][0].interval == 2
+    assert agent._jobs["heartbeat"][0].interval == 60
+    assert agent.backend_client.heartbeat.interval == 60
+
+
+def test_thresholds_apply_to_health_checks(make_agent, client):
+    agent = make_agent(client, system_monitor=FixedMonitor(cpu=70))
+    assert agent.get_status()["system_health"]["status"] == "healthy"
+    agent.apply_runtime_config({"version": 2, "settings": {"cpu_threshold": 60}})
+    health = agent.get_status()["system_health"]
+    assert health["status"] == "warning"
+    assert health["checks"]["cpu"]["threshold"] == 60
+
+
+def test_config_via_heartbeat_and_command(backend, make_agent, client):
+    agent = make_agent(client, system_monitor=FixedMonitor())
+    agent.running = True
+    backend.heartbeat_reply = {
+        "config": {"version": 4, "settings": {"log_interval": 15}}
+    }
+    agent._perform_heartbeat()
+    assert agent.runtime_config.version == 4
+    assert agent.runtime_config.get("log_interval") == 15
+
+    replies = []
+    update = {"version": 5, "settings": {"disk_threshold": 95}}
+    agent.handle_command(f"config {json.dumps(update)}", reply=replies.append)
+    assert json.loads(replies[-1]) == {
+        "config_applied": True,
+        "reason": "applied",
+        "version": 5,
+    }
+    agent.handle_command("config {not json", reply=replies.append)
+    assert json.loads(replies[-1])["config_applied"] is False
+
+    backend.heartbeat_reply = {}
+    agent._perform_heartbeat()
+    assert backend.devices["config-test"]["state"]["config_version"] == 5
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from agent.client import transport as transports
+from agent.client.backend_client import BackendClient
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.mock_backend import MockBackend
+from agent.services.scheduler import (
+    CATCH_UP,
+    COALESCE,
+    HIGH,
+    LOW,
+    SKIP,
+    PriorityExecutor,
+    Scheduler,
+)
+from agent.tests.test_agent_host import wait_for
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(busy=()):
+    clock = Clock()
+    started = []
+
+    def dispatch(task):
+        if task.name in busy:
+            return False
+        started.append(task.name)
+        return True
+
+    return Scheduler(dispatch, clock=clock), clock, started
+
+
+def test_missed_run_policies():
+    scheduler, clock, started = make_scheduler()
+    skip = scheduler.every("skip", 10, print, missed=SKIP, deadline=2)
+    coalesce = scheduler.every("coalesce", 10, print, missed=COALESCE)
+    catch_up = scheduler.every("catch_up", 10, print, missed=CATCH_UP)
+
+    clock.now = 35  # three runs due, the last one 5s ago
+    scheduler.run_pending()
+    assert sorted(started) == ["catch_up", "coalesce"]
+    assert (skip.missed_runs, coalesce.missed_runs) == (3, 2)
+    scheduler.run_pending()
+    scheduler.run_pending()
+    assert started.count("catch_up") == 3 and catch_up.missed_runs == 0
+    # Still on the original grid
+    assert skip.next_run == coalesce.next_run == catch_up.next_run == 40
+
+    clock.now = 41
+    scheduler.run_pending()
+    assert started.count("skip") == 1
+
+
+def test_priorities_and_busy_tasks():
+    scheduler, clock, started = make_scheduler(busy={"busy", "owed"})
+    scheduler.every("low", 5, print, priority=LOW)
+    scheduler.every("busy", 5, print)
+    scheduler.every("owed", 5, print, missed=CATCH_UP)
+    scheduler.every("heartbeat", 5, print, priority=HIGH)
+    clock.now = 5
+    scheduler.run_pending()
+    assert started == ["heartbeat", "low"]
+    assert scheduler.tasks["busy"].missed_runs == 1
+    assert scheduler.tasks["owed"].owed == 1  # runs once the previous one ends
+    assert scheduler.get_status()["heartbeat"]["runs"] == 1
+
+
+def test_reserved_worker_keeps_high_priority_work_flowing():
+    executor = PriorityExecutor(2, reserved=1)
+    release = threading.Event()
+    slow = [executor.submit(release.wait, 5, priority=LOW) for _ in range(3)]
+    try:
+        assert wait_for(lambda: any(future.running() for future in slow))
+        heartbeat = executor.submit(time.monotonic, priority=HIGH)
+        assert heartbeat.result(timeout=1)
+        # The reserved worker did not take the slow work
+        assert sum(future.running() for future in slow) == 1
+    finally:
+        release.set()
+        executor.shutdown()
+    assert all(future.result() for future in slow)
+
+
+def test_heartbeats_flow_while_a_slow_job_blocks():
+    with MockBackend() as backend:
+        config = AgentConfig(
+            DEVICE_NAME="scheduler-test", BACKEND_URL=backend.url, MQTT_ENABLED=False
+        )
+        client = BackendClient(
+            transport=transports.RequestsTransport(2, 5), config=config
+        )
+        agent = IoTAgent(config=config, backend_client=client, manage_containers=False)
+        release = threading.Event()
+        agent._check_and_update_version = lambda: release.wait(5)
+        try:
+            started = time.monotonic()
+            agent.handle_command("update")
+            assert time.monotonic() - started < 0.5
+
+            agent.running = True
+            agent._setup_schedules()
+            agent._jobs["heartbeat"][0].next_run = 0  # due now
+            agent.run_pending()
+            assert wait_for(
+                lambda: any(r["path"] == "/device/heartbeat" for r in backend.requests)
+            )
+        finally:
+            release.set()
+
+
+def test_standalone_jobs_run_on_a_fixed_pool():
+    config = AgentConfig(
+        DEVICE_NAME="scheduler-test", MQTT_ENABLED=False, SCHEDULER_WORKERS=2
+    )
+    agent = IoTAgent(config=config, manage_containers=False)
+    threads = []
+
+    def job():
+        threads.append(threading.current_thread())
+
+    try:
+        for _ in range(3):
+            # Starts once the previous run has ended
+            assert wait_for(lambda: agent._run_job(job))
+        assert wait_for(lambda: len(threads) == 3)
+        assert all(thread.name.startswith("agent_") for thread in threads)
+        assert len(set(threads)) <= 2
+    finally:
+        agent.executor.shutdown()
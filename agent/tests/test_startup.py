@@ -0,0 +1,114 @@
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from agent.services.local_broker import LocalBroker
+from agent.services.system_monitor import SystemMonitor
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class SlowDockerManager:
+    def __init__(self, config=None):
+        time.sleep(0.5)  # stands in for the Docker API ping
+        self.client = None
+
+    def get_actual_state(self, max_age=None):
+        return {"error": "not used"}
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(DEVICE_NAME="startup-test")
+
+
+def test_heavy_modules_are_imported_lazily():
+    code = (
+        "import sys, agent.main; "
+        "print(sorted(m for m in ('docker', 'paho', 'psutil') if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_services_initialize_in_background(make_agent, client, monkeypatch):
+    monkeypatch.setattr(
+        "agent.services.docker_manager.DockerManager", SlowDockerManager
+    )
+    start = time.perf_counter()
+    agent = make_agent(client, manage_containers=True)
+    assert time.perf_counter() - start < 0.4
+    assert agent.readiness["docker"] == "pending"
+    assert agent.get_readiness() == "starting"
+
+    assert wait_for(lambda: agent.get_readiness() == "ready")
+    assert agent.reconciler is not None
+    assert agent.startup_times["ready"] >= 0.5
+
+
+def test_failed_service_reports_degraded(make_agent, client, monkeypatch):
+    def broken(config=None):
+        raise RuntimeError("docker socket missing")
+
+    monkeypatch.setattr("agent.services.docker_manager.DockerManager", broken)
+    agent = make_agent(client, manage_containers=True)
+    assert wait_for(lambda: agent.get_readiness() == "degraded")
+    assert agent.readiness["docker"] == "failed"
+    assert agent.docker_manager is None
+
+
+def test_unreachable_broker_reports_degraded_until_it_connects(make_agent, make_client):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    client = make_client(
+        MQTT_ENABLED=True,
+        MQTT_BROKER="127.0.0.1",
+        MQTT_PORT=port,
+        MQTT_CONNECT_TIMEOUT=0.3,
+    )
+    agent = make_agent(client, system_monitor=object())
+    assert wait_for(lambda: agent.get_readiness() == "degraded")
+    assert agent.readiness["mqtt"] == "failed"
+    assert "ready" in agent.startup_times
+
+    broker = LocalBroker(port=port).start()
+    try:
+        assert wait_for(lambda: agent.get_readiness() == "ready")
+    finally:
+        agent.mqtt_client.stop()
+        broker.stop()
+
+
+def test_heartbeat_reports_readiness_and_startup_time(backend, make_agent, client):
+    agent = make_agent(client, system_monitor=object())
+    agent._perform_heartbeat()
+    state = backend.devices["startup-test"]["state"]
+    assert state["readiness"] == "ready"
+    assert state["services"] == {
+        "system_monitor": "ready",
+        "docker": "disabled",
+        "mqtt": "disabled",
+    }
+    assert state["startup_time"] is not None
+    assert "first_heartbeat" in agent.startup_times
+
+
+def test_cpu_sample_does_not_block():
+    monitor = SystemMonitor()
+    start = time.perf_counter()
+    info = monitor.get_system_info()
+    assert time.perf_counter() - start < 0.5
+    assert 0 <= info["cpu"]["percent"] <= 100
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from agent.services.supervisor import Supervisor
+from agent.tests.test_agent_host import wait_for
+
+
+class Service:
+    """A thread that runs until told to crash"""
+
+    def __init__(self):
+        self.crash = threading.Event()
+        self.thread = threading.Thread(target=self.crash.wait, daemon=True)
+        self.thread.start()
+
+
+def test_stalled_job_is_abandoned_and_restarted():
+    supervisor = Supervisor()
+    restarts = []
+    supervisor.job("job", deadline=0.1, restart=lambda: restarts.append(1))
+    first = supervisor.begin("job")
+    assert supervisor.begin("job") is None  # still running
+    assert supervisor.check() == []
+
+    time.sleep(0.15)
+    assert supervisor.check() == ["job"]
+    assert restarts == [1]
+    assert supervisor.get_status()["job"]["abandoned"] == 1
+    # Not run again while the abandoned run still holds its worker
+    assert supervisor.begin("job") is None
+    assert supervisor.check() == []
+    supervisor.end("job", first)  # the abandoned run finishing late
+    second = supervisor.begin("job")
+    assert second is not None
+    supervisor.end("job", second)
+    status = supervisor.get_status()["job"]
+    assert status["restarts"] == 1
+    assert (status["abandoned"], status["abandoned_total"]) == (0, 1)
+
+
+def test_dead_service_is_restarted_within_a_second():
+    supervisor = Supervisor(interval=0.05)
+    services = [Service()]
+    supervisor.watch(
+        "service",
+        alive=lambda: services[-1].thread.is_alive(),
+        restart=lambda: services.append(Service()),
+    )
+    supervisor.start()
+    try:
+        crashed_at = time.monotonic()
+        services[0].crash.set()
+        assert wait_for(lambda: len(services) == 2, timeout=1)
+        assert time.monotonic() - crashed_at < 1
+        assert services[-1].thread.is_alive()
+        assert supervisor.get_status()["service"]["restarts"] == 1
+    finally:
+        supervisor.stop()
+        for service in services:
+            service.crash.set()
+
+
+@pytest.fixture
+def watched_agent(make_agent, make_client):
+    client = make_client(
+        DEVICE_NAME="watchdog-test", WATCHDOG_ENABLED=True, WATCHDOG_JOB_DEADLINE=0.2
+    )
+    return make_agent(client)
+
+
+def test_job_deadline_covers_a_fully_retried_request(make_agent, make_client):
+    client = make_client(
+        timeouts=(5, 30), MAX_RETRIES=3, RETRY_MAX_DELAY=60, WATCHDOG_JOB_DEADLINE=0
+    )
+    agent = make_agent(client)
+    # 4 attempts of 5s connect + 30s read, 3 backoffs of up to 60s, twice
+    assert client.max_request_time() == 320
+    assert agent._job_deadline() == 640
+
+
+def test_stuck_job_does_not_block_the_agent(backend, watched_agent):
+    release = threading.Event()
+
+    def stuck_heartbeat(body, headers):
+        release.wait(5)
+        return 200, {"status": "ok"}, {}
+
+    backend.route("POST", "/device/heartbeat", stuck_heartbeat)
+    agent = watched_agent
+    transport = agent.backend_client.transport
+    try:
+        started = time.monotonic()
+        agent._run_job(agent._perform_heartbeat)
+        assert time.monotonic() - started < 0.5  # off the main loop
+        agent._run_job(agent._perform_heartbeat)
+        assert len(backend.requests) <= 1  # skipped while in flight
+
+        time.sleep(0.3)
+        assert agent.supervisor.check() == ["_perform_heartbeat"]
+        assert agent.backend_client.transport is transport  # not owned, kept
+        # The stuck run keeps its worker, so no second one is started
+        assert not agent._run_job(agent._perform_heartbeat)
+    finally:
+        release.set()
+    assert wait_for(lambda: agent._run_job(agent._perform_heartbeat))
+
+
+def test_restart_command_restarts_in_place(backend, watched_agent):
+    agent = watched_agent
+    agent.running = True
+    agent._setup_schedules()
+    client = agent.backend_client
+    transport = client.transport
+    agent.rule_engine.load([{"name": "hot", "sensor": "temperature", "value": 30}])
+
+    heartbeat = agent._jobs["heartbeat"][0]
+    agent.handle_command("restart")
+    assert agent._jobs["heartbeat"][0] is heartbeat  # left to the scheduling loop
+    agent.run_pending()
+    assert agent._jobs["heartbeat"][0] is not heartbeat
+    assert agent.running
+    assert agent.backend_client is client and client.transport is transport
+    assert {"heartbeat", "monitoring", "sensor"} <= set(agent._jobs)
+    assert len(agent.rule_engine.rules) == 1
+    assert wait_for(
+        lambda: any(r["path"] == "/device/heartbeat" for r in backend.requests)
+    )
@@ -0,0 +1,80 @@
+import time
+from collections import namedtuple
+
+import pytest
+
+from agent.client import transport as transports
+from agent.mock_backend import MockBackend
+from agent.services import system_monitor
+from agent.services.docker_manager import DockerManager
+from agent.services.system_monitor import SystemMonitor
+from agent.tests.fake_docker import FakeDockerDaemon
+from agent.utils.traffic import traffic
+
+Nic = namedtuple("Nic", system_monitor.NET_FIELDS)
+
+
+@pytest.fixture(autouse=True)
+def reset_traffic():
+    traffic.reset()
+    yield
+    traffic.reset()
+
+
+def test_interface_rates_from_successive_samples(monkeypatch):
+    monitor = SystemMonitor()
+    before = {
+        "eth0": Nic(1000, 5000, 10, 20, 0, 0, 0, 0),
+        "lo": Nic(0, 0, 0, 0, 0, 0, 0, 0),
+    }
+    after = {
+        "eth0": Nic(3000, 9000, 14, 30, 2, 0, 4, 0),
+        "lo": Nic(500, 500, 5, 5, 0, 0, 0, 0),
+        "wwan0": Nic(100, 100, 1, 1, 0, 0, 0, 0),  # appeared since last sample
+    }
+    monkeypatch.setattr(
+        system_monitor.psutil, "net_io_counters", lambda pernic=False: after
+    )
+    monkeypatch.setattr(
+        system_monitor.psutil, "disk_io_counters", lambda perdisk=False: None
+    )
+    monitor._last_io = (time.monotonic() - 2, before, {}, None)
+
+    interfaces, disks, disk_total = monitor._io_rates()
+    eth0 = interfaces["eth0"]
+    assert eth0["bytes_sent_per_sec"] == pytest.approx(1000, rel=0.05)
+    assert eth0["bytes_recv_per_sec"] == pytest.approx(2000, rel=0.05)
+    assert eth0["dropin_per_sec"] == pytest.approx(2, rel=0.05)
+    assert interfaces["wwan0"]["bytes_sent_per_sec"] == 0.0
+    assert (disks, disk_total) == ({}, {})
+
+    # A counter that went backwards (wrap or reset) is not a negative rate
+    monitor._last_io = (time.monotonic() - 1, after, {}, None)
+    monkeypatch.setattr(
+        system_monitor.psutil, "net_io_counters", lambda pernic=False: before
+    )
+    assert monitor._io_rates()[0]["eth0"]["bytes_sent_per_sec"] == 0.0
+
+
+def test_system_info_includes_rates_and_agent_traffic():
+    info = SystemMonitor().get_system_info()
+    assert "bytes_recv_per_sec" in info["network"]["rates"]
+    assert "interfaces" in info["network"]
+    assert "disks" in info["disk_io"]
+    assert info["network"]["agent"] == {}
+
+
+def test_agent_traffic_is_counted_by_subsystem():
+    with MockBackend() as backend:
+        transport = transports.RequestsTransport(2, 5)
+        transport.request("POST", f"{backend.url}/api/logs", {"message": "x" * 500})
+    backend_traffic = traffic.snapshot()["backend"]
+    assert backend_traffic["requests"] == 1
+    assert backend_traffic["sent"] > 500
+    assert backend_traffic["received"] > 0
+
+    with FakeDockerDaemon() as daemon:
+        daemon.add_registry_image("agent:v2", size=3 * 1024 * 1024)
+        manager = DockerManager(client=daemon.client(), settle_time=0)
+        assert manager.pull_latest_image("agent:v2")
+    assert traffic.snapshot()["registry"]["received"] == 3 * 1024 * 1024
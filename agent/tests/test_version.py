@@ -0,0 +1,123 @@
+import random
+
+from agent.config import AgentConfig
+from agent.main import IoTAgent
+from agent.mock_backend import MockBackend
+from agent.services.docker_manager import DockerManager
+from agent.tests.fake_docker import FakeDockerDaemon
+from agent.utils.version import Version, image_version, latest_tag, parse_version
+
+
+def test_semver_ordering():
+    ordered = [
+        "v1.0.0-alpha",
+        "v1.0.0-alpha.1",
+        "v1.0.0-alpha.beta",
+        "v1.0.0-beta.2",
+        "v1.0.0-beta.11",
+        "v1.0.0-rc.1",
+        "v1.0",
+        "v1.0.1",
+        "v1.2.0",
+        "v1.10.0",
+        "2.0.0",
+    ]
+    versions = [parse_version(tag) for tag in ordered]
+    shuffled = versions[:]
+    random.Random(1).shuffle(shuffled)
+    assert sorted(shuffled) == versions
+    assert parse_version("v1.0") == parse_version("1.0.0+build.7")
+    assert str(parse_version("v1.2.3-rc.1+abc")) == "v1.2.3-rc.1+abc"
+    assert parse_version("latest") is None and parse_version("v1") is None
+    assert parse_version("v1.2.3") is parse_version("v1.2.3")  # memoized
+    assert image_version("registry:5000/team/agent:v2.1.0") == Version(2, 1, 0)
+    # Versions built directly order like parsed ones
+    assert Version(1, 2, 3, "rc.1") < Version(1, 2, 3) < Version(1, 2, 4, "alpha")
+    assert Version(1, 2, 3, "rc.1") == parse_version("v1.2.3-rc.1")
+    assert image_version("registry:5000/team/agent") is None
+
+
+def test_latest_tag_over_a_large_list():
+    tags = [f"v1.{minor}.{patch}" for minor in range(30) for patch in range(30)]
+    tags += ["latest", "main", "v1.29.30-rc.1", "v1.9.99", "sha-abc123"]
+    random.Random(2).shuffle(tags)
+    assert latest_tag(tags) == "v1.29.29"
+    assert latest_tag(tags, include_prerelease=True) == "v1.29.30-rc.1"
+    assert latest_tag(["latest"]) is None
+    # Arch suffixes are semver pre-releases, not releases
+    assert parse_version("v1.2-arm64").is_prerelease
+    assert latest_tag(["v1.1", "v1.2-arm64", "v1.2-amd64"]) == "v1.1"
+
+
+def test_heartbeat_reports_the_running_image():
+    with MockBackend() as backend, FakeDockerDaemon() as daemon:
+        config = AgentConfig(
+            DEVICE_NAME="versioned",
+            BACKEND_URL=backend.url,
+            MQTT_ENABLED=False,
+            CONTAINER_NAME="app",
+        )
+        agent = IoTAgent(
+            config=config, system_monitor=object(), manage_containers=False
+        )
+        agent._perform_heartbeat()
+        assert backend.devices["versioned"]["state"]["version"] == config.DOCKER_IMAGE
+
+        daemon.add_container("app", "taipham2710/agent:v1.4.2")
+        agent.docker_manager = DockerManager(client=daemon.client(), config=config)
+        agent._perform_heartbeat()
+        state = backend.devices["versioned"]["state"]
+        assert state["version"] == "taipham2710/agent:v1.4.2"
+
+
+class UpdatingDockerManager:
+    def __init__(self, pull_ok=True):
+        self.pull_ok = pull_ok
+        self.calls = []
+
+    def get_current_image_tag(self):
+        return "taipham2710/agent:v1.0.0"
+
+    def pull_latest_image(self, image_tag=None):
+        self.calls.append(("pull", image_tag))
+        return self.pull_ok
+
+    def update_container(self, image_tag=None, environment=None, pull=True):
+        self.calls.append(("update", image_tag, pull))
+        return True
+
+    def rollback_to_previous(self):
+        self.calls.append(("rollback", None))
+        return True
+
+
+class TagsResponse:
+    headers = {}
+    content = b""
+
+    def json(self):
+        return {"results": [{"name": "v1.0.0"}, {"name": "v1.1.0"}]}
+
+
+def test_version_update_deploys_the_pulled_image(monkeypatch):
+    monkeypatch.setattr("requests.get", lambda url, timeout: TagsResponse())
+    with MockBackend() as backend:
+        config = AgentConfig(
+            BACKEND_URL=backend.url,
+            MQTT_ENABLED=False,
+            DOCKER_IMAGE="taipham2710/agent:latest",
+            BUDGET_ENABLED=False,
+        )
+        agent = IoTAgent(
+            config=config, system_monitor=object(), manage_containers=False
+        )
+        agent.docker_manager = UpdatingDockerManager(pull_ok=False)
+        agent._check_and_update_version()
+        assert agent.docker_manager.calls == [("pull", "taipham2710/agent:v1.1.0")]
+
+        agent.docker_manager = UpdatingDockerManager()
+        agent._check_and_update_version()
+        assert agent.docker_manager.calls == [
+            ("pull", "taipham2710/agent:v1.1.0"),
+            ("update", "taipham2710/agent:v1.1.0", False),  # not pulled twice
+        ]
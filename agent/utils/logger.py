@@ -8,6 +8,8 @@ def setup_logger():
     """Setup logger configuration"""
     logger = logging.getLogger("iot_agent")
     logger.setLevel(getattr(logging, Config.LOG_LEVEL))
+    if logger.handlers:
+        return logger  # already set up, e.g. by another agent in this process
 
     # Create formatter
     formatter = logging.Formatter(
@@ -27,12 +29,13 @@ def setup_logger():
     return logger
 
 
-def log_system_info(logger):
+def log_system_info(logger, config=None):
     """Log system information"""
     import psutil
 
-    logger.info(f"Device Name: {Config.DEVICE_NAME}")
-    logger.info(f"Device ID: {Config.DEVICE_ID}")
+    config = config or Config
+    logger.info(f"Device Name: {config.DEVICE_NAME}")
+    logger.info(f"Device ID: {config.DEVICE_ID}")
     logger.info(f"CPU Usage: {psutil.cpu_percent()}%")
     logger.info(f"Memory Usage: {psutil.virtual_memory().percent}%")
     logger.info(f"Disk Usage: {psutil.disk_usage('/').percent}%")
@@ -0,0 +1,56 @@
+import threading
+from typing import Dict, Mapping, Optional
+
+# Approximate HTTP framing: request/status line and the blank line after headers
+HTTP_LINE_OVERHEAD = 16
+MQTT_PUBLISH_OVERHEAD = 4  # fixed header plus topic length
+
+
+class TrafficMeter:
+    """Bytes the agent itself sends and receives, by subsystem.
+
+    Counts application-level bytes (HTTP headers and bodies, MQTT publish
+    packets, registry layer downloads); TCP/TLS overhead is not included.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, subsystem: str, sent: int = 0, received: int = 0):
+        with self._lock:
+            counter = self._counters.setdefault(
+                subsystem, {"sent": 0, "received": 0, "requests": 0}
+            )
+            counter["sent"] += sent
+            counter["received"] += received
+            counter["requests"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(counter) for name, counter in self._counters.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+# Process-wide meter shared by the transports and clients
+traffic = TrafficMeter()
+
+
+def http_size(
+    url: str, headers: Optional[Mapping[str, str]], body: Optional[bytes]
+) -> int:
+    """Approximate bytes of an HTTP message: start line, headers and body"""
+    size = HTTP_LINE_OVERHEAD + len(url) + len(body or b"")
+    for key, value in (headers or {}).items():
+        size += len(key) + len(str(value)) + 4
+    return size
+
+
+def mqtt_size(topic: str, payload) -> int:
+    """Approximate bytes of an MQTT QoS 0 publish packet"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return MQTT_PUBLISH_OVERHEAD + len(topic.encode("utf-8")) + len(payload or b"")
@@ -0,0 +1,95 @@
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+# vMAJOR.MINOR[.PATCH][-PRERELEASE][+BUILD]; older tags have no patch
+VERSION_PATTERN = re.compile(
+    r"v?(\d+)\.(\d+)(?:\.(\d+))?"
+    r"(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+([0-9A-Za-z.-]+))?"
+)
+
+
+def _prerelease_key(prerelease: str) -> Tuple:
+    """Semver precedence: a release sorts after its pre-releases, numeric
+    identifiers compare numerically and before alphanumeric ones"""
+    if not prerelease:
+        return (1,)
+    return (
+        0,
+        tuple(
+            (0, int(part), "") if part.isdigit() else (1, 0, part)
+            for part in prerelease.split(".")
+        ),
+    )
+
+
+@dataclass(frozen=True, order=True)
+class Version:
+    """A semantic version parsed from an image tag such as ``v1.4.2-rc.1``"""
+
+    major: int
+    minor: int
+    patch: int = 0
+    prerelease: str = field(default="", compare=False)
+    build: str = field(default="", compare=False)
+    # Derived from ``prerelease``; compared after the version numbers
+    _precedence: Tuple = field(init=False, repr=False, compare=True)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_precedence", _prerelease_key(self.prerelease))
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["Version"]:
+        return parse_version(text)
+
+    @property
+    def is_prerelease(self) -> bool:
+        return bool(self.prerelease)
+
+    def __str__(self) -> str:
+        text = f"v{self.major}.{self.minor}.{self.patch}"
+        if self.prerelease:
+            text += f"-{self.prerelease}"
+        if self.build:
+            text += f"+{self.build}"
+        return text
+
+
+@lru_cache(maxsize=4096)
+def parse_version(text: str) -> Optional[Version]:
+    """The version in ``text``, or None if it is not a version tag"""
+    match = VERSION_PATTERN.fullmatch(str(text).strip())
+    if not match:
+        return None
+    major, minor, patch, prerelease, build = match.groups()
+    return Version(
+        int(major),
+        int(minor),
+        int(patch or 0),
+        prerelease or "",
+        build or "",
+    )
+
+
+def image_version(image: Optional[str]) -> Optional[Version]:
+    """The version of an image reference's tag (``repo/name:v1.2.0``)"""
+    if not image:
+        return None
+    # Like docker's parse_repository_tag, without importing docker
+    _, separator, tag = image.partition("@")[0].rpartition(":")
+    return parse_version(tag) if separator and "/" not in tag else None
+
+
+def latest_tag(tags: Iterable[str], include_prerelease: bool = False) -> Optional[str]:
+    """The tag with the highest version, in one pass over ``tags``. A suffix
+    such as ``-arm64`` makes a tag a pre-release, so it is skipped too."""
+    best, best_tag = None, None
+    for tag in tags:
+        version = parse_version(tag)
+        if version is None or (version.is_prerelease and not include_prerelease):
+            continue
+        if best is None or version > best:
+            best, best_tag = version, tag
+    return best_tag
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Fleet Load Generator for IoT Device Management System
+Simulates thousands of virtual agents from one asyncio event loop, built on
+DemoController, to find the backend's breaking point before the fleet does.
+
+Each virtual agent sends heartbeats and logs to the backend and publishes
+sensor telemetry over MQTT at configurable intervals. Agents are started
+following a ramp profile, and the run ends with latency percentiles,
+throughput and error rate per operation.
+
+Examples:
+    # 10k agents against a real backend and broker, ramped over 2 minutes
+    python demo/load_generator.py --agents 10000 --ramp linear --ramp-time 120 \\
+        --duration 600 --mqtt-broker localhost
+
+    # Offline: local stub backend and local broker, no network needed
+    python demo/load_generator.py --local --agents 2000 --duration 30
+
+httpx (pip install httpx) is used for async HTTP when installed; otherwise
+requests run on a thread pool, which caps throughput well below 10k agents.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from array import array
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demo_script import DemoController  # noqa: E402
+
+from agent.services.local_broker import (  # noqa: E402
+    CONNACK,
+    CONNECT,
+    PUBACK,
+    PUBLISH,
+    encode_packet,
+    encode_string,
+    read_packet,
+)
+from agent.services.sensor_simulator import SensorSimulator  # noqa: E402
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RAMP_PROFILES = ("spike", "linear", "step")
+
+
+class LatencyStats:
+    """Latency samples and outcome counters per operation"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.window_ops = 0
+
+    def record(self, operation: str, seconds: float, ok: bool):
+        self.latencies.setdefault(operation, array("d")).append(seconds)
+        if not ok:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+        self.window_ops += 1
+
+    def take_window(self) -> int:
+        ops, self.window_ops = self.window_ops, 0
+        return ops
+
+    def summary(self, elapsed: float) -> dict:
+        report = {}
+        for operation, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            count = len(ordered)
+            errors = self.errors.get(operation, 0)
+
+            def percentile(p):
+                return ordered[min(count - 1, int(p / 100 * count))] * 1000
+
+            report[operation] = {
+                "count": count,
+                "errors": errors,
+                "error_rate": errors / count if count else 0.0,
+                "throughput": count / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(50),
+                "p90_ms": percentile(90),
+                "p99_ms": percentile(99),
+                "max_ms": ordered[-1] * 1000,
+            }
+        return report
+
+
+class AsyncMqttPublisher:
+    """Minimal asyncio MQTT client publishing at QoS 1 to time broker acks"""
+
+    def __init__(self, host: str, port: int, client_id: str, stats: LatencyStats):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.stats = stats
+        self._writer = None
+        self._pending = {}
+        self._next_id = 0
+        self._reader_task = None
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        # Protocol "MQTT" level 4, clean session, keepalive disabled
+        body = encode_string("MQTT") + b"\x04\x02\x00\x00"
+        body += encode_string(self.client_id)
+        self._writer.write(encode_packet(CONNECT, body))
+        packet_type, _, _ = await read_packet(reader)
+        if packet_type != CONNACK:
+            raise ConnectionError(f"Unexpected MQTT packet {packet_type}")
+        self._reader_task = asyncio.ensure_future(self._read_acks(reader))
+
+    async def _read_acks(self, reader):
+        try:
+            while True:
+                packet_type, _, body = await read_packet(reader)
+                if packet_type == PUBACK:
+                    future = self._pending.pop(body[:2], None)
+                    if future and not future.done():
+                        future.set_result(True)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result(False)
+
+    async def publish(self, topic: str, payload: bytes, timeout: float = 10):
+        self._next_id = self._next_id % 65535 + 1
+        packet_id = self._next_id.to_bytes(2, "big")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[packet_id] = future
+        start = time.perf_counter()
+        ok = False
+        try:
+            self._writer.write(
+                encode_packet(PUBLISH, encode_string(topic) + packet_id + payload, 0x02)
+            )
+            ok = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, ConnectionError, AttributeError):
+            self._pending.pop(packet_id, None)
+        self.stats.record("mqtt_telemetry", time.perf_counter() - start, ok)
+
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self._writer:
+            self._writer.close()
+
+
+class LoadController(DemoController):
+    """DemoController that drives many virtual agents concurrently from asyncio"""
+
+    def __init__(self, base_url=None, max_connections: int = 200):
+        super().__init__(base_url)
+        self.stats = LatencyStats()
+        self.client = None
+        if httpx is not None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30, connect=5),
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                ),
+            )
+
+    async def _request(self, operation: str, method: str, path: str, data=None):
+        url = f"{self.base_url}{path}"
+        start = time.perf_counter()
+        try:
+            if self.client is not None:
+                response = await self.client.request(method, url, json=data)
+            else:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    None,
+                    partial(self.session.request, method, url, json=data, timeout=30),
+                )
+            ok = response.status_code < 400 or (
+                operation == "create_device" and response.status_code == 400
+            )
+        except Exception:
+            ok = False
+        self.stats.record(operation, time.perf_counter() - start, ok)
+        return ok
+
+    async def create_device_async(self, device_id: int, name: str, version: str):
+        data = {"id": device_id, "name": name, "version": version}
+        return await self._request("create_device", "POST", "/api/device", data)
+
+    async def send_heartbeat_async(self, name: str, version: str):
+        data = {"name": name, "version": version, "status": "online"}
+        return await self._request("heartbeat", "POST", "/api/device/heartbeat", data)
+
+    async def send_log_async(self, device_id: int, message: str, log_type="system"):
+        data = {
+            "device_id": device_id,
+            "message": message,
+            "log_level": "info",
+            "type": log_type,
+        }
+        return await self._request("log", "POST", "/api/logs", data)
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+def ramp_offsets(agents: int, profile: str, ramp_time: float, steps: int) -> list:
+    """Start delay (seconds) for each virtual agent under a ramp profile"""
+    if profile == "spike" or ramp_time <= 0:
+        return [0.0] * agents
+    if profile == "linear":
+        return [ramp_time * i / agents for i in range(agents)]
+    per_step = max(1, -(-agents // steps))
+    step_time = ramp_time / max(1, steps - 1) if steps > 1 else 0
+    return [(i // per_step) * step_time for i in range(agents)]
+
+
+async def _every(interval: float, stop_at: float, action):
+    """Run ``action`` every ``interval`` seconds (first run jittered) until stop_at"""
+    if interval <= 0:
+        return
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        await action()
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def run_virtual_agent(
+    controller, publisher, device_id, args, start_delay, stop_at
+):
+    """One simulated device: heartbeats, logs and MQTT telemetry"""
+    await asyncio.sleep(start_delay)
+    if time.monotonic() >= stop_at:
+        return
+    name = f"load-agent-{device_id:05d}"
+    sensors = SensorSimulator()
+    topic = f"agent/{device_id}/status"
+
+    if args.create_devices:
+        await controller.create_device_async(device_id, name, args.version)
+
+    async def heartbeat():
+        await controller.send_heartbeat_async(name, args.version)
+
+    async def log():
+        await controller.send_log_async(
+            device_id,
+            f"System health: healthy, CPU: {random.randint(5, 95)}%, "
+            f"Memory: {random.randint(10, 90)}%, Disk: {random.randint(20, 80)}%",
+        )
+
+    async def telemetry():
+        payload = f"SENSOR:{sensors.get_data()}".encode("utf-8")
+        await publisher.publish(topic, payload)
+
+    tasks = [_every(args.heartbeat_interval, stop_at, heartbeat)]
+    tasks.append(_every(args.log_interval, stop_at, log))
+    if publisher is not None:
+        tasks.append(_every(args.telemetry_interval, stop_at, telemetry))
+    await asyncio.gather(*tasks)
+
+
+async def _report_progress(stats, started, every, stop_at, active):
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(every)
+        ops = stats.take_window()
+        print(
+            f"[{time.monotonic() - started:7.1f}s] active agents: {active():6d}  "
+            f"ops/s: {ops / every:8.1f}"
+        )
+
+
+async def run_load(args) -> dict:
+    controller = LoadController(args.backend_url, max_connections=args.http_connections)
+    publishers = []
+    if args.mqtt_broker and args.telemetry_interval > 0:
+        for index in range(min(args.mqtt_connections, args.agents)):
+            publisher = AsyncMqttPublisher(
+                args.mqtt_broker, args.mqtt_port, f"load-gen-{index}", controller.stats
+            )
+            await publisher.connect()
+            publishers.append(publisher)
+
+    offsets = ramp_offsets(args.agents, args.ramp, args.ramp_time, args.ramp_steps)
+    started = time.monotonic()
+    stop_at = started + args.duration
+
+    def active():
+        elapsed = time.monotonic() - started
+        return sum(1 for offset in offsets if offset <= elapsed)
+
+    agents = [
+        run_virtual_agent(
+            controller,
+            publishers[i % len(publishers)] if publishers else None,
+            args.first_device_id + i,
+            args,
+            offsets[i],
+            stop_at,
+        )
+        for i in range(args.agents)
+    ]
+    progress = asyncio.ensure_future(
+        _report_progress(controller.stats, started, args.report_every, stop_at, active)
+    )
+    await asyncio.gather(*agents)
+    progress.cancel()
+    elapsed = time.monotonic() - started
+
+    for publisher in publishers:
+        await publisher.close()
+    await controller.aclose()
+    return controller.stats.summary(elapsed)
+
+
+def print_report(report: dict):
+    print("\n" + "=" * 96)
+    print(
+        f"{'operation':<16}{'count':>9}{'req/s':>10}{'err%':>8}"
+        f"{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'max ms':>11}"
+    )
+    print("-" * 96)
+    for operation, row in report.items():
+        print(
+            f"{operation:<16}{row['count']:>9}{row['throughput']:>10.1f}"
+            f"{row['error_rate'] * 100:>8.2f}{row['p50_ms']:>11.1f}"
+            f"{row['p90_ms']:>11.1f}{row['p99_ms']:>11.1f}{row['max_ms']:>11.1f}"
+        )
+    print("=" * 96)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--first-device-id", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--ramp", choices=RAMP_PROFILES, default="linear")
+    parser.add_argument("--ramp-time", type=float, default=30, help="seconds")
+    parser.add_argument("--ramp-steps", type=int, default=5)
+    parser.add_argument("--heartbeat-interval", type=float, default=30)
+    parser.add_argument("--log-interval", type=float, default=60)
+    parser.add_argument("--telemetry-interval", type=float, default=10)
+    parser.add_argument("--version", default="2.0.0")
+    parser.add_argument("--create-devices", action="store_true")
+    parser.add_argument(
+        "--backend-url", default=os.getenv("BACKEND_URL", "http://localhost:8000")
+    )
+    parser.add_argument("--http-connections", type=int, default=200)
+    parser.add_argument("--mqtt-broker", default=os.getenv("MQTT_BROKER", ""))
+    parser.add_argument("--mqtt-port", type=int, default=1883)
+    parser.add_argument(
+        "--mqtt-connections",
+        type=int,
+        default=100,
+        help="MQTT connections shared by the virtual agents",
+    )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="run against an in-process stub backend and local MQTT broker",
+    )
+    parser.add_argument("--report-every", type=float, default=5)
+    parser.add_argument("--json", metavar="PATH", help="write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend = broker = None
+    if args.local:
+        from agent.mock_backend import MockBackend
+        from agent.services.local_broker import LocalBroker
+
+        # Keep only recent requests so the stub's memory stays flat
+        backend = MockBackend(max_requests=1000).start()
+        broker = LocalBroker(port=0).start()
+        args.backend_url = backend.url
+        args.mqtt_broker, args.mqtt_port = "127.0.0.1", broker.port
+        print(f"🧪 Local mode: stub backend {backend.url}, broker port {broker.port}")
+
+    print(
+        f"🚀 {args.agents} virtual agents, {args.ramp} ramp over {args.ramp_time}s, "
+        f"running {args.duration}s against {args.backend_url}"
+    )
+    if httpx is None:
+        print("⚠️ httpx not installed, using threaded requests (limited throughput)")
+
+    try:
+        report = asyncio.run(run_load(args))
+    except KeyboardInterrupt:
+        print("\n⏹️ Load test interrupted by user")
+        return
+    finally:
+        if backend:
+            backend.stop()
+        if broker:
+            broker.stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "report": report}, f, indent=2)
+        print(f"📄 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()